@@ -0,0 +1,161 @@
+# admission.py
+import asyncio, heapq, itertools, math, threading, time
+from collections import OrderedDict
+from prometheus_client import Counter, Gauge
+import config
+
+ADMISSION_REJECTED = Counter("quizmaker_admission_rejected_total", "Requests refused with 429", ["endpoint", "reason"])
+QUEUED_COST = Gauge("quizmaker_model_queued_cost", "Cost units waiting for the model")
+
+
+def request_cost(questions: int = 0, answers: int = 0, uploads: int = 0) -> float:
+    """Model work of a request in cost units (roughly one generated question each)."""
+    return (questions * config.ADMISSION_COST_PER_QUESTION
+            + answers * config.ADMISSION_COST_PER_ANSWER
+            + uploads * config.ADMISSION_COST_PER_UPLOAD)
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBuckets:
+    """Per-client token buckets of ADMISSION_BUCKET_SIZE cost units refilled at
+    ADMISSION_REFILL_PER_SECOND. Idle clients beyond max_clients are forgotten,
+    which only ever gives them a full bucket."""
+
+    def __init__(self, size, rate, max_clients=10000):
+        self.size = size
+        self.rate = rate
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, client, cost) -> float:
+        """Takes cost from the client's bucket and returns 0, or returns the seconds until it could."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.size, now))
+            tokens = min(self.size, tokens + (now - updated) * self.rate)
+            # a request larger than the bucket needs a full bucket; its slices are queued fairly
+            needed = min(cost, self.size)
+            wait = 0.0
+            if tokens < needed:
+                wait = (needed - tokens) / self.rate if self.rate > 0 else float("inf")
+            else:
+                tokens -= cost
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+def model_slots():
+    # the in-process model runs one call at a time; a remote server takes as many
+    # concurrent requests as the pooled HTTP client sends
+    return max(1, config.LLM_MAX_CONCURRENCY) if config.LLM_BACKEND == "openai" else 1
+
+
+class FairScheduler:
+    """Runs up to slots model calls at a time; when all are busy, the waiting call
+    with the smallest virtual finish time goes next (weighted fair queuing).
+
+    A call of cost c from a client with weight w finishes c / w after the later
+    of the current virtual time and the client's previous finish, so a client
+    with many queued slices only gets its share while others are waiting.
+    """
+
+    def __init__(self, slots=1):
+        self.slots = slots
+        self._running = 0
+        self._waiting = []
+        self._virtual = 0.0
+        self._last_finish = {}
+        self._order = itertools.count()
+        self.queued_cost = 0.0
+        # seconds of model time per cost unit, for Retry-After
+        self.seconds_per_unit = config.ADMISSION_INITIAL_SECONDS_PER_UNIT
+
+    def idle(self) -> bool:
+        return not self._running and not self._waiting
+
+    def waiting_seconds(self) -> float:
+        return self.queued_cost * self.seconds_per_unit / self.slots
+
+    def _tag(self, client, cost, weight):
+        finish = max(self._virtual, self._last_finish.get(client, 0.0)) + cost / weight
+        self._last_finish[client] = finish
+        if len(self._last_finish) > 10000:
+            # clients whose last call is in the past start from the virtual time anyway
+            self._last_finish = {c: f for c, f in self._last_finish.items() if f > self._virtual}
+        return finish
+
+    async def acquire(self, client, cost, weight=1.0):
+        finish = self._tag(client, cost, weight)
+        if self._running < self.slots and not self._waiting:
+            self._running += 1
+            self._virtual = max(self._virtual, finish)
+            return
+        entry = [finish, next(self._order), asyncio.get_running_loop().create_future(), cost]
+        heapq.heappush(self._waiting, entry)
+        self._queued(cost)
+        try:
+            await entry[2]
+        except asyncio.CancelledError:
+            if entry[2].done() and not entry[2].cancelled():
+                # granted just as the caller went away
+                self.release()
+            elif entry[3]:
+                self._queued(-entry[3])
+                entry[3] = 0
+            raise
+
+    def release(self):
+        while self._waiting:
+            finish, _, future, cost = heapq.heappop(self._waiting)
+            if future.done():
+                continue
+            self._queued(-cost)
+            # the slot passes to the waiting call
+            self._virtual = max(self._virtual, finish)
+            future.set_result(None)
+            return
+        self._running -= 1
+
+    def observe(self, cost, seconds):
+        if cost > 0:
+            self.seconds_per_unit = 0.8 * self.seconds_per_unit + 0.2 * seconds / cost
+
+    def _queued(self, delta):
+        self.queued_cost = max(0.0, self.queued_cost + delta)
+        QUEUED_COST.set(self.queued_cost)
+
+
+class Admission:
+    """Refuses a request when the model queue holds more than ADMISSION_MAX_QUEUED_SECONDS
+    of work or the client's bucket cannot pay for it; Retry-After says when it could."""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.buckets = TokenBuckets(config.ADMISSION_BUCKET_SIZE, config.ADMISSION_REFILL_PER_SECOND)
+
+    def admit(self, endpoint, client, cost):
+        if not config.ADMISSION_ENABLED:
+            return
+        backlog = self.scheduler.waiting_seconds()
+        if backlog > config.ADMISSION_MAX_QUEUED_SECONDS:
+            ADMISSION_REJECTED.labels(endpoint, "capacity").inc()
+            raise Rejected("capacity", backlog - config.ADMISSION_MAX_QUEUED_SECONDS)
+        wait = self.buckets.take(client, cost)
+        if wait > 0:
+            ADMISSION_REJECTED.labels(endpoint, "rate").inc()
+            raise Rejected("rate", wait)
+
+
+def slices(count, size):
+    """Sizes of the fair-share slices an oversized request is generated in."""
+    size = max(1, size)
+    return [min(size, count - start) for start in range(0, count, size)]
@@ -0,0 +1,127 @@
+# batching.py
+import threading
+from prometheus_client import Counter, Gauge
+import config
+import deadlines
+from metrics import record_fallback
+
+BATCH_SIZE = Gauge("quizmaker_batch_size", "Current adaptive batch size", ["batcher"])
+BATCH_SHRINKS = Counter("quizmaker_batch_shrinks_total", "Batch size reductions", ["batcher", "reason"])
+
+
+def is_out_of_memory(error) -> bool:
+    if isinstance(error, MemoryError):
+        return True
+    try:
+        import torch
+        if isinstance(error, torch.cuda.OutOfMemoryError):
+            return True
+    except (ImportError, AttributeError):
+        pass
+    return isinstance(error, RuntimeError) and "out of memory" in str(error).lower()
+
+
+def memory_headroom(device="auto") -> float:
+    """Free fraction of GPU memory (when CUDA is in use) or else of system RAM."""
+    if device in ("auto", "cuda"):
+        try:
+            import torch
+            if torch.cuda.is_available():
+                free, total = torch.cuda.mem_get_info()
+                return free / total
+        except (ImportError, RuntimeError):
+            pass
+    import psutil
+    memory = psutil.virtual_memory()
+    return memory.available / memory.total
+
+
+def release_memory():
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+
+
+class AdaptiveBatcher:
+    """Runs items through fn(batch) -> results in batches sized to the memory headroom.
+
+    The batch is halved and retried on an out-of-memory error or when headroom
+    drops below BATCH_MIN_HEADROOM, and doubled again after BATCH_GROW_AFTER
+    successful batches with headroom above BATCH_GROW_HEADROOM. Other errors in a
+    batch are isolated by retrying its items one at a time.
+    """
+
+    def __init__(self, name: str, initial: int, maximum: int, device="auto"):
+        self.name = name
+        self.maximum = max(1, maximum)
+        self.size = max(1, min(initial, self.maximum))
+        self.device = device
+        self._successes = 0
+        self._lock = threading.Lock()
+        BATCH_SIZE.labels(name).set(self.size)
+
+    def _shrink(self, reason):
+        with self._lock:
+            self.size = max(1, self.size // 2)
+            self._successes = 0
+            BATCH_SIZE.labels(self.name).set(self.size)
+        BATCH_SHRINKS.labels(self.name, reason).inc()
+
+    def _succeeded(self):
+        with self._lock:
+            self._successes += 1
+            if self._successes >= config.BATCH_GROW_AFTER and self.size < self.maximum \
+                    and memory_headroom(self.device) > config.BATCH_GROW_HEADROOM:
+                self.size = min(self.maximum, self.size * 2)
+                self._successes = 0
+                BATCH_SIZE.labels(self.name).set(self.size)
+
+    def run(self, items, fn, isolate_errors=False):
+        """Results in item order. With isolate_errors an item that still fails on
+        its own gets its exception as result, as do the items left once the
+        request's deadline has passed; otherwise the error is raised."""
+        items = list(items)
+        results = []
+        start = 0
+        while start < len(items):
+            if isolate_errors:
+                # items left when the request runs out of time are failed, not run
+                exceeded = deadlines.exceeded()
+                if exceeded is not None:
+                    results.extend([exceeded] * (len(items) - start))
+                    break
+            if self.size > 1 and memory_headroom(self.device) < config.BATCH_MIN_HEADROOM:
+                self._shrink("headroom")
+            batch = items[start:start + self.size]
+            try:
+                results.extend(fn(batch))
+            except Exception as e:
+                if is_out_of_memory(e):
+                    release_memory()
+                    if len(batch) > 1:
+                        self._shrink("oom")
+                        continue
+                    record_fallback(self.name, "oom", str(e))
+                if not isolate_errors:
+                    raise
+                if len(batch) > 1:
+                    # find the failing items one by one
+                    results.extend(self._run_one(item, fn) for item in batch)
+                else:
+                    results.append(e)
+            else:
+                self._succeeded()
+            start += len(batch)
+        return results
+
+    def _run_one(self, item, fn):
+        try:
+            return fn([item])[0]
+        except Exception as e:
+            if is_out_of_memory(e):
+                release_memory()
+                record_fallback(self.name, "oom", str(e))
+            return e
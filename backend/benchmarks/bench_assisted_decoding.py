@@ -0,0 +1,121 @@
+# bench_assisted_decoding.py
+# Latency and accepted tokens per step of plain vs draft-assisted decoding for the llama prompts.
+#   python benchmarks/bench_assisted_decoding.py --draft meta-llama/Llama-3.2-1B-Instruct --runs 20
+import argparse, os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
+from llama_prompts import SYSTEM_PROMPT, CATEGORY_PROMPTS, QUESTION_TEMPLATE, score_prompt, topic_prompt
+
+EXCERPT = (
+    "Photosynthesis converts light energy into chemical energy. In the light-dependent reactions, "
+    "chlorophyll absorbs light and water is split, releasing oxygen and producing ATP and NADPH. "
+    "The Calvin cycle then uses ATP and NADPH to fix carbon dioxide into sugars in the stroma."
+)
+QUESTION = "What does the Calvin cycle do?"
+ANSWER = "It fixes carbon dioxide into sugar using ATP."
+SCORE = "4"
+
+
+def build_tasks():
+    """The three llama calls as processor_llama builds them: the question, then the
+    score and the topic as turns of the question's dialogue."""
+    question = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": QUESTION_TEMPLATE.format(text=EXCERPT, category=CATEGORY_PROMPTS["Definition"])},
+    ]
+    score = question + [
+        {"role": "assistant", "content": QUESTION},
+        {"role": "user", "content": score_prompt(ANSWER)},
+    ]
+    topic = score + [
+        {"role": "assistant", "content": SCORE},
+        {"role": "user", "content": topic_prompt([])},
+    ]
+    return {"question": question, "score": score, "topic": topic}
+
+
+class StepCounter:
+    """Streamer that counts decoding steps and generated tokens."""
+
+    def __init__(self):
+        self.steps = 0
+        self.tokens = 0
+        self._prompt_seen = False
+
+    def put(self, value):
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        self.steps += 1
+        self.tokens += int(value.shape[-1])
+
+    def end(self):
+        pass
+
+
+def run(model, tokenizer, messages, generation, assistant_model=None):
+    inputs = tokenizer.apply_chat_template(messages, add_generation_prompt=True, return_tensors="pt").to(model.device)
+    counter = StepCounter()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    model.generate(inputs, streamer=counter, assistant_model=assistant_model, **generation)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return time.perf_counter() - start, counter
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="meta-llama/Meta-Llama-3-8B-Instruct")
+    parser.add_argument("--draft", default="meta-llama/Llama-3.2-1B-Instruct")
+    parser.add_argument("--draft-tokens", type=int, nargs="+", default=[3, 5, 8])
+    parser.add_argument("--schedule", default="heuristic", choices=["heuristic", "constant"])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--greedy", action="store_true", help="greedy decoding instead of the app's sampling settings")
+    args = parser.parse_args()
+
+    # same quantization as processor_llama
+    bnb_config = BitsAndBytesConfig(load_in_4bit=True, bnb_4bit_use_double_quant=True, bnb_4bit_quant_type="nf4", bnb_4bit_compute_dtype=torch.bfloat16)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model, quantization_config=bnb_config, device_map="auto")
+    draft = AutoModelForCausalLM.from_pretrained(args.draft, torch_dtype=torch.bfloat16, device_map="auto")
+    if AutoTokenizer.from_pretrained(args.draft).get_vocab() != tokenizer.get_vocab():
+        sys.exit(f"{args.draft} does not share the tokenizer of {args.model}")
+
+    terminators = [tokenizer.eos_token_id, tokenizer.convert_tokens_to_ids("<|eot_id|>")]
+    generation = {"max_new_tokens": args.max_new_tokens, "eos_token_id": terminators, "pad_token_id": tokenizer.eos_token_id}
+    if args.greedy:
+        generation["do_sample"] = False
+    else:
+        generation.update(do_sample=True, temperature=0.6, top_p=0.9)
+
+    configs = [("plain", None)] + [(f"draft x{n}", n) for n in args.draft_tokens]
+    print(f"{'task':>9} {'mode':>10} {'p50 ms':>8} {'p99 ms':>8} {'tok/s':>7} {'tok/step':>9} {'speedup':>8}")
+    for task, messages in build_tasks().items():
+        baseline = None
+        for name, draft_tokens in configs:
+            assistant = None
+            if draft_tokens is not None:
+                draft.generation_config.num_assistant_tokens = draft_tokens
+                draft.generation_config.num_assistant_tokens_schedule = args.schedule
+                assistant = draft
+            run(model, tokenizer, messages, generation, assistant)  # warm-up
+            latencies, tokens, steps = [], 0, 0
+            for _ in range(args.runs):
+                seconds, counter = run(model, tokenizer, messages, generation, assistant)
+                latencies.append(seconds)
+                tokens += counter.tokens
+                steps += counter.steps
+            latencies = np.array(latencies) * 1000
+            p50 = np.percentile(latencies, 50)
+            baseline = baseline or p50
+            print(f"{task:>9} {name:>10} {p50:>8.1f} {np.percentile(latencies, 99):>8.1f} "
+                  f"{tokens / (latencies.sum() / 1000):>7.1f} {tokens / max(steps, 1):>9.2f} {baseline / p50:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
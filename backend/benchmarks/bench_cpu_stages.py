@@ -0,0 +1,99 @@
+# bench_cpu_stages.py
+# Generation, embedding and retrieval running concurrently in one process, as during uploads while
+# quizzes are generated: every stage on all cores vs the per-stage thread budgets of cpu_resources.
+#   python benchmarks/bench_cpu_stages.py --seconds 30
+#   python benchmarks/bench_cpu_stages.py --generation 4 --embedding 3 --retrieval 1
+import argparse, os, sys, threading, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import faiss
+import torch
+from sentence_transformers import SentenceTransformer
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from cpu_resources import ResourceManager, available_cores, plan_stages, STAGES
+from embedding import EMBEDDING_MODEL_NAME
+
+PROMPT = ("Generate a question about the following text: Photosynthesis converts light energy into chemical "
+          "energy stored in glucose. Chlorophyll in the chloroplast membrane absorbs mostly red and blue light.")
+
+
+def stage_loops(generation_model, tokenizer, embedder, index, queries, chunks):
+    inputs = tokenizer(PROMPT, return_tensors="pt")
+
+    def generate():
+        with torch.inference_mode():
+            generation_model.generate(**inputs, max_new_tokens=32, do_sample=False)
+
+    def embed():
+        embedder.encode(chunks, batch_size=32, convert_to_numpy=True)
+
+    def retrieve():
+        index.search(queries, 4)
+
+    return {"generation": generate, "embedding": embed, "retrieval": retrieve}
+
+
+def run(loops, seconds, manager):
+    latencies = {stage: [] for stage in STAGES}
+    stop = time.perf_counter() + seconds
+
+    def worker(stage):
+        with manager.stage(stage):
+            while time.perf_counter() < stop:
+                start = time.perf_counter()
+                loops[stage]()
+                latencies[stage].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(stage,)) for stage in STAGES]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def report(name, latencies, seconds):
+    for stage in STAGES:
+        ms = np.array(latencies[stage]) * 1000
+        print(f"{name:>10} {stage:>11} {len(ms) / seconds:>8.2f} {np.percentile(ms, 50):>8.1f} {np.percentile(ms, 90):>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--model", default="google/flan-t5-base", help="question generation model")
+    parser.add_argument("--generation", type=int, default=0, help="generation threads (0 = planned share)")
+    parser.add_argument("--embedding", type=int, default=0)
+    parser.add_argument("--retrieval", type=int, default=0)
+    parser.add_argument("--chunks", type=int, default=64, help="chunks per embedding call")
+    parser.add_argument("--index-size", type=int, default=200000)
+    args = parser.parse_args()
+
+    cores = available_cores()
+    plan = plan_stages(cores, args.generation, args.embedding, args.retrieval)
+    rng = np.random.default_rng(0)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    generation_model = AutoModelForSeq2SeqLM.from_pretrained(args.model).eval()
+    embedder = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+    dim = embedder.get_sentence_embedding_dimension()
+    index = faiss.IndexFlatL2(dim)
+    index.add(rng.standard_normal((args.index_size, dim)).astype(np.float32))
+    queries = rng.standard_normal((8, dim)).astype(np.float32)
+    chunks = [PROMPT * 4] * args.chunks
+    loops = stage_loops(generation_model, tokenizer, embedder, index, queries, chunks)
+    for loop in loops.values():
+        loop()  # warm up
+
+    print(f"cores: {len(cores)}; planned " + ", ".join(f"{stage} {plan[stage]['threads']}" for stage in STAGES))
+    print(f"{'mode':>10} {'stage':>11} {'calls/s':>8} {'p50 ms':>8} {'p90 ms':>8}")
+    # every stage on all cores, as without a resource manager
+    unmanaged = ResourceManager()
+    unmanaged.plan = {stage: {"threads": len(cores), "cores": cores} for stage in STAGES}
+    report("all cores", run(loops, args.seconds, unmanaged), args.seconds)
+    managed = ResourceManager()
+    managed.plan = plan
+    report("budgeted", run(loops, args.seconds, managed), args.seconds)
+
+
+if __name__ == "__main__":
+    main()
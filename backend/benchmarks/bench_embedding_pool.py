@@ -0,0 +1,63 @@
+# bench_embedding_pool.py
+# Chunk embedding throughput of the in-process model vs the worker pool at several worker counts.
+#   python benchmarks/bench_embedding_pool.py --chunks 4000 --workers 1 2 4 8
+import argparse, os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+from embedding import EMBEDDING_MODEL_NAME
+from embedding_pool import EmbeddingPool, token_batches
+
+WORDS = (
+    "cell membrane protein energy light water carbon oxygen reaction enzyme structure function "
+    "process system model theory evidence result method analysis data concept example value"
+).split()
+
+
+def synthetic_chunks(count, rng):
+    # ingest chunks are up to 1000 characters; the last one of a page or section is often short
+    lengths = np.clip(rng.normal(150, 40, size=count), 10, 200).astype(int)
+    lengths[rng.random(count) < 0.2] //= 4
+    return [" ".join(rng.choice(WORDS, size=n)) for n in lengths]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=4000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=1, help="torch threads per worker")
+    parser.add_argument("--batch-tokens", type=int, default=8192)
+    args = parser.parse_args()
+
+    texts = synthetic_chunks(args.chunks, np.random.default_rng(0))
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+
+    start = time.perf_counter()
+    reference = model.encode(texts, batch_size=32, convert_to_numpy=True)
+    seconds = time.perf_counter() - start
+    print(f"cores: {os.cpu_count()}, torch threads in-process: {torch.get_num_threads()}")
+    print(f"{'mode':>14} {'chunks/s':>9} {'speedup':>8} {'padding':>8} {'max diff':>9}")
+    print(f"{'in-process':>14} {len(texts) / seconds:>9.1f} {'':>8} {'':>8} {'':>9}")
+
+    baseline = None
+    for workers in args.workers:
+        pool = EmbeddingPool(EMBEDDING_MODEL_NAME, model.tokenizer, model.max_seq_length, workers,
+                             threads=args.threads, batch_tokens=args.batch_tokens)
+        pool.embed(texts[:workers * 8])  # start the workers and load their models
+        lengths = pool.lengths(texts)
+        padded = sum(int(lengths[b].max()) * len(b) for b in token_batches(lengths, args.batch_tokens))
+        start = time.perf_counter()
+        vectors = pool.embed(texts)
+        seconds = time.perf_counter() - start
+        pool.close()
+        rate = len(texts) / seconds
+        baseline = baseline or rate / workers
+        # vectors must come back in chunk order
+        diff = float(np.abs(vectors - reference).max())
+        print(f"{f'{workers} x {args.threads} thr':>14} {rate:>9.1f} {rate / baseline:>7.2f}x "
+              f"{1 - lengths.sum() / padded:>7.1%} {diff:>9.2e}")
+
+
+if __name__ == "__main__":
+    main()
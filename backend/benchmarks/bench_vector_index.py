@@ -0,0 +1,72 @@
+# bench_vector_index.py
+# Recall/latency of the flat, HNSW and IVF-PQ indexes against exact search.
+#   python benchmarks/bench_vector_index.py --sizes 1000 10000 100000 --storage float32 fp16 sq8
+import argparse, os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import faiss
+import config
+from vector_index import build_index
+
+DIM = 384  # all-MiniLM-L6-v2
+
+
+def synthetic_embeddings(n, n_clusters, rng):
+    # unit vectors grouped around topics, roughly like sentence embeddings of a document
+    centers = rng.normal(size=(n_clusters, DIM)).astype(np.float32)
+    points = centers[rng.integers(0, n_clusters, size=n)] + 0.6 * rng.normal(size=(n, DIM)).astype(np.float32)
+    return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+
+def perturbed_queries(base, count, rng):
+    picked = base[rng.choice(len(base), size=count, replace=False)]
+    queries = picked + 0.03 * rng.normal(size=picked.shape).astype(np.float32)
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def measure(index, queries, truth, k):
+    latencies = []
+    hits = 0
+    for q, t in zip(queries, truth):
+        start = time.perf_counter()
+        _, found = index.search(q[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(found[0]) & set(t))
+    latencies = np.array(latencies) * 1000
+    return hits / truth.size, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    # ivfpq_raw is IVF-PQ without exact re-ranking
+    parser.add_argument("--types", nargs="+", default=["flat", "hnsw", "ivfpq", "ivfpq_raw"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--recall-target", type=float, default=None)
+    parser.add_argument("--storage", nargs="+", default=["float32", "fp16", "sq8"])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'chunks':>8} {'index':>9} {'storage':>8} {'build s':>8} {'recall@' + str(args.k):>9} {'p50 ms':>8} {'p99 ms':>8} {'size MB':>8}")
+    for n in args.sizes:
+        base = synthetic_embeddings(n, max(8, n // 200), rng)
+        queries = perturbed_queries(base, min(args.queries, n), rng)
+        exact = faiss.IndexFlatL2(DIM)
+        exact.add(base)
+        _, truth = exact.search(queries, args.k)
+        for index_type in args.types:
+            config.VECTOR_INDEX_PQ_REFINE = index_type != "ivfpq_raw"
+            for storage in args.storage:
+                if index_type == "ivfpq_raw" and storage != args.storage[0]:
+                    continue  # nothing stored besides the PQ codes
+                start = time.perf_counter()
+                index, _, _ = build_index(base, index_type.replace("_raw", ""), args.recall_target, storage)
+                build_seconds = time.perf_counter() - start
+                recall, p50, p99 = measure(index, queries, truth, args.k)
+                size_mb = faiss.serialize_index(index).nbytes / 2**20
+                print(f"{n:>8} {index_type:>9} {storage:>8} {build_seconds:>8.2f} {recall:>9.3f} {p50:>8.3f} {p99:>8.3f} {size_mb:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# loadtest.py
+# Concurrent simulated students against the HTTP API: upload -> generate -> submit -> regenerate tailored.
+# Starts the app with the stub model backend (LLM_BACKEND=stub) unless --url points at a running server.
+#   python benchmarks/loadtest.py --users 50 --sessions 2
+#   python benchmarks/loadtest.py --url http://localhost:8000 --users 20
+import argparse, asyncio, json, os, random, socket, subprocess, sys, tempfile, textwrap, time, uuid
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ["/uploadFile", "/generateQuestions", "/submitAnswers", "/regenerateTailoredQuestions"]
+
+WORDS = (
+    "photosynthesis chlorophyll membrane protein enzyme reaction energy carbon oxygen glucose respiration "
+    "mitochondria nucleus transcription translation ribosome molecule structure function gradient pathway "
+    "equilibrium concentration diffusion osmosis catalyst substrate inhibitor temperature pressure cycle"
+).split()
+FILLER = "the of and in a is to that by which with as for from this are".split()
+
+
+def sentence(rng):
+    words = [rng.choice(WORDS if rng.random() < 0.4 else FILLER) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + "."
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages):
+    """Minimal PDF with one Helvetica text page per list of lines."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        stream = ("BT /F1 10 Tf 14 TL 50 770 Td " + " ".join(f"({_escape(line)}) '" for line in lines) + " ET").encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{k} 0 R" for k in kids).encode(), len(kids))
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def course_notes(seed, pages):
+    # running header and page number on every page, like real lecture notes
+    rng = random.Random(seed)
+    return make_pdf([
+        [f"Course notes {seed} - Chapter {page // 4 + 1}"]
+        + textwrap.wrap(" ".join(sentence(rng) for _ in range(40)), 95)[:45]
+        + [str(page + 1)]
+        for page in range(pages)
+    ])
+
+
+def answer_text(question, rng):
+    # some blank and "don't know" answers, the rest reuse words of the question
+    roll = rng.random()
+    if roll < 0.1:
+        return ""
+    if roll < 0.2:
+        return "I don't know"
+    words = [w.strip("?,.") for w in question.split() if len(w) > 5]
+    return " ".join(rng.sample(words, min(len(words), 2)) + [sentence(rng)])
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors = {endpoint: {} for endpoint in ENDPOINTS}
+        self.sessions = []
+
+    def add(self, endpoint, seconds, error=None):
+        self.latencies[endpoint].append(seconds)
+        if error is not None:
+            self.errors[endpoint][error] = self.errors[endpoint].get(error, 0) + 1
+
+    def report(self, wall_seconds):
+        rows = []
+        for endpoint in ENDPOINTS:
+            latencies = np.array(self.latencies[endpoint]) * 1000
+            errors = sum(self.errors[endpoint].values())
+            rows.append({
+                "endpoint": endpoint,
+                "requests": len(latencies),
+                "errors": errors,
+                "error_rate": errors / len(latencies) if len(latencies) else 0.0,
+                "throughput": len(latencies) / wall_seconds,
+                "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+                "p90_ms": float(np.percentile(latencies, 90)) if len(latencies) else None,
+                "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+                "max_ms": float(latencies.max()) if len(latencies) else None,
+                "error_kinds": self.errors[endpoint],
+            })
+        return rows
+
+
+async def timed(recorder, endpoint, request):
+    start = time.perf_counter()
+    try:
+        response = await request
+    except httpx.HTTPError as e:
+        recorder.add(endpoint, time.perf_counter() - start, type(e).__name__)
+        return None
+    seconds = time.perf_counter() - start
+    if response.status_code >= 400:
+        recorder.add(endpoint, seconds, str(response.status_code))
+        return None
+    recorder.add(endpoint, seconds)
+    return response.json()
+
+
+async def session(client, recorder, pdf, args, rng):
+    headers = {"X-Session-Id": f"loadtest-{uuid.uuid4().hex[:12]}"}
+    start = time.perf_counter()
+
+    async def think():
+        await asyncio.sleep(rng.uniform(0, args.think))
+
+    upload = await timed(recorder, "/uploadFile", client.post(
+        "/uploadFile", headers=headers, files={"file": ("notes.pdf", pdf, "application/pdf")},
+    ))
+    if upload is None:
+        return
+    document_ids = [upload["documentId"]]
+    await think()
+    quiz = await timed(recorder, "/generateQuestions", client.post(
+        "/generateQuestions", headers=headers, json={"questionCount": args.questions, "documentIds": document_ids},
+    ))
+    if quiz is None:
+        return
+    await think()
+    answers = [{"text": answer_text(q["text"], rng)} for q in quiz["questions"]]
+    results = await timed(recorder, "/submitAnswers", client.post("/submitAnswers", headers=headers, json={"answers": answers}))
+    if results is None:
+        return
+    await think()
+    # weaknesses sent back as the results page does
+    tailored = await timed(recorder, "/regenerateTailoredQuestions", client.post(
+        "/regenerateTailoredQuestions", headers=headers,
+        json={"questionCount": args.questions, "weaknesses": results["weaknesses"], "documentIds": document_ids},
+    ))
+    if tailored is not None:
+        recorder.sessions.append(time.perf_counter() - start)
+
+
+async def user(index, client, recorder, pdfs, args):
+    rng = random.Random(args.seed * 100003 + index)
+    await asyncio.sleep(args.ramp * index / max(1, args.users))
+    for _ in range(args.sessions):
+        await session(client, recorder, pdfs[rng.randrange(len(pdfs))], args, rng)
+
+
+async def run(args, url):
+    pdfs = [course_notes(seed, args.pages) for seed in range(args.documents)]
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(user(i, client, recorder, pdfs, args) for i in range(args.users)))
+        wall = time.perf_counter() - start
+    return recorder, wall
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(args, workdir):
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "LLM_BACKEND": "stub",
+        "QUIZ_PROCESSOR": args.processor,
+        "LLM_STUB_PREFILL_MS": str(args.stub_prefill_ms),
+        "LLM_STUB_TOKEN_MS": str(args.stub_token_ms),
+        "STORE_PATH": os.path.join(workdir, "quizmaker.db"),
+        # every simulated user comes from this address and so would share one token bucket;
+        # the queue capacity check still applies
+        "ADMISSION_BUCKET_SIZE": "1000000",
+    })
+    env.update(dict(item.split("=", 1) for item in args.env))
+    # run from a scratch directory so uploads and the store do not touch the checkout
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR, "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"app exited with code {process.returncode}")
+        try:
+            if httpx.get(url + "/metrics", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    process.terminate()
+    sys.exit("app did not start in time")
+
+
+def print_report(rows, recorder, wall, args):
+    print(f"\n{args.users} users x {args.sessions} sessions in {wall:.1f}s, "
+          f"{len(recorder.sessions)} sessions completed ({len(recorder.sessions) / wall:.2f}/s)")
+    print(f"{'endpoint':<30} {'reqs':>6} {'err %':>6} {'req/s':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for row in rows:
+        if not row["requests"]:
+            print(f"{row['endpoint']:<30} {0:>6}")
+            continue
+        print(f"{row['endpoint']:<30} {row['requests']:>6} {100 * row['error_rate']:>6.1f} {row['throughput']:>7.2f} "
+              f"{row['p50_ms']:>8.0f} {row['p90_ms']:>8.0f} {row['p99_ms']:>8.0f} {row['max_ms']:>8.0f}")
+    for row in rows:
+        if row["error_kinds"]:
+            print(f"  {row['endpoint']} errors: {row['error_kinds']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="test a running server instead of starting the app with the stub backend")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=1, help="sessions per user, one after the other")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which users start")
+    parser.add_argument("--think", type=float, default=2.0, help="max seconds between a user's requests")
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--documents", type=int, default=10, help="distinct PDFs shared among the users")
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--processor", default="llama", choices=["llama", "flan"])
+    parser.add_argument("--stub-prefill-ms", type=float, default=50)
+    parser.add_argument("--stub-token-ms", type=float, default=20)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app settings")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    process = None
+    with tempfile.TemporaryDirectory() as workdir:
+        url = args.url
+        if url is None:
+            process, url = start_app(args, workdir)
+        try:
+            recorder, wall = asyncio.run(run(args, url))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+    rows = recorder.report(wall)
+    print_report(rows, recorder, wall, args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"users": args.users, "sessions": args.sessions, "seconds": wall,
+                       "completed_sessions": len(recorder.sessions), "endpoints": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# chunk_store.py
+import sys
+from collections.abc import Sequence
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+
+class ChunkText(Sequence):
+    """Chunk strings as spans of the document text, which is stored once.
+
+    Overlapping chunks share the same characters; a chunk string only exists
+    while it is being used.
+    """
+
+    def __init__(self, text: str, starts, ends):
+        self.text = text
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.text[self.starts[i]:self.ends[i]]
+
+    @property
+    def nbytes(self):
+        return sys.getsizeof(self.text) + self.starts.nbytes + self.ends.nbytes
+
+
+class PackedArrays(Sequence):
+    """Variable-length arrays (e.g. token ids per chunk) in one buffer with offsets."""
+
+    def __init__(self, values, offsets):
+        self.values = values
+        self.offsets = offsets
+
+    @classmethod
+    def from_arrays(cls, arrays, dtype=np.int32):
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(a) for a in arrays])
+        values = np.concatenate(arrays).astype(dtype, copy=False) if arrays else np.zeros(0, dtype=dtype)
+        return cls(values, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.offsets.nbytes
+
+
+class ChunkDocstore(Docstore, AddableMixin):
+    """LangChain docstore that points at chunk buffers instead of holding copies of the text.
+
+    Documents are built on lookup. Documents added through the regular
+    LangChain API (add_texts, add_embeddings) are kept as they are.
+    """
+
+    def __init__(self):
+        self._refs = {}
+
+    def add_chunks(self, ids, chunks, metadatas):
+        for doc_id, metadata in zip(ids, metadatas):
+            self._refs[doc_id] = (chunks, metadata)
+
+    def add(self, texts):
+        overlapping = set(texts).intersection(self._refs)
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._refs.update({doc_id: (None, doc) for doc_id, doc in texts.items()})
+
+    def delete(self, ids):
+        for doc_id in ids:
+            self._refs.pop(doc_id, None)
+
+    def search(self, search: str):
+        ref = self._refs.get(search)
+        if ref is None:
+            return f"ID {search} not found."
+        chunks, metadata = ref
+        if chunks is None:
+            return metadata
+        return Document(id=search, page_content=chunks[metadata["chunk_id"]], metadata=metadata)
+
+    def __len__(self):
+        return len(self._refs)
@@ -0,0 +1,178 @@
+# config.py
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "llama" or "flan"; empty picks llama when CUDA is available
+QUIZ_PROCESSOR = os.getenv("QUIZ_PROCESSOR", "")
+
+# "local" runs the transformers pipeline in-process, "openai" talks to an
+# OpenAI-compatible server (llama.cpp, vLLM, ...), "stub" answers with canned
+# replies after a simulated delay (load tests)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "local")
+LLM_STUB_PREFILL_MS = float(os.getenv("LLM_STUB_PREFILL_MS", "50"))
+LLM_STUB_TOKEN_MS = float(os.getenv("LLM_STUB_TOKEN_MS", "20"))
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://localhost:8080/v1")
+LLM_MODEL = os.getenv("LLM_MODEL", "")
+LLM_API_KEY = os.getenv("LLM_API_KEY", "")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "16"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "8"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+# assisted decoding for the local llama backend: a small draft model with the same
+# tokenizer (e.g. meta-llama/Llama-3.2-1B-Instruct) proposes tokens the main model verifies
+LLM_DRAFT_MODEL = os.getenv("LLM_DRAFT_MODEL", "")
+LLM_DRAFT_TOKENS = int(os.getenv("LLM_DRAFT_TOKENS", "5"))
+# "heuristic" adapts the number of draft tokens to the acceptance rate, "constant" keeps LLM_DRAFT_TOKENS
+LLM_DRAFT_SCHEDULE = os.getenv("LLM_DRAFT_SCHEDULE", "heuristic")
+# prefill the shared system message and template head once per model load (local llama backend, no draft model)
+LLM_PREFIX_CACHE_ENABLED = os.getenv("LLM_PREFIX_CACHE_ENABLED", "true").lower() == "true"
+
+# token limits of the generation profiles in generation_profiles.py
+GENERATION_QUESTION_MAX_NEW_TOKENS = int(os.getenv("GENERATION_QUESTION_MAX_NEW_TOKENS", "64"))
+GENERATION_SCORE_MAX_NEW_TOKENS = int(os.getenv("GENERATION_SCORE_MAX_NEW_TOKENS", "16"))
+GENERATION_TOPIC_MAX_NEW_TOKENS = int(os.getenv("GENERATION_TOPIC_MAX_NEW_TOKENS", "24"))
+# stop questions at the first "?" or line break and scores at the first number
+GENERATION_STOP_ENABLED = os.getenv("GENERATION_STOP_ENABLED", "true").lower() == "true"
+
+# background question bank filled after upload and served by /generateQuestions
+QUESTION_BANK_ENABLED = os.getenv("QUESTION_BANK_ENABLED", "false").lower() == "true"
+QUESTION_BANK_SIZE = int(os.getenv("QUESTION_BANK_SIZE", "20"))
+QUESTION_BANK_REFILL_BATCH = int(os.getenv("QUESTION_BANK_REFILL_BATCH", "4"))
+# "idle" only refills when no request is waiting for the model, "normal" queues with requests
+QUESTION_BANK_REFILL_PRIORITY = os.getenv("QUESTION_BANK_REFILL_PRIORITY", "idle")
+QUESTION_BANK_IDLE_POLL_SECONDS = float(os.getenv("QUESTION_BANK_IDLE_POLL_SECONDS", "0.5"))
+# "content" keeps the bank when the same document is uploaded again, "upload" drops it on every upload
+QUESTION_BANK_INVALIDATE = os.getenv("QUESTION_BANK_INVALIDATE", "content")
+
+# near-duplicate question filtering against the current quiz and the session's recent quizzes
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+DEDUP_HISTORY_QUIZZES = int(os.getenv("DEDUP_HISTORY_QUIZZES", "3"))
+DEDUP_MAX_ROUNDS = int(os.getenv("DEDUP_MAX_ROUNDS", "2"))
+DEDUP_MAX_SESSIONS = int(os.getenv("DEDUP_MAX_SESSIONS", "1000"))
+
+# tokenizer used to budget prompts when the model runs behind LLM_BACKEND=openai;
+# empty uses the processor's default model name
+LLM_TOKENIZER = os.getenv("LLM_TOKENIZER", "")
+
+# vector index: "auto" picks flat, hnsw or ivfpq by chunk count
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "auto")
+VECTOR_INDEX_FLAT_MAX = int(os.getenv("VECTOR_INDEX_FLAT_MAX", "10000"))
+VECTOR_INDEX_HNSW_MAX = int(os.getenv("VECTOR_INDEX_HNSW_MAX", "200000"))
+# search parameters (HNSW efSearch, IVF nprobe) are raised until this recall@k against exact search is reached
+VECTOR_INDEX_RECALL_TARGET = float(os.getenv("VECTOR_INDEX_RECALL_TARGET", "0.95"))
+VECTOR_INDEX_RECALL_K = int(os.getenv("VECTOR_INDEX_RECALL_K", "4"))
+VECTOR_INDEX_TUNE_QUERIES = int(os.getenv("VECTOR_INDEX_TUNE_QUERIES", "64"))
+VECTOR_INDEX_HNSW_M = int(os.getenv("VECTOR_INDEX_HNSW_M", "32"))
+VECTOR_INDEX_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_INDEX_HNSW_EF_CONSTRUCTION", "80"))
+VECTOR_INDEX_PQ_M = int(os.getenv("VECTOR_INDEX_PQ_M", "48"))
+# re-rank IVF-PQ candidates with exact vectors (more memory, higher recall)
+VECTOR_INDEX_PQ_REFINE = os.getenv("VECTOR_INDEX_PQ_REFINE", "true").lower() == "true"
+VECTOR_INDEX_PQ_REFINE_K_FACTOR = int(os.getenv("VECTOR_INDEX_PQ_REFINE_K_FACTOR", "4"))
+# vectors kept in the index: "float32", "fp16" or "sq8" (8-bit scalar quantization)
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "fp16")
+
+# sessions whose uploads are remembered (least recently uploaded to are dropped first)
+LIBRARY_MAX_SESSIONS = int(os.getenv("LIBRARY_MAX_SESSIONS", "100"))
+
+# debug only: also send each question's chat transcript to the client
+RESPONSE_INCLUDE_DIALOGUE = os.getenv("RESPONSE_INCLUDE_DIALOGUE", "false").lower() == "true"
+
+# graded answers reused for the same document, question and normalized answer
+GRADING_CACHE_ENABLED = os.getenv("GRADING_CACHE_ENABLED", "true").lower() == "true"
+GRADING_CACHE_SIZE = int(os.getenv("GRADING_CACHE_SIZE", "10000"))
+GRADING_CACHE_TTL_SECONDS = float(os.getenv("GRADING_CACHE_TTL_SECONDS", "86400"))
+
+# pre-scoring of empty or off-topic answers: "off", "shadow" (compare with the LLM only) or "on" (score 0 without the LLM)
+PRESCORE_MODE = os.getenv("PRESCORE_MODE", "shadow")
+PRESCORE_MIN_CHARS = int(os.getenv("PRESCORE_MIN_CHARS", "3"))
+PRESCORE_MIN_SIMILARITY = float(os.getenv("PRESCORE_MIN_SIMILARITY", "0.15"))
+PRESCORE_AGREE_MAX = float(os.getenv("PRESCORE_AGREE_MAX", "1.0"))
+
+# adaptive batching: batches halve on out-of-memory or low headroom and double again when there is room
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "4"))
+LLM_BATCH_MAX = int(os.getenv("LLM_BATCH_MAX", "16"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "512"))
+# ingest of documents with at least EMBED_POOL_MIN_CHUNKS chunks spreads encoding over
+# EMBED_WORKERS processes (0 keeps it in-process) with EMBED_WORKER_THREADS torch threads
+# each (0 divides the embedding stage's CPU budget between them), in batches of about
+# EMBED_POOL_BATCH_TOKENS tokens
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))
+EMBED_WORKER_THREADS = int(os.getenv("EMBED_WORKER_THREADS", "0"))
+EMBED_POOL_BATCH_TOKENS = int(os.getenv("EMBED_POOL_BATCH_TOKENS", "8192"))
+EMBED_POOL_MIN_CHUNKS = int(os.getenv("EMBED_POOL_MIN_CHUNKS", "256"))
+# free fraction of GPU memory (or RAM without CUDA)
+BATCH_MIN_HEADROOM = float(os.getenv("BATCH_MIN_HEADROOM", "0.1"))
+BATCH_GROW_HEADROOM = float(os.getenv("BATCH_GROW_HEADROOM", "0.3"))
+BATCH_GROW_AFTER = int(os.getenv("BATCH_GROW_AFTER", "4"))
+
+# text cleaning before chunking: lines repeated on at least this many pages (and this share of
+# pages) are running headers/footers; chunks scoring below CLEANING_MIN_CHUNK_SCORE are dropped
+CLEANING_MIN_REPEAT_PAGES = int(os.getenv("CLEANING_MIN_REPEAT_PAGES", "3"))
+CLEANING_REPEAT_FRACTION = float(os.getenv("CLEANING_REPEAT_FRACTION", "0.3"))
+CLEANING_MIN_CHUNK_WORDS = int(os.getenv("CLEANING_MIN_CHUNK_WORDS", "20"))
+CLEANING_MIN_CHUNK_SCORE = float(os.getenv("CLEANING_MIN_CHUNK_SCORE", "0.25"))
+
+# SQLite store of documents, quizzes, answers and per-user topic statistics; users are X-Session-Id values
+STORE_ENABLED = os.getenv("STORE_ENABLED", "true").lower() == "true"
+STORE_PATH = os.getenv("STORE_PATH", "data/quizmaker.db")
+STORE_POOL_SIZE = int(os.getenv("STORE_POOL_SIZE", "5"))
+STORE_BUSY_TIMEOUT_MS = int(os.getenv("STORE_BUSY_TIMEOUT_MS", "5000"))
+
+# on-demand profiling: requests with an X-Profile header ("cprofile" or "torch") or armed through
+# POST /admin/profile write traces to PROFILING_DIR; off unless enabled, and X-Profile-Token
+# must match PROFILING_TOKEN when one is set
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+PROFILING_MAX_TRACES = int(os.getenv("PROFILING_MAX_TRACES", "50"))
+PROFILING_TOP_FUNCTIONS = int(os.getenv("PROFILING_TOP_FUNCTIONS", "30"))
+
+# admission control: requests cost ADMISSION_COST_PER_* units, paid from per-client token buckets
+# (by client address); model calls beyond the model's slots (1 in-process, LLM_MAX_CONCURRENCY
+# with LLM_BACKEND=openai) are queued in weighted fair order and
+# question generation runs in slices of ADMISSION_SLICE_QUESTIONS. 429 with Retry-After when a
+# bucket is empty or more than ADMISSION_MAX_QUEUED_SECONDS of work is waiting
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_COST_PER_QUESTION = float(os.getenv("ADMISSION_COST_PER_QUESTION", "1"))
+ADMISSION_COST_PER_ANSWER = float(os.getenv("ADMISSION_COST_PER_ANSWER", "2"))
+ADMISSION_COST_PER_UPLOAD = float(os.getenv("ADMISSION_COST_PER_UPLOAD", "5"))
+ADMISSION_BUCKET_SIZE = float(os.getenv("ADMISSION_BUCKET_SIZE", "60"))
+ADMISSION_REFILL_PER_SECOND = float(os.getenv("ADMISSION_REFILL_PER_SECOND", "0.5"))
+ADMISSION_SLICE_QUESTIONS = int(os.getenv("ADMISSION_SLICE_QUESTIONS", "5"))
+ADMISSION_MAX_QUEUED_SECONDS = float(os.getenv("ADMISSION_MAX_QUEUED_SECONDS", "120"))
+ADMISSION_INITIAL_SECONDS_PER_UNIT = float(os.getenv("ADMISSION_INITIAL_SECONDS_PER_UNIT", "1"))
+ADMISSION_BACKGROUND_WEIGHT = float(os.getenv("ADMISSION_BACKGROUND_WEIGHT", "0.25"))
+MAX_QUESTION_COUNT = int(os.getenv("MAX_QUESTION_COUNT", "100"))
+
+# uploads and their zstd-compressed text and chunk artifacts under UPLOAD_DIR, indexed by document id;
+# uploads not accessed for UPLOAD_TTL_DAYS, then the least recently accessed beyond UPLOAD_QUOTA_MB,
+# are deleted every UPLOAD_GC_INTERVAL_SECONDS (0 turns a limit off)
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_QUOTA_MB = int(os.getenv("UPLOAD_QUOTA_MB", "2048"))
+UPLOAD_TTL_DAYS = float(os.getenv("UPLOAD_TTL_DAYS", "30"))
+UPLOAD_GC_INTERVAL_SECONDS = float(os.getenv("UPLOAD_GC_INTERVAL_SECONDS", "600"))
+UPLOAD_ZSTD_LEVEL = int(os.getenv("UPLOAD_ZSTD_LEVEL", "9"))
+# the compressed artifacts are enough to reload a document; the PDF itself is only kept for download
+UPLOAD_KEEP_PDF = os.getenv("UPLOAD_KEEP_PDF", "true").lower() == "true"
+
+# CPU thread budgets per stage: model calls (generation), chunk and query embedding, and vector
+# search (retrieval) each get their own torch/OpenMP thread count instead of all using every core.
+# 0 takes a share of the available cores (about 1/8 retrieval, 3/8 of the rest embedding, the rest
+# generation). CPU_AFFINITY pins the server and the embedding workers to separate cores
+CPU_RESOURCES_ENABLED = os.getenv("CPU_RESOURCES_ENABLED", "true").lower() == "true"
+CPU_THREADS_GENERATION = int(os.getenv("CPU_THREADS_GENERATION", "0"))
+CPU_THREADS_EMBEDDING = int(os.getenv("CPU_THREADS_EMBEDDING", "0"))
+CPU_THREADS_RETRIEVAL = int(os.getenv("CPU_THREADS_RETRIEVAL", "0"))
+CPU_AFFINITY = os.getenv("CPU_AFFINITY", "false").lower() == "true"
+
+# time budget of question generation and grading requests; clients may ask for less with an
+# X-Deadline-Ms header (0 = no limit, but work still stops when the client disconnects). Model work
+# checks it between items and batches; questions not generated in time are replaced by fallback
+# questions, answers not graded are listed in "ungraded", and X-Deadline-Exceeded says why
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "120"))
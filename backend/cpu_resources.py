@@ -0,0 +1,107 @@
+# cpu_resources.py
+import contextlib, os
+from prometheus_client import Gauge
+import config
+
+STAGES = ("generation", "embedding", "retrieval")
+
+STAGE_THREADS = Gauge("quizmaker_cpu_stage_threads", "Torch/OpenMP threads budgeted per stage", ["stage"])
+
+
+def available_cores():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def plan_stages(cores, generation=0, embedding=0, retrieval=0):
+    """{stage: {"threads": n, "cores": [...]}} for a host with these cores; 0 picks a share.
+
+    Retrieval gets about an eighth, embedding 3/8 of the rest and generation
+    what is left. Each stage gets consecutive cores after the previous one,
+    wrapping around when the budgets add up to more than the host has.
+    """
+    n = len(cores)
+    threads = {"retrieval": retrieval or max(1, n // 8)}
+    threads["embedding"] = embedding or max(1, (n - threads["retrieval"]) * 3 // 8)
+    threads["generation"] = generation or max(1, n - threads["retrieval"] - threads["embedding"])
+    plan, start = {}, 0
+    for stage in STAGES:
+        count = min(threads[stage], n)
+        plan[stage] = {"threads": threads[stage], "cores": [cores[(start + i) % n] for i in range(count)]}
+        start += count
+    return plan
+
+
+class ResourceManager:
+    """Thread budgets and core affinity per inference stage.
+
+    configure() runs before torch is imported: OpenMP/MKL threads default to
+    the generation budget, the HF tokenizers' thread pool to the embedding one,
+    and with CPU_AFFINITY the server is pinned to the generation and retrieval
+    cores (embedding workers get their own, see worker_settings). stage() sets
+    the calling thread's torch and faiss threads while a stage runs, since
+    OpenMP thread counts are per calling thread.
+    """
+
+    def __init__(self):
+        self.plan = None
+
+    def configure(self):
+        if not config.CPU_RESOURCES_ENABLED or self.plan is not None:
+            return self.plan
+        self.plan = plan_stages(
+            available_cores(),
+            config.CPU_THREADS_GENERATION,
+            config.CPU_THREADS_EMBEDDING,
+            config.CPU_THREADS_RETRIEVAL,
+        )
+        generation = str(self.plan["generation"]["threads"])
+        # explicit environment settings win
+        os.environ.setdefault("OMP_NUM_THREADS", generation)
+        os.environ.setdefault("MKL_NUM_THREADS", generation)
+        os.environ.setdefault("RAYON_NUM_THREADS", str(self.plan["embedding"]["threads"]))
+        if config.CPU_AFFINITY and hasattr(os, "sched_setaffinity"):
+            server_stages = ["generation", "retrieval"] + (["embedding"] if config.EMBED_WORKERS == 0 else [])
+            os.sched_setaffinity(0, {core for stage in server_stages for core in self.plan[stage]["cores"]})
+        for stage in STAGES:
+            STAGE_THREADS.labels(stage).set(self.plan[stage]["threads"])
+        print("CPU stage budgets: " + ", ".join(
+            f"{stage} {self.plan[stage]['threads']} threads on cores {self.plan[stage]['cores']}" for stage in STAGES))
+        return self.plan
+
+    def threads(self, stage):
+        return self.plan[stage]["threads"] if self.plan is not None else None
+
+    def worker_settings(self, workers):
+        """(torch threads per embedding worker, cores to pin the workers to or None)."""
+        if self.plan is None:
+            return max(1, (os.cpu_count() or 1) // workers), None
+        embedding = self.plan["embedding"]
+        return max(1, embedding["threads"] // workers), (embedding["cores"] if config.CPU_AFFINITY else None)
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        threads = self.threads(stage)
+        if threads is None:
+            yield
+            return
+        import faiss, torch
+        previous = torch.get_num_threads(), faiss.omp_get_max_threads()
+        torch.set_num_threads(threads)
+        faiss.omp_set_num_threads(threads)
+        try:
+            yield
+        finally:
+            torch.set_num_threads(previous[0])
+            faiss.omp_set_num_threads(previous[1])
+
+
+def staged(stage, fn, *args):
+    """Runs fn(*args) within the stage's thread budget."""
+    with resources.stage(stage):
+        return fn(*args)
+
+
+resources = ResourceManager()
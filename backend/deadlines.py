@@ -0,0 +1,142 @@
+# deadlines.py
+import asyncio, contextvars, math, time
+from prometheus_client import Counter
+import config
+
+DEADLINE_EXCEEDED = Counter("quizmaker_deadline_exceeded_total", "Requests whose model work was cut short", ["endpoint", "reason"])
+
+# the deadline of the request being handled; starlette copies it into threadpool calls
+_current = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, reason):
+        super().__init__(f"request deadline exceeded ({reason})")
+        self.reason = reason
+
+
+class Deadline:
+    """Time budget of one request, also ended when its client disconnects.
+
+    Model work checks it between items and batches; `exceeded` is set to
+    "timeout" or "disconnect" once a check has cut something short.
+    """
+
+    def __init__(self, seconds):
+        self.expires = time.monotonic() + seconds if seconds > 0 else None
+        self.disconnected = False
+        self.exceeded = None
+        # set by watch() on the event loop, for waits that should stop early
+        self.ended = asyncio.Event()
+
+    def remaining(self):
+        return float("inf") if self.expires is None else self.expires - time.monotonic()
+
+    def reason(self):
+        if self.disconnected:
+            return "disconnect"
+        if self.remaining() <= 0:
+            return "timeout"
+        return None
+
+    def check(self):
+        reason = self.reason()
+        if reason is not None:
+            self.exceeded = reason
+            raise DeadlineExceeded(reason)
+
+
+def seconds_for(headers):
+    """REQUEST_DEADLINE_SECONDS, or less when the client sends X-Deadline-Ms."""
+    limit = config.REQUEST_DEADLINE_SECONDS
+    try:
+        asked = float(headers.get("X-Deadline-Ms", "")) / 1000
+    except ValueError:
+        return limit
+    if not math.isfinite(asked) or asked <= 0:
+        # 0, negative or nan would mean no deadline at all
+        return limit
+    return min(asked, limit) if limit > 0 else asked
+
+
+def current():
+    return _current.get()
+
+
+def activate(deadline):
+    return _current.set(deadline)
+
+
+def reset(token):
+    _current.reset(token)
+
+
+def exceeded():
+    """DeadlineExceeded for the current request once its deadline has passed, else None."""
+    deadline = _current.get()
+    if deadline is None:
+        return None
+    try:
+        deadline.check()
+    except DeadlineExceeded as e:
+        return e
+    return None
+
+
+def check():
+    error = exceeded()
+    if error is not None:
+        raise error
+
+
+async def watch(deadline, receive):
+    """Ends the deadline when it runs out or the client disconnects.
+
+    Started once the request body has been read, when http.disconnect is the
+    only message left to receive. (Request.is_disconnected only peeks, which
+    does not get through BaseHTTPMiddleware's receive wrapper.)
+    """
+    remaining = deadline.remaining()
+    try:
+        message = await asyncio.wait_for(receive(), timeout=None if deadline.expires is None else max(0.0, remaining))
+        if message["type"] == "http.disconnect":
+            deadline.disconnected = True
+    except asyncio.TimeoutError:
+        pass
+    deadline.ended.set()
+
+
+async def wait(awaitable):
+    """Awaits awaitable unless the current deadline ends first (DeadlineExceeded)."""
+    deadline = _current.get()
+    if deadline is None:
+        return await awaitable
+    if deadline.reason() is not None:
+        awaitable.close()
+        deadline.check()
+    task = asyncio.ensure_future(awaitable)
+    ended = asyncio.ensure_future(deadline.ended.wait())
+    try:
+        await asyncio.wait({task, ended}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        ended.cancel()
+        if not task.done():
+            task.cancel()
+    if not task.cancelled() and task.done():
+        return task.result()
+    deadline.check()
+    raise DeadlineExceeded(deadline.reason() or "timeout")
+
+
+async def limit(awaitable, deadline):
+    """awaitable cut off at the deadline's time limit; for coroutines run outside the request's context."""
+    if deadline is None or deadline.expires is None:
+        return await awaitable
+    if deadline.reason() is not None:
+        awaitable.close()
+        deadline.check()
+    try:
+        return await asyncio.wait_for(awaitable, timeout=max(0.0, deadline.remaining()))
+    except asyncio.TimeoutError:
+        deadline.exceeded = "timeout"
+        raise DeadlineExceeded("timeout")
@@ -0,0 +1,81 @@
+# dedup.py
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+from prometheus_client import Counter, Gauge
+from starlette.concurrency import run_in_threadpool
+
+DUPLICATES_REJECTED = Counter("quizmaker_duplicate_questions_rejected_total", "Generated questions rejected as near-duplicates")
+ACTIVE_SESSIONS = Gauge("quizmaker_active_sessions", "Sessions with recent quiz history")
+
+
+class QuestionDeduplicator:
+    """Rejects questions whose embedding is too close to another question in
+    the same quiz or in the session's recent quizzes."""
+
+    def __init__(self, embed_texts, threshold: float, history_quizzes: int, max_sessions: int):
+        self.embed_texts = embed_texts
+        self.threshold = threshold
+        self.history_quizzes = history_quizzes
+        self.max_sessions = max_sessions
+        self._history = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _embed(self, texts):
+        vectors = np.asarray(self.embed_texts(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _recent(self, session_id):
+        with self._lock:
+            return list(self._history.get(session_id, ()))
+
+    def split(self, session_id, questions, accepted_vectors):
+        """Returns (kept, kept_vectors, rejected) where rejected holds (question, vector) pairs.
+
+        accepted_vectors are questions already kept for the current quiz.
+        """
+        if not questions:
+            return [], [], []
+        vectors = self._embed([q["text"] for q in questions])
+        dim = vectors.shape[1]
+        reference = np.concatenate(self._recent(session_id) + [np.asarray(accepted_vectors, dtype=np.float32).reshape(-1, dim)])
+        kept, kept_vectors, rejected = [], [], []
+        for q, v in zip(questions, vectors):
+            pool = np.concatenate([reference, np.asarray(kept_vectors, dtype=np.float32).reshape(-1, dim)])
+            if len(pool) and float(np.max(pool @ v)) >= self.threshold:
+                rejected.append((q, v))
+            else:
+                kept.append(q)
+                kept_vectors.append(v)
+        DUPLICATES_REJECTED.inc(len(rejected))
+        return kept, kept_vectors, rejected
+
+    def remember(self, session_id, vectors):
+        if not len(vectors):
+            return
+        with self._lock:
+            quizzes = self._history.pop(session_id, None) or deque(maxlen=self.history_quizzes)
+            quizzes.append(np.asarray(vectors, dtype=np.float32))
+            self._history[session_id] = quizzes
+            while len(self._history) > self.max_sessions:
+                self._history.popitem(last=False)
+            ACTIVE_SESSIONS.set(len(self._history))
+
+
+async def deduplicate(deduplicator: QuestionDeduplicator, session_id, questions, generate, max_rounds: int):
+    """Filters near-duplicates and asks generate(count) only for replacements of
+    the rejected questions. Rejections left after max_rounds are kept so the
+    quiz still has the requested length."""
+    kept, vectors, rejected = await run_in_threadpool(deduplicator.split, session_id, questions, [])
+    for _ in range(max_rounds):
+        if not rejected:
+            break
+        replacements = await generate(len(rejected))
+        new_kept, new_vectors, rejected = await run_in_threadpool(deduplicator.split, session_id, replacements, vectors)
+        kept += new_kept
+        vectors += new_vectors
+    kept += [q for q, _ in rejected]
+    vectors += [v for _, v in rejected]
+    deduplicator.remember(session_id, vectors)
+    return kept
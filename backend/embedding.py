@@ -0,0 +1,64 @@
+# embedding.py
+import threading
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from metrics import track_stage
+from batching import AdaptiveBatcher
+from embedding_pool import EmbeddingPool
+from metrics import record_fallback
+from cpu_resources import resources
+import config
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+_embeddings = None
+_pool = None
+_lock = threading.Lock()
+# the embedding model runs on the CPU
+_batcher = AdaptiveBatcher("embed", config.EMBED_BATCH_SIZE, config.EMBED_BATCH_MAX, device="cpu")
+
+def get_embeddings():
+    # loaded once and shared by ingest, retrieval and question deduplication
+    global _embeddings
+    with _lock:
+        if _embeddings is None:
+            with track_stage("embedding_model_load"):
+                _embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    return _embeddings
+
+def embed_texts(texts):
+    with resources.stage("embedding"):
+        return _batcher.run(texts, get_embeddings().embed_documents)
+
+def get_pool():
+    # worker processes for large ingests, started on first use when EMBED_WORKERS > 0
+    global _pool
+    client = get_embeddings().client
+    with _lock:
+        if _pool is None:
+            threads, cores = resources.worker_settings(config.EMBED_WORKERS)
+            _pool = EmbeddingPool(
+                EMBEDDING_MODEL_NAME,
+                client.tokenizer,
+                client.max_seq_length,
+                config.EMBED_WORKERS,
+                threads=config.EMBED_WORKER_THREADS or threads,
+                cores=cores,
+                batch_tokens=config.EMBED_POOL_BATCH_TOKENS,
+            )
+    return _pool
+
+def embed_chunks(texts):
+    """Vectors of a document's chunks, in chunk order. Large documents go to the worker pool."""
+    if config.EMBED_WORKERS > 0 and len(texts) >= config.EMBED_POOL_MIN_CHUNKS:
+        try:
+            return get_pool().embed(texts)
+        except Exception as e:
+            record_fallback("embed", "pool_error", str(e))
+    return embed_texts(texts)
+
+def close_pool():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
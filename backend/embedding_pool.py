@@ -0,0 +1,87 @@
+# embedding_pool.py
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from prometheus_client import Counter
+
+POOL_BATCHES = Counter("quizmaker_embed_pool_batches_total", "Chunk batches encoded by the embedding worker processes")
+POOL_PADDING = Counter("quizmaker_embed_pool_padding_tokens_total", "Padding tokens in the batches sent to the embedding workers")
+
+# set in each worker process by _init_worker
+_model = None
+
+
+def _init_worker(model_name, threads, cores):
+    global _model
+    import os, torch
+    from sentence_transformers import SentenceTransformer
+    if cores:
+        os.sched_setaffinity(0, cores)
+    # each worker gets its own cores instead of every process using all of them
+    torch.set_num_threads(threads)
+    _model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode(texts):
+    return _model.encode(texts, batch_size=len(texts), convert_to_numpy=True).astype(np.float32)
+
+
+def token_batches(lengths, max_tokens):
+    """Index batches of about max_tokens padded tokens, each holding texts of similar length."""
+    batches, batch = [], []
+    for i in np.argsort(lengths, kind="stable"):
+        # in length order each text is the longest of its batch so far
+        if batch and int(lengths[i]) * (len(batch) + 1) > max_tokens:
+            batches.append(batch)
+            batch = []
+        batch.append(int(i))
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class EmbeddingPool:
+    """Encodes chunks on worker processes, one model copy and `threads` torch threads each.
+
+    Chunks are sorted by token length and cut into batches of about
+    `batch_tokens` padded tokens, so short chunks are not padded to long ones;
+    the vectors come back in the order of the chunks.
+    """
+
+    def __init__(self, model_name, tokenizer, max_length, workers, threads=1, batch_tokens=8192, cores=None):
+        self.tokenizer = tokenizer
+        # the model truncates longer texts
+        self.max_length = max_length
+        self.workers = workers
+        self.batch_tokens = batch_tokens
+        # spawned rather than forked: the parent's torch threads and locks do not survive a fork
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, threads, cores),
+        )
+
+    def lengths(self, texts):
+        ids = self.tokenizer(list(texts), truncation=True, max_length=self.max_length).input_ids
+        return np.array([len(row) for row in ids])
+
+    def embed(self, texts):
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        lengths = self.lengths(texts)
+        batches = token_batches(lengths, self.batch_tokens)
+        futures = [self._executor.submit(_encode, [texts[i] for i in batch]) for batch in batches]
+        vectors = None
+        for batch, future in zip(batches, futures):
+            result = future.result()
+            if vectors is None:
+                vectors = np.empty((len(texts), result.shape[1]), dtype=np.float32)
+            vectors[batch] = result
+            POOL_BATCHES.inc()
+            POOL_PADDING.inc(int(lengths[batch].max() * len(batch) - lengths[batch].sum()))
+        return vectors
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,72 @@
+# generation_profiles.py
+import re
+import config
+
+
+class StopRule:
+    """Ends generation once the reply so far is complete and trims it to that point."""
+
+    def end(self, text: str):
+        """Index where the reply is complete, or None to keep generating."""
+        raise NotImplementedError
+
+    def trim(self, text: str) -> str:
+        end = self.end(text)
+        return (text if end is None else text[:end]).strip()
+
+
+class QuestionStop(StopRule):
+    # the question ends at its first "?"; a newline does not end it, since models
+    # often write a preamble line ("Here is a question:") first
+    def end(self, text):
+        match = re.search(r"\?", text)
+        return match.end() if match else None
+
+    def trim(self, text):
+        lines = [line.strip() for line in super().trim(text).splitlines() if line.strip()]
+        if not lines:
+            return ""
+        if lines[-1].endswith("?"):
+            # the lines before the one holding the "?" are preamble
+            return lines[-1]
+        # no "?" within max_new_tokens: the first line that does not introduce the question
+        return next((line for line in lines if not line.endswith(":")), lines[0])
+
+
+class NumberStop(StopRule):
+    # the score is the first standalone 0-5, not part of a range ("0-5") or a larger
+    # number; a following character shows it is complete, "/5" is allowed after it
+    SCORE = r"(?<![\d.\-/])[0-5](?:\.\d+)?"
+    COMPLETE = r"(?=[^\d\-/.]|\.\D|\s*/\s*5(?!\d))"
+
+    def end(self, text):
+        match = re.search(self.SCORE + self.COMPLETE, text)
+        return match.end() if match else None
+
+    def trim(self, text):
+        # just the score; at the end of the finished reply it is complete too
+        match = re.search(self.SCORE + r"(?:" + self.COMPLETE + r"|(?=\.?$))", text)
+        return match.group() if match else text.strip()
+
+
+SAMPLING = {"do_sample": True, "temperature": 0.6, "top_p": 0.9}
+
+PROFILES = {
+    "question": {"max_new_tokens": config.GENERATION_QUESTION_MAX_NEW_TOKENS, "sampling": SAMPLING, "stop": QuestionStop()},
+    "score": {"max_new_tokens": config.GENERATION_SCORE_MAX_NEW_TOKENS, "sampling": SAMPLING, "stop": NumberStop()},
+    "topic": {"max_new_tokens": config.GENERATION_TOPIC_MAX_NEW_TOKENS, "sampling": SAMPLING, "stop": None},
+}
+
+
+def generation_settings(profile: str, sample: bool = True):
+    """Keyword arguments for an LLMBackend call with the named profile.
+
+    sample=False decodes greedily (the flan processor); stop is handled by the
+    backend.
+    """
+    settings = PROFILES[profile]
+    generation = {"max_new_tokens": settings["max_new_tokens"]}
+    generation.update(settings["sampling"] if sample else {"do_sample": False})
+    if settings["stop"] is not None and config.GENERATION_STOP_ENABLED:
+        generation["stop"] = settings["stop"]
+    return generation
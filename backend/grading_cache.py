@@ -0,0 +1,63 @@
+# grading_cache.py
+import re, threading, time
+from collections import OrderedDict
+from prometheus_client import Counter, Gauge
+import config
+
+CACHE_LOOKUPS = Counter("quizmaker_grading_cache_lookups_total", "Grading cache lookups", ["result"])
+CACHE_ENTRIES = Gauge("quizmaker_grading_cache_entries", "Graded answers held in the grading cache")
+
+# answers that all mean "no answer" share one cache entry per question
+NON_ANSWERS = {"", "i dont know", "idk", "dont know", "no idea", "not sure", "i have no idea", "pass"}
+
+
+def normalize(text) -> str:
+    text = re.sub(r"\s+", " ", (text or "").lower()).strip()
+    text = text.replace("'", "").replace("’", "").strip(" .!?,;:")
+    return "" if text in NON_ANSWERS else text
+
+
+class GradingCache:
+    """LRU cache of graded answers with a TTL.
+
+    Keys are (document id, normalized question text, normalized answer);
+    question ids are positions within a quiz, so the text is what identifies
+    a question across quizzes. Values are {"score": float, "topic": str}.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(document_id, question_text, answer_text):
+        return (document_id or "", normalize(question_text), normalize(answer_text))
+
+    def get(self, key):
+        if not config.GRADING_CACHE_ENABLED:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+            CACHE_ENTRIES.set(len(self._entries))
+        CACHE_LOOKUPS.labels("hit" if entry is not None else "miss").inc()
+        return entry[1] if entry is not None else None
+
+    def put(self, key, value):
+        if not config.GRADING_CACHE_ENABLED:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            CACHE_ENTRIES.set(len(self._entries))
+
+
+grading_cache = GradingCache(config.GRADING_CACHE_SIZE, config.GRADING_CACHE_TTL_SECONDS)
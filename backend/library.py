@@ -0,0 +1,317 @@
+# library.py
+import PyPDF2, os, hashlib, threading
+from collections import OrderedDict
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from starlette.concurrency import run_in_threadpool
+from metrics import track_stage, ACTIVE_DOCUMENTS, DOCUMENT_CHUNKS
+from embedding import get_embeddings, embed_chunks, EMBEDDING_MODEL_NAME
+from vector_index import build_vectorstore, index_nbytes, vector_nbytes
+from chunk_store import ChunkText, PackedArrays
+from text_cleaning import clean_pages, score_chunks
+from profiling import profiled
+from cpu_resources import resources, staged
+from upload_storage import storage, ARTIFACT_REUSE
+import config
+
+DEFAULT_COLLECTION = "default"
+
+
+class DocumentShard:
+    """One uploaded document: its chunks, their prompt token ids and its own vector index.
+
+    chunks is a ChunkText over the document text and chunk_tokens a
+    PackedArrays; the embeddings live only in the index (and the upload storage).
+    """
+
+    def __init__(self, document_id, filename, file_path, chunks, chunk_tokens, vectorstore,
+                 chunk_weights=None, cleaning=None):
+        self.document_id = document_id
+        self.filename = filename
+        self.file_path = file_path
+        self.chunks = chunks
+        self.chunk_tokens = chunk_tokens
+        self.vectorstore = vectorstore
+        # information scores of the kept chunks, used as sampling weights
+        self.chunk_weights = chunk_weights if chunk_weights is not None else np.ones(len(chunks), dtype=np.float32)
+        # what the cleaning stage removed: {"lines": {reason: count}, "chunks": count}
+        self.cleaning = cleaning or {}
+
+    def memory(self):
+        vectors = vector_nbytes(self.vectorstore.index)
+        return {
+            "text": self.chunks.nbytes,
+            "tokens": self.chunk_tokens.nbytes,
+            # codes stored in the index, then the rest of it (graph, lists, quantizers)
+            "vectors": vectors,
+            "index": index_nbytes(self.vectorstore.index) - vectors,
+        }
+
+
+class Library:
+    """All indexed documents, grouped into named collections.
+
+    Every document keeps its own index shard; queries over several documents
+    search each shard and merge the hits, so nothing is re-embedded when the
+    selection changes. A session is the list of document ids uploaded with
+    its X-Session-Id, searched through the same shards.
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self.collections = {}
+        self.latest_document_id = None
+        self.sessions = OrderedDict()
+        self._lock = threading.RLock()
+
+    def add(self, shard: DocumentShard, collection: str = DEFAULT_COLLECTION):
+        with self._lock:
+            # the id is a content hash, so uploading the same file again replaces its shard
+            self.documents[shard.document_id] = shard
+            ids = self.collections.setdefault(collection, [])
+            if shard.document_id not in ids:
+                ids.append(shard.document_id)
+            self.latest_document_id = shard.document_id
+            self._update_metrics()
+
+    def remove(self, document_id):
+        with self._lock:
+            shard = self.documents.pop(document_id, None)
+            for ids in self.collections.values():
+                if document_id in ids:
+                    ids.remove(document_id)
+            if self.latest_document_id == document_id:
+                self.latest_document_id = None
+            for ids in self.sessions.values():
+                if document_id in ids:
+                    ids.remove(document_id)
+            self._update_metrics()
+        return shard
+
+    def _update_metrics(self):
+        ACTIVE_DOCUMENTS.set(len(self.documents))
+        DOCUMENT_CHUNKS.set(sum(len(shard.chunks) for shard in self.documents.values()))
+
+    def memory_report(self):
+        """Approximate bytes held per document and per session."""
+        with self._lock:
+            documents = {document_id: shard.memory() for document_id, shard in self.documents.items()}
+            sessions = {
+                session_id: {
+                    "documents": list(ids),
+                    "total": sum(sum(documents[d].values()) for d in ids if d in documents),
+                }
+                for session_id, ids in self.sessions.items()
+            }
+        return {"documents": documents, "sessions": sessions}
+
+    def add_to_session(self, session_id, shard: DocumentShard):
+        with self._lock:
+            ids = self.sessions.pop(session_id, None) or []
+            self.sessions[session_id] = ids
+            while len(self.sessions) > config.LIBRARY_MAX_SESSIONS:
+                self.sessions.popitem(last=False)
+            if shard.document_id not in ids:
+                ids.append(shard.document_id)
+
+    def remove_from_session(self, session_id, document_id) -> bool:
+        with self._lock:
+            ids = self.sessions.get(session_id)
+            if ids is None or document_id not in ids:
+                return False
+            ids.remove(document_id)
+            return True
+
+    def select(self, document_ids=None, collection=None, session_id=None):
+        """Shards for explicit document ids (a list, even empty), else a collection,
+        else the session's documents, else the latest upload.
+
+        A session whose documents were all removed selects nothing rather than
+        falling back to the latest upload, which may be someone else's.
+        """
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if document_ids is not None:
+                ids = document_ids
+            elif collection:
+                ids = self.collections.get(collection, [])
+            elif session is not None:
+                ids = list(session)
+            elif self.latest_document_id:
+                ids = [self.latest_document_id]
+            else:
+                ids = []
+            return [self.documents[i] for i in ids if i in self.documents]
+
+    def describe(self):
+        with self._lock:
+            return {
+                name: [
+                    {
+                        "id": i,
+                        "filename": self.documents[i].filename,
+                        "chunks": len(self.documents[i].chunks),
+                        "removed": self.documents[i].cleaning,
+                    }
+                    for i in ids if i in self.documents
+                ]
+                for name, ids in self.collections.items()
+            }
+
+    @staticmethod
+    def sample_chunks(shards, count: int):
+        # over all chunks of the selected documents, weighted by information score
+        refs = [(shard, chunk_id) for shard in shards for chunk_id in range(len(shard.chunks))]
+        if not refs:
+            return []
+        weights = np.concatenate([shard.chunk_weights for shard in shards]).astype(np.float64)
+        if weights.sum() <= 0:
+            weights = np.ones(len(refs))
+        size = min(count, int(np.count_nonzero(weights)))
+        picked = np.random.choice(len(refs), size=size, replace=False, p=weights / weights.sum())
+        return [refs[i] for i in picked]
+
+    def search(self, query: str, shards, k: int):
+        """Top-k chunks over several shards as (shard, Document, distance), nearest first."""
+        with track_stage("retrieval"), resources.stage("retrieval"):
+            embedding = get_embeddings().embed_query(query)
+            hits = []
+            for shard in shards:
+                for doc, score in shard.vectorstore.similarity_search_with_score_by_vector(embedding, k=k):
+                    hits.append((shard, doc, score))
+            hits.sort(key=lambda hit: hit[2])
+        return hits[:k]
+
+
+library = Library()
+
+
+def extract_pages_from_pdf(file_path):
+    pages = []
+    try:
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            for page_num in range(len(pdf_reader.pages)):
+                page = pdf_reader.pages[page_num]
+                pages.append(page.extract_text())
+    except Exception as e:
+        print(f"Error extracting text from PDF: {str(e)}")
+        pages = []
+    return pages
+
+
+def ingest_pdf(file_path, filename, prompt_builder):
+    with track_stage("pdf_extract"):
+        pages = extract_pages_from_pdf(file_path)
+    document_id = hashlib.sha1("".join(pages).encode("utf-8")).hexdigest()
+    tokenizer_name = getattr(prompt_builder.tokenizer, "name_or_path", type(prompt_builder.tokenizer).__name__)
+
+    stored = storage.load(document_id, tokenizer_name, EMBEDDING_MODEL_NAME)
+    if stored is not None:
+        return load_stored(document_id, filename, stored)
+
+    # raises StorageFull when old uploads cannot be evicted to make room
+    reserved = storage.reserve(document_id, filename, os.path.getsize(file_path))
+    try:
+        return ingest_pages(document_id, pages, file_path, filename, prompt_builder, tokenizer_name)
+    except BaseException:
+        if reserved:
+            storage.release(document_id)
+        raise
+
+
+def ingest_pages(document_id, pages, file_path, filename, prompt_builder, tokenizer_name):
+    with track_stage("clean"):
+        document_text, lines_removed = clean_pages(pages)
+    if not document_text.strip():
+        raise ValueError("No text could be extracted from the PDF")
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        length_function=len,
+        add_start_index=True
+    )
+    with track_stage("split"):
+        # chunks are kept as spans of the document text rather than separate strings
+        spans = [(doc.metadata["start_index"], len(doc.page_content)) for doc in text_splitter.create_documents([document_text])]
+        chunks = ChunkText(document_text, [start for start, _ in spans], [start + length for start, length in spans])
+
+    with track_stage("clean"):
+        # low-information chunks (tables, indexes, reference lists) are not embedded or sampled
+        keep, chunk_scores = score_chunks(list(chunks))
+        if not keep.any():
+            # better an unclean document than none at all
+            keep[:] = True
+            chunk_scores[:] = 1.0
+        chunks = ChunkText(document_text, chunks.starts[keep], chunks.ends[keep])
+        text_chunks = list(chunks)
+    cleaning = {"lines": lines_removed, "chunks": int((~keep).sum())}
+
+    with track_stage("tokenize"):
+        chunk_tokens = PackedArrays.from_arrays(prompt_builder.tokenize_chunks(text_chunks))
+
+    embeddings = get_embeddings()
+
+    with track_stage("embed"):
+        chunk_vectors = embed_chunks(text_chunks)
+
+    vectors = np.asarray(chunk_vectors, dtype=np.float16)
+    with track_stage("index_build"):
+        vectorstore = build_vectorstore(
+            chunks,
+            chunk_vectors,
+            embeddings,
+            metadatas=[{"chunk_id": i} for i in range(len(text_chunks))]
+        )
+
+    print(f"Processed {filename} into {len(text_chunks)} chunks and created vector store "
+          f"(removed {sum(lines_removed.values())} boilerplate lines, {cleaning['chunks']} low-information chunks)")
+    shard = DocumentShard(document_id, filename, file_path, chunks, chunk_tokens, vectorstore,
+                          chunk_weights=chunk_scores[keep], cleaning=cleaning)
+    with track_stage("store_artifacts"):
+        shard.file_path = storage.save(document_id, filename, file_path, document_text, {
+            "starts": chunks.starts,
+            "ends": chunks.ends,
+            "token_values": chunk_tokens.values,
+            "token_offsets": chunk_tokens.offsets,
+            "vectors": vectors,
+            "weights": shard.chunk_weights,
+        }, tokenizer_name, EMBEDDING_MODEL_NAME, cleaning)
+    return shard
+
+
+def load_stored(document_id, filename, stored):
+    """Shard of a document uploaded before, from its stored artifacts: only the index is rebuilt."""
+    text, arrays, cleaning, pdf_path = stored
+    chunks = ChunkText(text, arrays["starts"], arrays["ends"])
+    with track_stage("index_build"):
+        vectorstore = build_vectorstore(
+            chunks,
+            arrays["vectors"].astype(np.float32),
+            get_embeddings(),
+            metadatas=[{"chunk_id": i} for i in range(len(chunks))]
+        )
+    ARTIFACT_REUSE.inc()
+    print(f"Loaded {filename} ({len(chunks)} chunks) from stored artifacts")
+    return DocumentShard(document_id, filename, pdf_path, chunks, PackedArrays(arrays["token_values"], arrays["token_offsets"]),
+                         vectorstore, chunk_weights=arrays["weights"], cleaning=cleaning)
+
+
+async def save_upload(file, prompt_builder, collection=DEFAULT_COLLECTION, session_id=None):
+    contents = await file.read()
+
+    # written to a temporary name; ingest moves it under the document id
+    file_path = storage.temp_path(os.path.splitext(file.filename)[1])
+    with open(file_path, "wb") as buffer:
+        buffer.write(contents)
+
+    try:
+        shard = await run_in_threadpool(staged, "embedding", profiled, ingest_pdf, file_path, file.filename, prompt_builder)
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    library.add(shard, collection)
+    if session_id is not None:
+        library.add_to_session(session_id, shard)
+    return shard
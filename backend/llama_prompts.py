@@ -0,0 +1,49 @@
+# llama_prompts.py
+# Prompt templates of the llama processor, kept free of model loading so the
+# benchmarks can build the same prompts. The whitespace inside the grading
+# prompts is what the model has always been sent.
+
+SYSTEM_PROMPT = "You are a helpful chatbot who generates flashcard-like quiz questions."
+# every question prompt, and so every grading dialogue, starts with this
+PROMPT_HEAD = "Consider the following excerpt, which is surrounded by lines of \"###\":\n###\n"
+
+CATEGORY_PROMPTS = {
+    "Explain Concept": "Generate a question asking to explain a concept from this excerpt",
+    "Definition": "Generate a question asking for a definition from this excerpt",
+    "Application": "Generate a question about applying concepts from this excerpt",
+    "Compare/Contrast": "Generate a question comparing or contrasting ideas from this excerpt"
+}
+
+QUESTION_TEMPLATE = PROMPT_HEAD + "{text}\n###\n{category}. Do not print anything else. Do not mention the excerpt, the text, or the author. The question should be standalone."
+TAILORED_QUESTION_TEMPLATE = PROMPT_HEAD + "{text}\n###\n{category}. The question should be focused on one of the listed topcs:\n{weaknesses}\n Do not print anything else. Do not mention the excerpt, the text, or the author. The question should be standalone."
+
+SCORE_PROMPT = """
+            This is my answer:
+            {answer_text}
+            
+            Evaluate the answer on a scale from 0 to 5, where:
+            0: Completely incorrect or irrelevant
+            1: Mostly incorrect with minor relevant elements
+            2: Partially correct but missing key information
+            3: Mostly correct with minor errors or omissions
+            4: Correct but could be more comprehensive
+            5: Completely correct and comprehensive
+            
+            Return only the numeric score.
+            """
+
+TOPIC_PROMPT = """
+                What specific field of study would you say this topic is in? {existing}Just print the field of study and nothing else.
+                """
+TOPIC_EXISTING = "This is a list of idenitified topics:\n{categories}\nIf the field of study matches one of these, print the element exactly. Otherwise, list its field of study. "
+
+
+def score_prompt(answer_text):
+    return SCORE_PROMPT.format(answer_text=answer_text)
+
+
+def topic_prompt(topics):
+    """Topic question after a score; topics already identified in this evaluation are offered to reuse."""
+    existing = '' if len(topics) == 0 else \
+        TOPIC_EXISTING.format(categories='- ' + '\n- '.join(c for c in topics))
+    return TOPIC_PROMPT.format(existing=existing)
@@ -0,0 +1,402 @@
+# llm_backend.py
+import asyncio, random, re, threading, time
+import httpx
+import config
+import deadlines
+from metrics import GenerationTimer, record_llm_batch, record_llm_call, record_remote_llm_call
+from batching import AdaptiveBatcher
+from prefix_cache import PrefixCache, PREFIX_TOKENS_REUSED
+
+
+class LLMBackend:
+    """Runs chat or plain completions. Processors own the prompts and parse the replies.
+
+    Generation settings use transformers names (max_new_tokens, do_sample,
+    temperature, top_p, ...) whatever the backend.
+    """
+
+    # set by backends that load the model's tokenizer themselves
+    tokenizer = None
+
+    def chat(self, messages, task="chat", **generation) -> str:
+        raise NotImplementedError
+
+    def complete(self, prompt, task="complete", **generation) -> str:
+        raise NotImplementedError
+
+    # batch calls return the reply or the exception for each item, so one bad
+    # item does not lose the rest
+    def chat_batch(self, batch, task="chat", **generation):
+        return [self._try(self.chat, messages, task, generation) for messages in batch]
+
+    def complete_batch(self, prompts, task="complete", **generation):
+        return [self._try(self.complete, prompt, task, generation) for prompt in prompts]
+
+    @staticmethod
+    def _try(fn, item, task, generation):
+        exceeded = deadlines.exceeded()
+        if exceeded is not None:
+            return exceeded
+        try:
+            return fn(item, task, **generation)
+        except Exception as e:
+            return e
+
+    def share_prefix(self, messages) -> int:
+        """Declares messages (the last one possibly only its start) that many prompts
+        begin with. Backends that can, prefill them once; returns the cached tokens."""
+        return 0
+
+    def close(self):
+        pass
+
+
+class _StopCriteria:
+    """transformers stopping criterion that applies a generation profile's StopRule to each decoded reply."""
+
+    def __init__(self, rule, tokenizer, timer=None):
+        self.rule = rule
+        self.tokenizer = tokenizer
+        # the timer's streamer sees the prompt ids; batched calls have no streamer and
+        # take the prompt length from the first call, which follows the first new token
+        self.timer = timer
+        self.prompt_length = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        if self.prompt_length is None:
+            self.prompt_length = self.timer.prompt_length if self.timer is not None else input_ids.shape[-1] - 1
+        texts = self.tokenizer.batch_decode(input_ids[:, self.prompt_length:], skip_special_tokens=True)
+        done = [self.rule.end(text) is not None for text in texts]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+class LocalPipelineBackend(LLMBackend):
+    def __init__(self, model, tokenizer, task_type, assistant_model=None, **pipeline_kwargs):
+        from transformers import pipeline
+        self.pipe = pipeline(task_type, model=model, tokenizer=tokenizer, **pipeline_kwargs)
+        self.tokenizer = tokenizer
+        # small draft model with the same tokenizer for assisted (speculative) decoding
+        self.assistant_model = assistant_model
+        # key/values of the static prompt prefixes; assisted decoding prefills from scratch
+        self.prefix_cache = None
+        if config.LLM_PREFIX_CACHE_ENABLED and task_type == "text-generation" and assistant_model is None:
+            self.prefix_cache = PrefixCache(self.pipe.model, tokenizer)
+        self.seq2seq = task_type == "text2text-generation"
+        self.terminators = [tokenizer.eos_token_id]
+        if "<|eot_id|>" in tokenizer.get_vocab():
+            self.terminators.append(tokenizer.convert_tokens_to_ids("<|eot_id|>"))
+        if not self.seq2seq:
+            # batched prompts are padded on the left so replies start at the same position
+            if tokenizer.pad_token_id is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            tokenizer.padding_side = "left"
+        # assisted generation only runs one sequence at a time
+        self.batcher = AdaptiveBatcher(
+            "llm",
+            config.LLM_BATCH_SIZE,
+            1 if assistant_model is not None else config.LLM_BATCH_MAX,
+        )
+
+    def share_prefix(self, messages):
+        if self.prefix_cache is None:
+            return 0
+        tokens = self.prefix_cache.add(messages)
+        print(f"Cached {tokens} prompt prefix tokens")
+        return tokens
+
+    def _count_prompt(self, item):
+        if isinstance(item, list):
+            return len(self.tokenizer.apply_chat_template(item, add_generation_prompt=True))
+        return len(self.tokenizer(item).input_ids)
+
+    def _generate(self, batch, task, generation, chat):
+        generation = dict(generation)
+        stop = generation.pop("stop", None)
+        if stop is not None:
+            from transformers import StoppingCriteriaList
+        if not self.seq2seq:
+            generation.setdefault("eos_token_id", self.terminators)
+            generation.setdefault("pad_token_id", self.tokenizer.eos_token_id)
+            if not chat:
+                generation.setdefault("return_full_text", False)
+        rows = None
+        if chat and self.prefix_cache is not None and self.prefix_cache.prefixes:
+            rows = [self.tokenizer.apply_chat_template(messages, add_generation_prompt=True) for messages in batch]
+        if len(batch) == 1:
+            # the streamer only sees decoder ids for seq2seq models
+            timer = GenerationTimer(task, tokens_in=self._count_prompt(batch[0]) if self.seq2seq else None)
+            generation["streamer"] = timer
+            if self.assistant_model is not None:
+                generation.setdefault("assistant_model", self.assistant_model)
+            if stop is not None:
+                generation["stopping_criteria"] = StoppingCriteriaList([_StopCriteria(stop, self.tokenizer, timer)])
+        elif stop is not None:
+            generation["stopping_criteria"] = StoppingCriteriaList([_StopCriteria(stop, self.tokenizer)])
+        start = time.perf_counter()
+        prefix = self.prefix_cache.match(rows) if rows is not None else None
+        if prefix is not None:
+            replies = self._generate_from_prefix(rows, prefix, generation)
+            PREFIX_TOKENS_REUSED.labels(task).inc(prefix[0] * len(batch))
+        elif len(batch) == 1:
+            replies = [self.pipe(batch[0], **generation)[0]["generated_text"]]
+        else:
+            # text-generation returns a list of sequences per prompt, text2text-generation one dict
+            replies = [
+                (output[0] if isinstance(output, list) else output)["generated_text"]
+                for output in self.pipe(batch, batch_size=len(batch), **generation)
+            ]
+        seconds = time.perf_counter() - start
+        if chat and prefix is None:
+            replies = [reply[-1]["content"] for reply in replies]
+        if len(batch) > 1:
+            tokens_out = sum(len(self.tokenizer(reply, add_special_tokens=False).input_ids) for reply in replies)
+            record_llm_batch(task, sum(self._count_prompt(item) for item in batch), tokens_out, len(batch), seconds)
+        return [reply if stop is None else stop.trim(reply) for reply in replies]
+
+    def _generate_from_prefix(self, rows, prefix, generation):
+        """Generates from prompt ids whose first length tokens are in the cached prefix.
+
+        The rest of each prompt is padded between the prefix and itself, so the
+        prefix keeps the positions it was cached at for every row of the batch;
+        the attention mask hides the padding and positions follow the mask.
+        """
+        import torch
+        length, cache = prefix
+        tails = [row[length:] for row in rows]
+        width = max(len(tail) for tail in tails)
+        pad = self.tokenizer.pad_token_id
+        input_ids = [row[:length] + [pad] * (width - len(tail)) + tail for row, tail in zip(rows, tails)]
+        attention_mask = [[1] * length + [0] * (width - len(tail)) + [1] * len(tail) for tail in tails]
+        model = self.pipe.model
+        with torch.no_grad():
+            output = model.generate(
+                input_ids=torch.tensor(input_ids, device=model.device),
+                attention_mask=torch.tensor(attention_mask, device=model.device),
+                past_key_values=self.prefix_cache.expand(cache, length, len(rows)),
+                **generation,
+            )
+        return self.tokenizer.batch_decode(output[:, length + width:], skip_special_tokens=True)
+
+    def chat(self, messages, task="chat", **generation):
+        return self._generate([messages], task, generation, chat=True)[0]
+
+    def complete(self, prompt, task="complete", **generation):
+        return self._generate([prompt], task, generation, chat=False)[0]
+
+    # batches are sized by the adaptive batcher; an item that fails on its own gets its exception
+    def chat_batch(self, batch, task="chat", **generation):
+        return self.batcher.run(batch, lambda items: self._generate(items, task, generation, chat=True), isolate_errors=True)
+
+    def complete_batch(self, prompts, task="complete", **generation):
+        return self.batcher.run(prompts, lambda items: self._generate(items, task, generation, chat=False), isolate_errors=True)
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    def __init__(self, base_url, model, api_key="", timeout=60.0, connect_timeout=5.0,
+                 max_connections=16, max_keepalive=8, max_concurrency=8):
+        self.model = model
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # the pooled client lives on its own loop so sync callers in worker
+        # threads all share the same keep-alive connections
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-http", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls):
+        return cls(
+            config.LLM_BASE_URL,
+            config.LLM_MODEL,
+            api_key=config.LLM_API_KEY,
+            timeout=config.LLM_TIMEOUT,
+            connect_timeout=config.LLM_CONNECT_TIMEOUT,
+            max_connections=config.LLM_MAX_CONNECTIONS,
+            max_keepalive=config.LLM_MAX_KEEPALIVE,
+            max_concurrency=config.LLM_MAX_CONCURRENCY,
+        )
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def _payload(self, generation):
+        # stop rules are applied to the finished reply; OpenAI stop strings cannot express them
+        generation.pop("stop", None)
+        payload = {"model": self.model}
+        max_tokens = generation.get("max_new_tokens", generation.get("max_length"))
+        if max_tokens:
+            payload["max_tokens"] = max_tokens
+        if generation.get("do_sample", True):
+            for key in ("temperature", "top_p"):
+                if key in generation:
+                    payload[key] = generation[key]
+        else:
+            payload["temperature"] = 0
+        return payload
+
+    async def _post(self, path, payload, task):
+        async with self._semaphore:
+            start = time.perf_counter()
+            response = await self._client.post(path, json=payload)
+            response.raise_for_status()
+            body = response.json()
+        usage = body.get("usage") or {}
+        record_remote_llm_call(task, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), time.perf_counter() - start)
+        return body
+
+    @staticmethod
+    def _trim(text, stop):
+        return text if stop is None else stop.trim(text)
+
+    async def achat(self, messages, task="chat", **generation):
+        stop = generation.get("stop")
+        payload = self._payload(generation)
+        payload["messages"] = messages
+        body = await self._post("/chat/completions", payload, task)
+        return self._trim(body["choices"][0]["message"]["content"], stop)
+
+    async def acomplete(self, prompt, task="complete", **generation):
+        stop = generation.get("stop")
+        payload = self._payload(generation)
+        payload["prompt"] = prompt
+        body = await self._post("/completions", payload, task)
+        return self._trim(body["choices"][0]["text"], stop)
+
+    def chat(self, messages, task="chat", **generation):
+        return self._submit(self.achat(messages, task, **generation))
+
+    def complete(self, prompt, task="complete", **generation):
+        return self._submit(self.acomplete(prompt, task, **generation))
+
+    def chat_batch(self, batch, task="chat", **generation):
+        # the client's loop does not see the request's context, so the deadline is passed in
+        deadline = deadlines.current()
+        async def run_all():
+            return await asyncio.gather(*(deadlines.limit(self.achat(m, task, **generation), deadline) for m in batch), return_exceptions=True)
+        return self._submit(run_all())
+
+    def complete_batch(self, prompts, task="complete", **generation):
+        deadline = deadlines.current()
+        async def run_all():
+            return await asyncio.gather(*(deadlines.limit(self.acomplete(p, task, **generation), deadline) for p in prompts), return_exceptions=True)
+        return self._submit(run_all())
+
+    def close(self):
+        self._submit(self._client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+class StubTokenizer:
+    """Whitespace-word tokenizer for the stub backend: one id per word with its leading space."""
+
+    def __init__(self):
+        self.vocab = {}
+        self.words = []
+        self._lock = threading.Lock()
+
+    def _ids(self, text):
+        ids = []
+        for piece in re.findall(r"\s*\S+|\s+", text):
+            if piece not in self.vocab:
+                with self._lock:
+                    if piece not in self.vocab:
+                        self.vocab[piece] = len(self.words)
+                        self.words.append(piece)
+            ids.append(self.vocab[piece])
+        return ids
+
+    def __call__(self, text, add_special_tokens=True, **kwargs):
+        class Encoding:
+            pass
+        encoding = Encoding()
+        encoding.input_ids = [self._ids(t) for t in text] if isinstance(text, list) else self._ids(text)
+        return encoding
+
+    def decode(self, ids, skip_special_tokens=False):
+        return "".join(self.words[i] for i in ids)
+
+
+class StubBackend(LLMBackend):
+    """Canned replies after a simulated delay, so the app runs without a model (load tests).
+
+    A call sleeps LLM_STUB_PREFILL_MS plus LLM_STUB_TOKEN_MS per reply word; a
+    batch sleeps once for its longest reply, as batched decoding would.
+    """
+
+    TOPICS = ["Biology", "Chemistry", "History", "Mathematics"]
+
+    def __init__(self, prefill_ms, token_ms, seed=None):
+        self.tokenizer = StubTokenizer()
+        self.prefill = prefill_ms / 1000
+        self.per_token = token_ms / 1000
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_config(cls):
+        return cls(config.LLM_STUB_PREFILL_MS, config.LLM_STUB_TOKEN_MS)
+
+    def _reply(self, prompt, task):
+        if task == "question":
+            # questions about different words of the excerpt, so deduplication sees distinct questions
+            # (the excerpt sits between "###" lines; PROMPT_HEAD also quotes "###" inline)
+            excerpt = re.search(r"###\n(.*?)\n###", prompt, re.S)
+            words = re.findall(r"[A-Za-z]{6,}", excerpt.group(1) if excerpt else prompt)
+            return f"What is the role of {self._random.choice(words) if words else 'this concept'} in the text?"
+        if task == "score":
+            return str(self._random.randint(0, 5))
+        if task == "topic":
+            return self._random.choice(self.TOPICS)
+        return "OK"
+
+    def _run(self, prompts, task):
+        replies = [self._reply(prompt, task) for prompt in prompts]
+        tokens_out = max(len(reply.split()) for reply in replies)
+        time.sleep(self.prefill + self.per_token * tokens_out)
+        for prompt, reply in zip(prompts, replies):
+            record_llm_call(task, len(self.tokenizer(prompt).input_ids), len(reply.split()), self.prefill, self.per_token * tokens_out)
+        return replies
+
+    @staticmethod
+    def _chat_prompt(messages):
+        return "\n".join(message["content"] for message in messages if message["role"] == "user")
+
+    def chat(self, messages, task="chat", **generation):
+        return self._run([self._chat_prompt(messages)], task)[0]
+
+    def complete(self, prompt, task="complete", **generation):
+        return self._run([prompt], task)[0]
+
+    def chat_batch(self, batch, task="chat", **generation):
+        return self._run_batch([self._chat_prompt(messages) for messages in batch], task)
+
+    def complete_batch(self, prompts, task="complete", **generation):
+        return self._run_batch(list(prompts), task)
+
+    def _run_batch(self, prompts, task):
+        exceeded = deadlines.exceeded()
+        if exceeded is not None:
+            return [exceeded] * len(prompts)
+        return self._run(prompts, task) if prompts else []
+
+
+def create_backend(load_local_model, task_type, load_draft_model=None, **pipeline_kwargs):
+    # load_local_model() -> (model, tokenizer) is only called for the in-process backend,
+    # load_draft_model(tokenizer) -> model only when LLM_DRAFT_MODEL is set
+    if config.LLM_BACKEND == "openai":
+        return OpenAICompatibleBackend.from_config()
+    if config.LLM_BACKEND == "stub":
+        return StubBackend.from_config()
+    if config.LLM_BACKEND != "local":
+        raise ValueError(f"Unknown LLM_BACKEND: {config.LLM_BACKEND}")
+    model, tokenizer = load_local_model()
+    assistant_model = None
+    if config.LLM_DRAFT_MODEL and load_draft_model is not None:
+        assistant_model = load_draft_model(tokenizer)
+    return LocalPipelineBackend(model, tokenizer, task_type, assistant_model=assistant_model, **pipeline_kwargs)
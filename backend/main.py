@@ -1,8 +1,16 @@
 import uvicorn
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import asyncio, time
+from fastapi import Depends, FastAPI, File, Form, UploadFile, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+import config
+from cpu_resources import resources, staged
+# thread settings must be in place before torch and the tokenizers start their pools
+resources.configure()
 import torch
-if torch.cuda.is_available():
+if config.QUIZ_PROCESSOR == "llama" or (not config.QUIZ_PROCESSOR and torch.cuda.is_available()):
     import processor_llama as processor
 else: 
     import processor_flan as processor
@@ -11,11 +19,26 @@ save_file = processor.save_file
 generate_questions = processor.generate_questions
 evaluate_answers = processor.evaluate_answers
 regenerate_tailored_questions = processor.regenerate_tailored_questions
+start_quiz = processor.start_quiz
+generate_dummy_questions = processor.generate_dummy_questions
+ungraded_evaluation = processor.ungraded_evaluation
 
-from typing import Dict
-from schemas import GenerateQuestionsRequest, GenerateQuestionsResponse, SubmitAnswersRequest, SubmitAnswersResponse, RegenerateTailoredQuestionsRequest 
+from typing import Dict, Any
+from schemas import GenerateQuestionsRequest, GenerateQuestionsResponse, SubmitAnswersRequest, SubmitAnswersResponse, RegenerateTailoredQuestionsRequest, ProfileRequest
+import metrics
+from question_bank import QuestionBank, run_refill_worker, BANK_SERVED
+from dedup import QuestionDeduplicator, deduplicate
+from embedding import embed_texts, close_pool
+from library import library, DEFAULT_COLLECTION
+from prescore import prescorer
+from store import store
+from upload_storage import storage, run_collector, StorageFull
+from admission import Admission, FairScheduler, Rejected, request_cost, slices, model_slots
+from profiling import profiler, profiled, list_profiles, profile_file, MODES as PROFILE_MODES
+import deadlines
+from deadlines import Deadline, DeadlineExceeded, DEADLINE_EXCEEDED
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,43 +48,356 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# one model instance serves every request, so model calls are serialized off the event loop,
+# in weighted fair order between clients
+scheduler = FairScheduler(model_slots())
+admission = Admission(scheduler)
+
+async def run_model(fn, *args, client="default", cost=1.0, weight=1.0):
+    metrics.QUEUE_DEPTH.inc()
+    try:
+        # a request whose deadline ends while it is queued leaves the queue
+        await deadlines.wait(scheduler.acquire(client, cost, weight))
+    finally:
+        metrics.QUEUE_DEPTH.dec()
+    start = time.perf_counter()
+    try:
+        return await run_in_threadpool(staged, "generation", profiled, fn, *args)
+    finally:
+        scheduler.observe(cost, time.perf_counter() - start)
+        scheduler.release()
+
+async def run_sliced(fn, count, *args, client="default"):
+    # oversized requests queue one slice at a time, so other clients' calls get in between
+    questions = []
+    for size in slices(count, config.ADMISSION_SLICE_QUESTIONS):
+        try:
+            questions += await run_model(fn, size, *args, client=client, cost=request_cost(questions=size))
+        except DeadlineExceeded:
+            break
+    if len(questions) < count:
+        # out of time: what was generated, then fallback questions
+        metrics.record_fallback("question_generation", "deadline", f"{count - len(questions)} placeholder questions")
+        questions += generate_dummy_questions(count - len(questions))
+    return questions
+
+async def request_deadline(http_request: Request):
+    """Dependency: the request's Deadline, seen by its model work and ended early if the client disconnects."""
+    deadline = Deadline(deadlines.seconds_for(http_request.headers))
+    token = deadlines.activate(deadline)
+    watcher = asyncio.create_task(deadlines.watch(deadline, http_request.receive))
+    try:
+        yield deadline
+    finally:
+        watcher.cancel()
+        deadlines.reset(token)
+        if deadline.exceeded is not None:
+            DEADLINE_EXCEEDED.labels(http_request.url.path, deadline.exceeded).inc()
+
+def deadline_header(response, deadline):
+    # partial results say why
+    if deadline.exceeded is not None:
+        response.headers["X-Deadline-Exceeded"] = deadline.exceeded
+    return response
+
+def client_id(request: Request) -> str:
+    # the client address: X-Session-Id is chosen by the client, so a new one per
+    # request would get a full token bucket every time
+    return request.client.host if request.client else "unknown"
+
+def admit(http_request: Request, cost: float):
+    try:
+        admission.admit(http_request.url.path, client_id(http_request), cost)
+    except Rejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many requests ({e.reason}), retry in {e.retry_after}s",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+question_bank = QuestionBank(config.QUESTION_BANK_SIZE)
+bank_refill_event = asyncio.Event()
+
+deduplicator = QuestionDeduplicator(
+    embed_texts,
+    config.DEDUP_THRESHOLD,
+    config.DEDUP_HISTORY_QUIZZES,
+    config.DEDUP_MAX_SESSIONS,
+)
+
+def get_session_id(request: Request) -> str:
+    return request.headers.get("X-Session-Id", "default")
+
+def questions_response(questions, quiz_id=None):
+    # the full question dicts (dialogue, document and chunk ids) stay in the
+    # processor's quiz store for grading; clients get the lean Question fields
+    fields = ("id", "text", "category", "dialogue") if config.RESPONSE_INCLUDE_DIALOGUE else ("id", "text", "category")
+    body = {"questions": [{field: q[field] for field in fields if field in q} for q in questions]}
+    if quiz_id is not None:
+        body["quizId"] = quiz_id
+    return ORJSONResponse(body)
+
+async def save_quiz(session_id, questions):
+    if store is None:
+        return None
+    return await run_in_threadpool(store.create_quiz, session_id, questions)
+
+def grade_latest_quiz(answers, session_id):
+    # the processor keeps only the last quiz generated for anyone (and nothing after
+    # a restart), so the user's own stored quiz is put back before grading
+    quiz = store.latest_quiz(session_id) if store is not None else None
+    if quiz is not None:
+        start_quiz(quiz[1])
+    return (quiz[0] if quiz is not None else None), evaluate_answers(answers, session_id)
+
+@app.on_event("startup")
+async def start_question_bank():
+    if not config.QUESTION_BANK_ENABLED:
+        return
+    app.state.question_bank_worker = asyncio.create_task(run_refill_worker(
+        question_bank,
+        bank_refill_event,
+        lambda count, document_id: generate_questions(count, [document_id]),
+        # background refills get a smaller share than users
+        lambda fn, *args: run_model(fn, *args, client="question_bank", cost=request_cost(questions=args[0]),
+                                    weight=config.ADMISSION_BACKGROUND_WEIGHT),
+        scheduler.idle,
+        config.QUESTION_BANK_REFILL_BATCH,
+        config.QUESTION_BANK_REFILL_PRIORITY,
+        config.QUESTION_BANK_IDLE_POLL_SECONDS,
+    ))
+
+@app.on_event("startup")
+async def start_storage_collector():
+    app.state.storage_collector = asyncio.create_task(run_collector(storage, config.UPLOAD_GC_INTERVAL_SECONDS))
+
+@app.on_event("shutdown")
+def close_llm_backend():
+    processor.llm.close()
+    close_pool()
+    storage.close()
+    if store is not None:
+        store.close()
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # labelled by route template (/quizzes/{quiz_id}), "other" when no route matched;
+    # the router sets scope["route"] only once call_next runs, so in-flight matches it here
+    in_flight = next((route.path for route in app.router.routes if route.matches(request.scope)[0] == Match.FULL), "other")
+    metrics.IN_FLIGHT.labels(in_flight).inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.IN_FLIGHT.labels(in_flight).dec()
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "other"
+        metrics.REQUEST_SECONDS.labels(endpoint, str(status)).observe(time.perf_counter() - start)
+
+async def profile_requests(request: Request, call_next):
+    mode = profiler.select(request.url.path, request.headers)
+    if mode is None:
+        return await call_next(request)
+    profile, token = profiler.start(mode, request.method, request.url.path, get_session_id(request))
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Profile-Id"] = profile.id
+        return response
+    finally:
+        profiler.stop(token)
+        await run_in_threadpool(profile.save, status, time.perf_counter() - start)
+
+# only installed when enabled, so requests pay nothing for it otherwise
+if config.PROFILING_ENABLED:
+    app.middleware("http")(profile_requests)
+
+def require_profiling(http_request: Request):
+    if not profiler.authorized(http_request.headers):
+        raise HTTPException(status_code=404, detail="Not found")
+
+@app.post("/admin/profile")
+async def arm_profiling(request: ProfileRequest, http_request: Request) -> Dict[str, Any]:
+    require_profiling(http_request)
+    if request.mode not in PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(PROFILE_MODES)}")
+    return {"armed": profiler.arm(request.mode, max(1, request.count), request.endpoint)}
+
+@app.delete("/admin/profile")
+async def disarm_profiling(http_request: Request) -> Dict[str, Any]:
+    require_profiling(http_request)
+    profiler.disarm()
+    return {"armed": None}
+
+@app.get("/admin/profile")
+async def list_profiling(http_request: Request) -> Dict[str, Any]:
+    require_profiling(http_request)
+    return {"armed": profiler.armed, "profiles": await run_in_threadpool(list_profiles)}
+
+@app.get("/admin/profile/{name}")
+async def download_profile(name: str, http_request: Request):
+    require_profiling(http_request)
+    path = profile_file(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=name)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 @app.post("/uploadFile")
-async def upload_file(file: UploadFile = File(...)) -> Dict[str, str]:
+async def upload_file(http_request: Request, file: UploadFile = File(...), collection: str = Form(DEFAULT_COLLECTION)) -> Dict[str, Any]:
     if not file.content_type == "application/pdf":
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    admit(http_request, request_cost(uploads=1))
     
     try:
-        file_path = await save_file(file)
-        return {"status": "success", "message": "File processed successfully", "path": file_path}
+        shard = await save_file(file, collection, get_session_id(http_request))
+        if store is not None:
+            await run_in_threadpool(store.save_document, shard.document_id, shard.filename, collection, len(shard.chunks))
+        if config.QUESTION_BANK_ENABLED:
+            question_bank.document_changed(shard.document_id, force=config.QUESTION_BANK_INVALIDATE == "upload")
+            bank_refill_event.set()
+        return {"status": "success", "message": "File processed successfully", "path": shard.file_path, "documentId": shard.document_id, "removed": shard.cleaning}
+    except StorageFull as e:
+        raise HTTPException(status_code=507, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 @app.post("/generateQuestions", response_model=GenerateQuestionsResponse)
-async def generate_questions_endpoint(request: GenerateQuestionsRequest):
+async def generate_questions_endpoint(request: GenerateQuestionsRequest, http_request: Request, deadline: Deadline = Depends(request_deadline)):
+    admit(http_request, request_cost(questions=request.questionCount))
+    client = client_id(http_request)
     try:
-        questions = generate_questions(request.questionCount)
-        return {
-            "questions": questions
-        }
+        count = request.questionCount
+        document_ids = [shard.document_id for shard in library.select(request.documentIds or None, request.collection, get_session_id(http_request))]
+        questions = question_bank.take(count, document_ids) if config.QUESTION_BANK_ENABLED else []
+        if len(questions) < count:
+            BANK_SERVED.labels("on_demand").inc(count - len(questions))
+            questions += await run_sliced(generate_questions, count - len(questions), document_ids, client=client)
+        if config.DEDUP_ENABLED:
+            questions = await deduplicate(
+                deduplicator,
+                get_session_id(http_request),
+                questions,
+                lambda n: run_sliced(generate_questions, n, document_ids, client=client),
+                config.DEDUP_MAX_ROUNDS,
+            )
+        questions = start_quiz(questions)
+        quiz_id = await save_quiz(get_session_id(http_request), questions)
+        if config.QUESTION_BANK_ENABLED:
+            bank_refill_event.set()
+        return deadline_header(questions_response(questions, quiz_id), deadline)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
 @app.post("/regenerateTailoredQuestions", response_model=GenerateQuestionsResponse)
-async def generate_questions_endpoint(request: RegenerateTailoredQuestionsRequest):
+async def generate_questions_endpoint(request: RegenerateTailoredQuestionsRequest, http_request: Request, deadline: Deadline = Depends(request_deadline)):
+    admit(http_request, request_cost(questions=request.questionCount))
+    client = client_id(http_request)
+    weaknesses = request.weaknesses
+    if weaknesses is None:
+        if store is None:
+            raise HTTPException(status_code=400, detail="weaknesses is required when the store is disabled")
+        weaknesses = (await run_in_threadpool(store.summary, get_session_id(http_request)))["weaknesses"]
+        if not weaknesses:
+            raise HTTPException(status_code=400, detail="No weaknesses recorded yet; submit answers first")
     try:
-        questions = regenerate_tailored_questions(request.questionCount, request.weaknesses)
-        return {
-            "questions": questions
-        }
+        document_ids = [shard.document_id for shard in library.select(request.documentIds or None, request.collection, get_session_id(http_request))]
+        questions = await run_sliced(regenerate_tailored_questions, request.questionCount, weaknesses, document_ids, client=client)
+        if config.DEDUP_ENABLED:
+            questions = await deduplicate(
+                deduplicator,
+                get_session_id(http_request),
+                questions,
+                lambda n: run_sliced(regenerate_tailored_questions, n, weaknesses, document_ids, client=client),
+                config.DEDUP_MAX_ROUNDS,
+            )
+        questions = start_quiz(questions)
+        quiz_id = await save_quiz(get_session_id(http_request), questions)
+        return deadline_header(questions_response(questions, quiz_id), deadline)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
+@app.get("/library")
+async def library_endpoint() -> Dict[str, Any]:
+    return {"collections": library.describe()}
+
+
+@app.get("/library/memory")
+async def library_memory_endpoint() -> Dict[str, Any]:
+    return await run_in_threadpool(library.memory_report)
+
+
+@app.get("/storage")
+async def storage_endpoint() -> Dict[str, Any]:
+    return await run_in_threadpool(storage.report)
+
+
+@app.get("/prescore/calibration")
+async def prescore_calibration_endpoint() -> Dict[str, Any]:
+    return prescorer.calibration_report()
+
+
+@app.get("/stats")
+async def stats_endpoint(http_request: Request) -> Dict[str, Any]:
+    # running per-topic statistics over all of the user's graded answers
+    if store is None:
+        raise HTTPException(status_code=404, detail="The store is disabled")
+    return await run_in_threadpool(store.summary, get_session_id(http_request))
+
+
+@app.get("/quizzes/{quiz_id}")
+async def quiz_results_endpoint(quiz_id: int, http_request: Request) -> Dict[str, Any]:
+    if store is None:
+        raise HTTPException(status_code=404, detail="The store is disabled")
+    results = await run_in_threadpool(store.quiz_results, quiz_id, get_session_id(http_request))
+    if results is None:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    return results
+
+
+@app.delete("/documents/{document_id}")
+async def delete_document(document_id: str) -> Dict[str, str]:
+    if library.remove(document_id) is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    question_bank.remove(document_id)
+    await run_in_threadpool(storage.delete, document_id)
+    return {"status": "success", "message": "Document removed"}
+
+
+@app.delete("/session/documents/{document_id}")
+async def remove_session_document(document_id: str, http_request: Request) -> Dict[str, str]:
+    removed = await run_in_threadpool(library.remove_from_session, get_session_id(http_request), document_id)
+    if not removed:
+        raise HTTPException(status_code=404, detail="Document not in session")
+    return {"status": "success", "message": "Document removed from session"}
+
+
 @app.post("/submitAnswers", response_model=SubmitAnswersResponse)
-async def submit_answers_endpoint(request: SubmitAnswersRequest):
+async def submit_answers_endpoint(request: SubmitAnswersRequest, http_request: Request, response: Response, deadline: Deadline = Depends(request_deadline)):
+    cost = request_cost(answers=len(request.answers))
+    admit(http_request, cost)
     try:
-        results = evaluate_answers(request.answers)
+        session_id = get_session_id(http_request)
+        # grading needs the whole quiz in one call
+        try:
+            quiz_id, results = await run_model(grade_latest_quiz, request.answers, session_id, client=client_id(http_request), cost=cost)
+        except DeadlineExceeded:
+            # out of time before the model was free: nothing graded
+            quiz_id, results = None, ungraded_evaluation(request.answers, "deadline")
+        if quiz_id is not None:
+            await run_in_threadpool(store.record_results, quiz_id, session_id, [a.text for a in request.answers], results)
+        deadline_header(response, deadline)
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
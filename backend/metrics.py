@@ -0,0 +1,155 @@
+# metrics.py
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUEST_SECONDS = Histogram(
+    "quizmaker_request_seconds",
+    "End-to-end latency of HTTP requests",
+    ["endpoint", "status"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "quizmaker_stage_seconds",
+    "Time spent in each pipeline stage (pdf_extract, split, embed, index_build, retrieval, prefill, decode, ...)",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+LLM_PROMPT_TOKENS = Counter(
+    "quizmaker_llm_prompt_tokens_total",
+    "Prompt tokens sent to the language model",
+    ["task"],
+)
+LLM_COMPLETION_TOKENS = Counter(
+    "quizmaker_llm_completion_tokens_total",
+    "Tokens generated by the language model",
+    ["task"],
+)
+LLM_CALLS = Counter(
+    "quizmaker_llm_calls_total",
+    "Language model calls",
+    ["task"],
+)
+LLM_TOKENS_PER_STEP = Histogram(
+    "quizmaker_llm_tokens_per_step",
+    "Tokens accepted per decoding step of a single call (above 1 only with assisted decoding)",
+    ["task"],
+    buckets=(1, 1.5, 2, 2.5, 3, 4, 5, 6, 8, 12),
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "quizmaker_llm_decode_tokens_per_second",
+    "Decode throughput of a single language model call",
+    ["task"],
+    buckets=(1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 250, 500, 1000),
+)
+QUEUE_DEPTH = Gauge(
+    "quizmaker_queue_depth",
+    "Requests waiting for the model",
+)
+IN_FLIGHT = Gauge(
+    "quizmaker_requests_in_flight",
+    "HTTP requests currently being handled",
+    ["endpoint"],
+)
+ACTIVE_DOCUMENTS = Gauge(
+    "quizmaker_active_documents",
+    "Documents currently indexed in memory",
+)
+DOCUMENT_CHUNKS = Gauge(
+    "quizmaker_document_chunks",
+    "Chunks in the currently indexed documents",
+)
+FALLBACK_EVENTS = Counter(
+    "quizmaker_fallback_events_total",
+    "Results that were not produced by the model (placeholder questions, ungraded answers, out-of-memory items)",
+    ["stage", "reason"],
+)
+
+
+@contextmanager
+def track_stage(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+def record_llm_call(task: str, tokens_in: int, tokens_out: int, prefill_seconds: float, decode_seconds: float, steps: int = 0):
+    LLM_CALLS.labels(task).inc()
+    LLM_PROMPT_TOKENS.labels(task).inc(tokens_in)
+    LLM_COMPLETION_TOKENS.labels(task).inc(tokens_out)
+    STAGE_SECONDS.labels("prefill").observe(prefill_seconds)
+    STAGE_SECONDS.labels("decode").observe(decode_seconds)
+    if decode_seconds > 0 and tokens_out > 0:
+        LLM_TOKENS_PER_SECOND.labels(task).observe(tokens_out / decode_seconds)
+    if steps > 0:
+        LLM_TOKENS_PER_STEP.labels(task).observe(tokens_out / steps)
+
+
+def record_llm_batch(task: str, tokens_in: int, tokens_out: int, calls: int, seconds: float):
+    # a batched generate call has no per-item prefill/decode split
+    LLM_CALLS.labels(task).inc(calls)
+    LLM_PROMPT_TOKENS.labels(task).inc(tokens_in)
+    LLM_COMPLETION_TOKENS.labels(task).inc(tokens_out)
+    STAGE_SECONDS.labels("llm_batch").observe(seconds)
+    if seconds > 0 and tokens_out > 0:
+        LLM_TOKENS_PER_SECOND.labels(task).observe(tokens_out / seconds)
+
+
+def record_fallback(stage: str, reason: str, detail: str = ""):
+    FALLBACK_EVENTS.labels(stage, reason).inc()
+    print(f"Fallback in {stage}: {reason}" + (f" ({detail})" if detail else ""))
+
+
+def record_remote_llm_call(task: str, tokens_in: int, tokens_out: int, seconds: float):
+    # a remote server only reports the total time, so it is observed as one stage
+    LLM_CALLS.labels(task).inc()
+    LLM_PROMPT_TOKENS.labels(task).inc(tokens_in)
+    LLM_COMPLETION_TOKENS.labels(task).inc(tokens_out)
+    STAGE_SECONDS.labels("llm_request").observe(seconds)
+    if seconds > 0 and tokens_out > 0:
+        LLM_TOKENS_PER_SECOND.labels(task).observe(tokens_out / seconds)
+
+
+class GenerationTimer:
+    """Streamer for ``generate`` that splits one call into prefill and decode time.
+
+    ``generate`` first puts the prompt ids, then one put per decoding step, so the
+    arrival of the second put marks the end of prefill. With assisted decoding a
+    step puts every token it accepted.
+    """
+
+    def __init__(self, task: str, tokens_in: int = None):
+        self.task = task
+        self.tokens_in = tokens_in
+        self.tokens_out = 0
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.steps = 0
+        # length of the ids generate started from, so stopping criteria can find the new tokens
+        self.prompt_length = 0
+        self._prompt_seen = False
+
+    def put(self, value):
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            self.prompt_length = int(value.shape[-1])
+            if self.tokens_in is None:
+                self.tokens_in = int(value.shape[-1])
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.steps += 1
+        self.tokens_out += int(value.shape[-1])
+
+    def end(self):
+        now = time.perf_counter()
+        first = self.first_token_at or now
+        record_llm_call(self.task, self.tokens_in or 0, self.tokens_out, first - self.start, now - first, self.steps)
+
+
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,78 @@
+# prefix_cache.py
+import copy, threading
+from prometheus_client import Counter
+
+PREFIX_TOKENS_REUSED = Counter(
+    "quizmaker_llm_prefix_tokens_reused_total",
+    "Prompt tokens taken from the shared prefix cache instead of being prefilled",
+    ["task"],
+)
+
+
+def common_length(a, b) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class PrefixCache:
+    """Key/value cache of static chat prefixes, prefilled once per model load.
+
+    A prefix is given as messages whose last content may be only the start of
+    the message (e.g. the fixed head of a prompt template). A call reuses the
+    longest cached token prefix its prompts share; the cache is cropped to that
+    length, so a prefix that tokenizes differently at its end is still used up
+    to the last matching token.
+    """
+
+    def __init__(self, model, tokenizer):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefixes = []
+        self._lock = threading.Lock()
+
+    def prefix_ids(self, messages):
+        # chat templates may strip the content, so the rendered chat is cut after the stripped text
+        rendered = self.tokenizer.apply_chat_template(messages, tokenize=False)
+        text = messages[-1]["content"].strip()
+        end = rendered.rindex(text) + len(text)
+        return self.tokenizer(rendered[:end], add_special_tokens=False).input_ids
+
+    def add(self, messages) -> int:
+        import torch
+        from transformers import DynamicCache
+        ids = self.prefix_ids(messages)
+        with torch.no_grad():
+            output = self.model(
+                torch.tensor([ids], device=self.model.device),
+                past_key_values=DynamicCache(),
+                use_cache=True,
+            )
+        with self._lock:
+            self.prefixes.append((ids, output.past_key_values))
+        return len(ids)
+
+    def match(self, rows):
+        """(length, cache) of the longest cached prefix shared by all rows of prompt ids,
+        leaving at least one token of each row to prefill, or None."""
+        best, best_cache = 0, None
+        for ids, cache in self.prefixes:
+            n = min(common_length(ids, row) for row in rows)
+            n = min([n] + [len(row) - 1 for row in rows])
+            if n > best:
+                best, best_cache = n, cache
+        if best_cache is None:
+            return None
+        return best, best_cache
+
+    @staticmethod
+    def expand(cache, length, batch_size):
+        """Private copy of cache cropped to length and repeated for the batch; generate writes into it."""
+        cache = copy.deepcopy(cache)
+        cache.crop(length)
+        if batch_size > 1:
+            cache.batch_repeat_interleave(batch_size)
+        return cache
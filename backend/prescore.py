@@ -0,0 +1,97 @@
+# prescore.py
+import re, threading
+import numpy as np
+from prometheus_client import Counter
+import config
+from embedding import get_embeddings
+from grading_cache import normalize
+from metrics import track_stage
+
+PRESCORE_DECISIONS = Counter("quizmaker_prescore_decisions_total", "Pre-scoring decisions", ["decision", "mode"])
+PRESCORE_CALIBRATION = Counter(
+    "quizmaker_prescore_calibration_total",
+    "Pre-scoring decisions compared with the LLM score of the same answer",
+    ["decision", "llm"],
+)
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "of", "to", "in", "on", "at", "for", "with", "by", "from", "as",
+    "is", "are", "was", "were", "be", "been", "it", "its", "this", "that", "these", "those", "what", "which",
+    "who", "how", "why", "when", "where", "do", "does", "did", "can", "could", "would", "should", "i", "you",
+    "he", "she", "they", "we", "not", "no", "yes", "so", "if", "than", "then", "there", "their", "about",
+}
+
+
+def content_words(text):
+    return {w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOPWORDS and len(w) > 2}
+
+
+class PreScorer:
+    """Scores obviously empty or off-topic answers as 0 without the LLM.
+
+    An answer is trivial when it is blank (or a "don't know" phrase), has
+    fewer than PRESCORE_MIN_CHARS letters or digits, or shares no content
+    word with the question and its context and its MiniLM embedding is below
+    PRESCORE_MIN_SIMILARITY to all of them. PRESCORE_MODE "shadow" only
+    records how the decisions compare with the LLM scores, "on" skips the LLM
+    for trivial answers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calibration = {}
+
+    @property
+    def mode(self):
+        return config.PRESCORE_MODE
+
+    def is_trivial(self, question_text, answer_text, contexts) -> bool:
+        if self.mode == "off":
+            return False
+        answer = normalize(answer_text)
+        if sum(c.isalnum() for c in answer) < config.PRESCORE_MIN_CHARS:
+            return True
+        references = [question_text] + list(contexts)
+        if content_words(answer) & content_words(" ".join(references)):
+            return False
+        with track_stage("prescore"):
+            vectors = np.asarray(get_embeddings().embed_documents([answer_text] + references), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return float(np.max(vectors[1:] @ vectors[0])) < config.PRESCORE_MIN_SIMILARITY
+
+    def decide(self, question_text, answer_text, contexts):
+        """(trivial, skip_llm): skip_llm is only set in "on" mode."""
+        trivial = self.is_trivial(question_text, answer_text, contexts)
+        if self.mode != "off":
+            PRESCORE_DECISIONS.labels("zero" if trivial else "llm", self.mode).inc()
+        return trivial, trivial and self.mode == "on"
+
+    def record(self, trivial: bool, llm_score: float):
+        # an LLM score at or below PRESCORE_AGREE_MAX counts as agreeing with a 0
+        if self.mode == "off":
+            return
+        decision = "zero" if trivial else "llm"
+        llm = "low" if llm_score <= config.PRESCORE_AGREE_MAX else "high"
+        PRESCORE_CALIBRATION.labels(decision, llm).inc()
+        with self._lock:
+            self._calibration[(decision, llm)] = self._calibration.get((decision, llm), 0) + 1
+
+    def calibration_report(self):
+        with self._lock:
+            counts = dict(self._calibration)
+        zero_low, zero_high = counts.get(("zero", "low"), 0), counts.get(("zero", "high"), 0)
+        llm_low, llm_high = counts.get(("llm", "low"), 0), counts.get(("llm", "high"), 0)
+        total = zero_low + zero_high + llm_low + llm_high
+        return {
+            "mode": self.mode,
+            "graded": total,
+            "agreement": (zero_low + llm_high) / total if total else None,
+            # of the answers it would score 0, how many the LLM also scored low
+            "zero_precision": zero_low / (zero_low + zero_high) if zero_low + zero_high else None,
+            # of the answers the LLM scored low, how many it would have caught
+            "zero_recall": zero_low / (zero_low + llm_low) if zero_low + llm_low else None,
+            "counts": {f"{decision}/{llm}": count for (decision, llm), count in counts.items()},
+        }
+
+
+prescorer = PreScorer()
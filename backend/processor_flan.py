@@ -1,31 +1,38 @@
 # processor.py
-import PyPDF2, os, uuid
 from transformers import AutoTokenizer, AutoModel, AutoModelForSeq2SeqLM, BitsAndBytesConfig, AutoModelForCausalLM
 from sentence_transformers import SentenceTransformer
 from langchain_community.llms import HuggingFacePipeline
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-from transformers import pipeline
-from transformers.pipelines.base import Pipeline
 import numpy as np
 from typing import List
+from llm_backend import create_backend
+from prompt_builder import PromptBuilder
+from library import library, save_upload, DEFAULT_COLLECTION
+from grading_cache import grading_cache
+from prescore import prescorer
+from generation_profiles import generation_settings
+from metrics import record_fallback
+import deadlines
+import config
 
-document_vectorstore = None
-document_text = ""
-text_chunks = []
+questions = []
 
 question_gen_model = None
 question_gen_tokenizer = None
 evaluation_model = None
 evaluation_tokenizer = None
+llm = None
+prompt_builder = None
 
-def initialize_models():
+QUESTION_MODEL_NAME = "google/flan-t5-base"
+# flan-t5 encoder input limit; longer prompts are silently truncated
+CONTEXT_TOKENS = 512
+
+def load_local_model():
     global question_gen_model, question_gen_tokenizer, evaluation_model, evaluation_tokenizer
     
-    question_model_name = "google/flan-t5-base"
+    question_model_name = QUESTION_MODEL_NAME
     question_gen_model = AutoModelForSeq2SeqLM.from_pretrained(question_model_name)
     question_gen_tokenizer = AutoTokenizer.from_pretrained(question_model_name)
     
@@ -36,78 +43,28 @@ def initialize_models():
     evaluation_model = question_gen_model
     
     print("Hugging Face models initialized successfully")
+    return question_gen_model, question_gen_tokenizer
+
+def initialize_models():
+    global llm, prompt_builder
+    
+    llm = create_backend(load_local_model, "text2text-generation")
+    tokenizer = llm.tokenizer or AutoTokenizer.from_pretrained(config.LLM_TOKENIZER or QUESTION_MODEL_NAME)
+    prompt_builder = PromptBuilder(tokenizer, CONTEXT_TOKENS, seq2seq=True)
 
 initialize_models()
 
-async def save_file(file):
-    UPLOAD_DIR = "uploads"
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    file_mapping = {}
-    
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(UPLOAD_DIR, unique_filename)
-    
-    with open(file_path, "wb") as buffer:
-        contents = await file.read()
-        buffer.write(contents)
-    
-    file_mapping[file.filename] = file_path
-    
-    process_pdf(file_path)
-    
-    return file_path
-    
-def process_pdf(file_path):
-    global document_text, document_vectorstore, text_chunks
-    
-    document_text = extract_text_from_pdf(file_path)
-    
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-    text_chunks = text_splitter.split_text(document_text)
-    
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
-    
-    document_vectorstore = FAISS.from_texts(
-        texts=text_chunks,
-        embedding=embeddings
-    )
-    
-    print(f"Processed document into {len(text_chunks)} chunks and created vector store")
-    
-def extract_text_from_pdf(file_path):
-    text = ""
-    try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text()
-    except Exception as e:
-        print(f"Error extracting text from PDF: {str(e)}")
-        text = ""
-    return text
+async def save_file(file, collection=DEFAULT_COLLECTION, session_id=None):
+    return await save_upload(file, prompt_builder, collection, session_id)
 
-def generate_questions(count: int):
-    global document_vectorstore, text_chunks, question_gen_model, question_gen_tokenizer
+def generate_questions(count: int, document_ids=None, collection=None):
+    global llm, prompt_builder
     
-    if not document_vectorstore or not text_chunks:
+    shards = library.select(document_ids, collection)
+    if not shards:
+        record_fallback("question_generation", "no_document")
         return generate_dummy_questions(count)
     
-    question_gen_pipe:Pipeline
-    question_gen_pipe = pipeline(
-        "text2text-generation", 
-        model=question_gen_model, 
-        tokenizer=question_gen_tokenizer,
-        max_length=64,
-    )
-    
     categories = [
         "Explain Concept",
         "Definition",
@@ -124,38 +81,45 @@ def generate_questions(count: int):
     
     questions = []
     
-    sample_size = min(count, len(text_chunks))
-    selected_chunks = np.random.choice(text_chunks, size=sample_size, replace=False)
-    
-    for i, chunk in enumerate(selected_chunks):
-        if i >= count:
-            break
+    prompts = []
+    for shard, chunk_id in library.sample_chunks(shards, count):
+        chunk = shard.chunks[chunk_id]
             
         category = np.random.choice(categories)
         
         prompt_template = category_prompts[category]
-        prompt = prompt_template.format(text=chunk[:200])
-        
-        try:
-            question_text = question_gen_pipe(prompt)[0]["generated_text"]
-            
-            if not question_text.endswith("?"):
-                question_text += "?"
-            
-            questions.append({
-                "id": i + 1,
-                "text": question_text,
-                "category": category
-            })
-        except Exception as e:
-            print(f"Error generating question: {str(e)}")
+        prompts.append((shard, chunk_id, category, prompt_builder.fill(prompt_template, "text", [chunk], [shard.chunk_tokens[chunk_id]], "question")))
+    
+    replies = llm.complete_batch([prompt for _, _, _, prompt in prompts], "question", **generation_settings("question", sample=False))
+    
+    for i, ((shard, chunk_id, category, prompt), reply) in enumerate(zip(prompts, replies)):
+        if isinstance(reply, Exception):
+            # items cut off by the request deadline get the same fallback question
+            record_fallback("question_generation", fallback_reason(reply), str(reply))
             questions.append({
                 "id": i + 1,
-                "text": f"What is the main point of this excerpt: '{chunk[:50]}...'?",
-                "category": category
+                "text": f"What is the main point of this excerpt: '{shard.chunks[chunk_id][:50]}...'?",
+                "category": category,
+                "document_id": shard.document_id,
+                "chunk_id": chunk_id
             })
+            continue
+        
+        question_text = reply
+        
+        if not question_text.endswith("?"):
+            question_text += "?"
+        
+        questions.append({
+            "id": i + 1,
+            "text": question_text,
+            "category": category,
+            "document_id": shard.document_id,
+            "chunk_id": chunk_id
+        })
     
     if len(questions) < count:
+        record_fallback("question_generation", "shortfall", f"{count - len(questions)} placeholder questions")
         dummy_questions = generate_dummy_questions(count - len(questions))
         for i, q in enumerate(dummy_questions):
             q["id"] = len(questions) + i + 1
@@ -163,6 +127,9 @@ def generate_questions(count: int):
         
     return questions
 
+def fallback_reason(error):
+    return "deadline" if isinstance(error, deadlines.DeadlineExceeded) else "error"
+
 def generate_dummy_questions(count: int):
     # Keep original dummy question generation as fallback
     import random
@@ -214,7 +181,7 @@ def generate_dummy_questions(count: int):
     
     return questions
 
-def regenerate_tailored_questions(count: int, weaknesses: List[str]):
+def regenerate_tailored_questions(count: int, weaknesses: List[str], document_ids=None, collection=None):
     import random
     
     question_types = [
@@ -265,44 +232,57 @@ def regenerate_tailored_questions(count: int, weaknesses: List[str]):
     return questions
 
 
-def evaluate_answers(answers):
-    global document_vectorstore, evaluation_model, evaluation_tokenizer
+def start_quiz(quiz):
+    global questions
     
-    if not document_vectorstore:
-        return _generate_random_evaluation(answers)
+    for i, q in enumerate(quiz):
+        q["id"] = i + 1
+    questions = quiz
+    return questions
+
+def evaluate_answers(answers, session_id=None):
+    global llm, prompt_builder, questions
+    
+    if not library.documents:
+        return ungraded_evaluation(answers, "no_document")
     
     try:
-        eval_pipe = pipeline(
-            "text2text-generation",
-            model=evaluation_model,
-            tokenizer=evaluation_tokenizer,
-            max_length=100
-        )
-        
-        retriever = document_vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 3}
-        )
+        # retrieve from the documents the quiz was generated from
+        quiz_shards = library.select(list({q["document_id"] for q in questions if "document_id" in q}) or None)
         
         scores = []
         answer_analysis = {}
+        # answers the model could not grade; reported instead of given a made-up score
+        ungraded = []
         
         for i, answer_obj in enumerate(answers):
             answer_id = i + 1
-            answer_text = answer_obj.get("text", "")
-            question_text = answer_obj.get("question", "Question not provided")
-            category = answer_obj.get("category", "Unknown")
+            answer_text = answer_obj.text
+            question_i = next((q for q in questions if q["id"] == answer_id), {})
+            question_text = answer_obj.question or question_i.get("text", "Question not provided")
+            category = answer_obj.category or question_i.get("category", "Unknown")
+            cache_key = grading_cache.key(question_i.get("document_id"), question_text, answer_text)
             
             try:
-                contexts = retriever.get_relevant_documents(question_text)
-                context_text = " ".join([doc.page_content for doc in contexts])
+                cached = grading_cache.get(cache_key)
+                if cached is not None:
+                    score = cached["score"]
+                    answer_analysis.setdefault(category, {"scores": [], "total": 0})
+                    answer_analysis[category]["scores"].append(score)
+                    answer_analysis[category]["total"] += score
+                    scores.append({"id": answer_id, "score": score, "topic": category})
+                    continue
                 
-                eval_prompt = f"""
-                Context: {context_text}
+                deadlines.check()
+                contexts = library.search(question_text, quiz_shards, k=3)
+                trivial, skip_llm = prescorer.decide(question_text, answer_text, [doc.page_content for _, doc, _ in contexts])
                 
-                Question: {question_text}
+                eval_template = """
+                Context: {context}
                 
-                Answer to evaluate: {answer_text}
+                Question: {question}
+                
+                Answer to evaluate: {answer}
                 
                 Evaluate the answer on a scale from 0 to 5, where:
                 0: Completely incorrect or irrelevant
@@ -315,7 +295,17 @@ def evaluate_answers(answers):
                 Return only the numeric score.
                 """
                 
-                eval_result = eval_pipe(eval_prompt)[0]["generated_text"]
+                eval_prompt = prompt_builder.fill(
+                    eval_template,
+                    "context",
+                    [doc.page_content for _, doc, _ in contexts],
+                    [shard.chunk_tokens[doc.metadata["chunk_id"]] for shard, doc, _ in contexts],
+                    "score",
+                    question=question_text,
+                    answer=answer_text,
+                )
+                
+                eval_result = "0" if skip_llm else llm.complete(eval_prompt, "score", **generation_settings("score", sample=False))
                 
                 score_text = eval_result.strip()
                 if score_text.replace('.', '', 1).isdigit():
@@ -325,6 +315,9 @@ def evaluate_answers(answers):
                     score = float(digits) if digits else 3.0
                 
                 score = max(0, min(5, score))
+                if not skip_llm:
+                    prescorer.record(trivial, score)
+                    grading_cache.put(cache_key, {"score": score, "topic": category})
                 
                 if category not in answer_analysis:
                     answer_analysis[category] = {"scores": [], "total": 0}
@@ -333,10 +326,12 @@ def evaluate_answers(answers):
                 answer_analysis[category]["total"] += score
                 
             except Exception as e:
-                print(f"Error evaluating answer {answer_id}: {str(e)}")
-                score = 3.0  
+                record_fallback("grading", fallback_reason(e), f"answer {answer_id}: {str(e)}")
+                ungraded.append(answer_id)
+                score = 0.0
             
-            scores.append({"id": answer_id, "score": score})
+            # the topic is kept for the store; the response model drops it
+            scores.append({"id": answer_id, "score": score, "topic": None if answer_id in ungraded else category})
         
         for category in answer_analysis:
             if answer_analysis[category]["scores"]:
@@ -361,25 +356,21 @@ def evaluate_answers(answers):
         return {
             "strengths": strengths,
             "weaknesses": weaknesses,
-            "scores": scores
+            "scores": scores,
+            "ungraded": ungraded
         }
         
     except Exception as e:
         print(f"Error in evaluation process: {str(e)}")
-        return _generate_random_evaluation(answers)
+        return ungraded_evaluation(answers, "error")
 
-def _generate_random_evaluation(answers):
-    import random
-    
-    scores = [random.randint(0, 5) for _ in answers]
+def ungraded_evaluation(answers, reason):
+    record_fallback("grading", reason)
     ids = [i + 1 for i in range(len(answers))]
-    score_list = [{"id": i, "score": float(s)} for i, s in zip(ids, scores)]
-    
-    strengths = ["Biology", "Computer Science"]
-    weaknesses = ["Mathematics"]
     
     return {
-        "strengths": strengths,
-        "weaknesses": weaknesses,
-        "scores": score_list
-    }
\ No newline at end of file
+        "strengths": ["None identified"],
+        "weaknesses": ["None identified"],
+        "scores": [{"id": i, "score": 0.0} for i in ids],
+        "ungraded": ids
+    }
@@ -1,23 +1,23 @@
 # processor.py
-import PyPDF2, os, uuid
 import torch
 from transformers import AutoTokenizer, AutoModel, AutoModelForSeq2SeqLM, BitsAndBytesConfig, AutoModelForCausalLM
 from sentence_transformers import SentenceTransformer
 from langchain_community.llms import HuggingFacePipeline
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-from transformers import pipeline
-from transformers.pipelines.base import Pipeline
 import numpy as np
 import traceback
 from typing import List
-
-document_vectorstore = None
-document_text = ""
-text_chunks = []
+from llm_backend import create_backend
+from prompt_builder import PromptBuilder
+from library import library, save_upload, DEFAULT_COLLECTION
+from grading_cache import grading_cache
+from prescore import prescorer
+from generation_profiles import generation_settings
+from metrics import record_fallback
+from llama_prompts import SYSTEM_PROMPT, PROMPT_HEAD, CATEGORY_PROMPTS, QUESTION_TEMPLATE, TAILORED_QUESTION_TEMPLATE, score_prompt, topic_prompt
+import deadlines
+import config
 
 questions = []
 
@@ -25,11 +25,18 @@ question_gen_model = None
 question_gen_tokenizer = None
 evaluation_model = None
 evaluation_tokenizer = None
+llm = None
+prompt_builder = None
 
-def initialize_models():
+QUESTION_MODEL_NAME = "meta-llama/Meta-Llama-3-8B-Instruct"
+CONTEXT_TOKENS = 8192
+# chat template markup around the messages
+CHAT_TEMPLATE_TOKENS = 16
+
+def load_local_model():
     global question_gen_model, question_gen_tokenizer, evaluation_model, evaluation_tokenizer
     
-    question_model_name = "meta-llama/Meta-Llama-3-8B-Instruct"
+    question_model_name = QUESTION_MODEL_NAME
     bnb_config = BitsAndBytesConfig(load_in_4bit=True,bnb_4bit_use_double_quant=True, bnb_4bit_quant_type="nf4", bnb_4bit_compute_dtype=torch.bfloat16)
     question_gen_model = AutoModelForCausalLM.from_pretrained(question_model_name,quantization_config=bnb_config)
     question_gen_tokenizer = AutoTokenizer.from_pretrained(question_model_name)
@@ -38,81 +45,45 @@ def initialize_models():
     evaluation_model = question_gen_model
     
     print("Hugging Face models initialized successfully")
+    return question_gen_model, question_gen_tokenizer
 
-initialize_models()
-
-async def save_file(file):
-    UPLOAD_DIR = "uploads"
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    file_mapping = {}
-    
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(UPLOAD_DIR, unique_filename)
-    
-    with open(file_path, "wb") as buffer:
-        contents = await file.read()
-        buffer.write(contents)
-    
-    file_mapping[file.filename] = file_path
-    
-    process_pdf(file_path)
-    
-    return file_path
-    
-def process_pdf(file_path):
-    global document_text, document_vectorstore, text_chunks
-    
-    document_text = extract_text_from_pdf(file_path)
-    
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-    text_chunks = text_splitter.split_text(document_text)
-    
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
-    
-    document_vectorstore = FAISS.from_texts(
-        texts=text_chunks,
-        embedding=embeddings
-    )
-    
-    print(f"Processed document into {len(text_chunks)} chunks and created vector store")
-    
-def extract_text_from_pdf(file_path):
-    text = ""
-    try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text()
-    except Exception as e:
-        print(f"Error extracting text from PDF: {str(e)}")
-        text = ""
-    return text
+def load_draft_model(tokenizer):
+    draft_tokenizer = AutoTokenizer.from_pretrained(config.LLM_DRAFT_MODEL)
+    if draft_tokenizer.get_vocab() != tokenizer.get_vocab():
+        raise ValueError(f"Draft model {config.LLM_DRAFT_MODEL} does not share the tokenizer of {QUESTION_MODEL_NAME}")
+    draft_model = AutoModelForCausalLM.from_pretrained(config.LLM_DRAFT_MODEL, torch_dtype=torch.bfloat16, device_map="auto")
+    draft_model.generation_config.num_assistant_tokens = config.LLM_DRAFT_TOKENS
+    draft_model.generation_config.num_assistant_tokens_schedule = config.LLM_DRAFT_SCHEDULE
+    print(f"Assisted decoding with draft model {config.LLM_DRAFT_MODEL}")
+    return draft_model
 
-def generate_questions(count: int):
-    global document_vectorstore, text_chunks, question_gen_model, question_gen_tokenizer, questions
-    
-    if not document_vectorstore or not text_chunks:
-        return generate_dummy_questions(count)
+def initialize_models():
+    global llm, prompt_builder
     
-    question_gen_pipe = pipeline(
+    llm = create_backend(
+        load_local_model,
         "text-generation",
-        model=question_gen_model, 
-        tokenizer=question_gen_tokenizer,
+        load_draft_model=load_draft_model,
         model_kwargs={"torch_dtype": torch.bfloat16},
         device_map="auto",
     )
-    terminators = [
-        question_gen_pipe.tokenizer.eos_token_id,
-        question_gen_pipe.tokenizer.convert_tokens_to_ids("<|eot_id|>")
-    ]
+    tokenizer = llm.tokenizer or AutoTokenizer.from_pretrained(config.LLM_TOKENIZER or QUESTION_MODEL_NAME)
+    prompt_builder = PromptBuilder(tokenizer, CONTEXT_TOKENS, seq2seq=False)
+    # prefilled once and reused by every question, score and topic call
+    llm.share_prefix([{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": PROMPT_HEAD}])
+
+initialize_models()
+
+async def save_file(file, collection=DEFAULT_COLLECTION, session_id=None):
+    return await save_upload(file, prompt_builder, collection, session_id)
+
+def generate_questions(count: int, document_ids=None, collection=None):
+    global llm, prompt_builder
+    
+    shards = library.select(document_ids, collection)
+    if not shards:
+        record_fallback("question_generation", "no_document")
+        return generate_dummy_questions(count)
     
     categories = [
         "Explain Concept",
@@ -121,66 +92,64 @@ def generate_questions(count: int):
         "Compare/Contrast"
     ]
     
-    category_prompts = {
-        "Explain Concept": "Generate a question asking to explain a concept from this excerpt",
-        "Definition": "Generate a question asking for a definition from this excerpt",
-        "Application": "Generate a question about applying concepts from this excerpt",
-        "Compare/Contrast": "Generate a question comparing or contrasting ideas from this excerpt"
-    }
-    
-    prompt_template = "Consider the following excerpt, which is surrounded by lines of \"###\":\n###\n{text}\n###\n{category}. Do not print anything else. Do not mention the excerpt, the text, or the author. The question should be standalone."
-    
     questions = []
     
-    sample_size = min(count, len(text_chunks))
-    selected_chunks = np.random.choice(text_chunks, size=sample_size, replace=False)
-    
-    for i, chunk in enumerate(selected_chunks):
-        if i >= count:
-            break
+    prompts = []
+    for shard, chunk_id in library.sample_chunks(shards, count):
+        chunk = shard.chunks[chunk_id]
             
         category = np.random.choice(categories)
         
-        category_question = category_prompts[category]
-        prompt = prompt_template.format(text=chunk[:200],category=category_question)
+        category_question = CATEGORY_PROMPTS[category]
+        prompt = prompt_builder.fill(
+            QUESTION_TEMPLATE, "text", [chunk], [shard.chunk_tokens[chunk_id]], "question",
+            max_new_tokens=generation_settings("question")["max_new_tokens"],
+            reserve=prompt_builder.count(SYSTEM_PROMPT) + CHAT_TEMPLATE_TOKENS,
+            category=category_question,
+        )
         
         messages = [
-            {"role": "system", "content": "You are a helpful chatbot who generates flashcard-like quiz questions."},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt},
         ]
-        
-        try:
-            outputs = question_gen_pipe(
-                    messages,
-                    max_new_tokens=64,
-                    eos_token_id=terminators,
-                    pad_token_id = question_gen_pipe.tokenizer.eos_token_id,
-                    do_sample=True,
-                    temperature=0.6,
-                    top_p=0.9,
-                )[0]["generated_text"]
-            
-            question_text = outputs[-1]['content']
-            
-            if not question_text.endswith("?"):
-                question_text += "?"
-            
-            questions.append({
-                "id": i + 1,
-                "text": question_text,
-                "category": category,
-                "dialogue" : outputs
-            })
-        except Exception as e:
-            print(f"Error generating question: {str(e)}")
+        prompts.append((shard, chunk_id, category, messages))
+    
+    replies = llm.chat_batch(
+        [messages for _, _, _, messages in prompts],
+        "question",
+        **generation_settings("question"),
+    )
+    
+    for i, ((shard, chunk_id, category, messages), reply) in enumerate(zip(prompts, replies)):
+        if isinstance(reply, Exception):
+            # items cut off by the request deadline get the same fallback question
+            record_fallback("question_generation", fallback_reason(reply), str(reply))
             questions.append({
                 "id": i + 1,
-                "text": f"What is the main point of this excerpt: '{chunk[:50]}...'?",
+                "text": f"What is the main point of this excerpt: '{shard.chunks[chunk_id][:50]}...'?",
                 "category": category,
+                "document_id": shard.document_id,
+                "chunk_id": chunk_id,
                 "dialogue" : []
             })
+            continue
+        
+        question_text = reply
+        
+        if not question_text.endswith("?"):
+            question_text += "?"
+        
+        questions.append({
+            "id": i + 1,
+            "text": question_text,
+            "category": category,
+            "document_id": shard.document_id,
+            "chunk_id": chunk_id,
+            "dialogue" : messages + [{"role": "assistant", "content": reply}]
+        })
     
     if len(questions) < count:
+        record_fallback("question_generation", "shortfall", f"{count - len(questions)} placeholder questions")
         dummy_questions = generate_dummy_questions(count - len(questions))
         for i, q in enumerate(dummy_questions):
             q["id"] = len(questions) + i + 1
@@ -188,6 +157,9 @@ def generate_questions(count: int):
         
     return questions
 
+def fallback_reason(error):
+    return "deadline" if isinstance(error, deadlines.DeadlineExceeded) else "error"
+
 def generate_dummy_questions(count: int):
     # Keep original dummy question generation as fallback
     import random
@@ -239,25 +211,14 @@ def generate_dummy_questions(count: int):
     
     return questions
 
-def regenerate_tailored_questions(count: int, weaknesses: List[str]):
-    global document_vectorstore, text_chunks, question_gen_model, question_gen_tokenizer, questions
-    print(weaknesses) 
+def regenerate_tailored_questions(count: int, weaknesses: List[str], document_ids=None, collection=None):
+    global llm, prompt_builder
     
-    if not document_vectorstore or not text_chunks:
+    shards = library.select(document_ids, collection)
+    if not shards:
+        record_fallback("question_generation", "no_document")
         return generate_dummy_questions(count)
     
-    question_gen_pipe = pipeline(
-        "text-generation",
-        model=question_gen_model, 
-        tokenizer=question_gen_tokenizer,
-        model_kwargs={"torch_dtype": torch.bfloat16},
-        device_map="auto",
-    )
-    terminators = [
-        question_gen_pipe.tokenizer.eos_token_id,
-        question_gen_pipe.tokenizer.convert_tokens_to_ids("<|eot_id|>")
-    ]
-    
     categories = [
         "Explain Concept",
         "Definition",
@@ -265,68 +226,65 @@ def regenerate_tailored_questions(count: int, weaknesses: List[str]):
         "Compare/Contrast"
     ]
     
-    category_prompts = {
-        "Explain Concept": "Generate a question asking to explain a concept from this excerpt",
-        "Definition": "Generate a question asking for a definition from this excerpt",
-        "Application": "Generate a question about applying concepts from this excerpt",
-        "Compare/Contrast": "Generate a question comparing or contrasting ideas from this excerpt"
-    }
-    
-    prompt_template = "Consider the following excerpt, which is surrounded by lines of \"###\":\n###\n{text}\n###\n{category}. The question should be focused on one of the listed topcs:\n{weaknesses}\n Do not print anything else. Do not mention the excerpt, the text, or the author. The question should be standalone."
-    
     bulleted_weak_topics = '- ' + '\n- '.join(w for w in weaknesses)
     
     questions = []
     
-    sample_size = min(count, len(text_chunks))
-    selected_chunks = np.random.choice(text_chunks, size=sample_size, replace=False)
-    
-    for i, chunk in enumerate(selected_chunks):
-        if i >= count:
-            break
+    prompts = []
+    for shard, chunk_id in library.sample_chunks(shards, count):
+        chunk = shard.chunks[chunk_id]
             
         category = np.random.choice(categories)
         
-        category_question = category_prompts[category]
-        prompt = prompt_template.format(text=chunk[:200],category=category_question,weaknesses=bulleted_weak_topics)
+        category_question = CATEGORY_PROMPTS[category]
+        prompt = prompt_builder.fill(
+            TAILORED_QUESTION_TEMPLATE, "text", [chunk], [shard.chunk_tokens[chunk_id]], "question",
+            max_new_tokens=generation_settings("question")["max_new_tokens"],
+            reserve=prompt_builder.count(SYSTEM_PROMPT) + CHAT_TEMPLATE_TOKENS,
+            category=category_question, weaknesses=bulleted_weak_topics,
+        )
         
         messages = [
-            {"role": "system", "content": "You are a helpful chatbot who generates flashcard-like quiz questions."},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt},
         ]
-        
-        try:
-            outputs = question_gen_pipe(
-                    messages,
-                    max_new_tokens=64,
-                    eos_token_id=terminators,
-                    pad_token_id = question_gen_pipe.tokenizer.eos_token_id,
-                    do_sample=True,
-                    temperature=0.6,
-                    top_p=0.9,
-                )[0]["generated_text"]
-            
-            question_text = outputs[-1]['content']
-            
-            if not question_text.endswith("?"):
-                question_text += "?"
-            
-            questions.append({
-                "id": i + 1,
-                "text": question_text,
-                "category": category,
-                "dialogue" : outputs
-            })
-        except Exception as e:
-            print(f"Error generating question: {str(e)}")
+        prompts.append((shard, chunk_id, category, messages))
+    
+    replies = llm.chat_batch(
+        [messages for _, _, _, messages in prompts],
+        "question",
+        **generation_settings("question"),
+    )
+    
+    for i, ((shard, chunk_id, category, messages), reply) in enumerate(zip(prompts, replies)):
+        if isinstance(reply, Exception):
+            record_fallback("question_generation", fallback_reason(reply), str(reply))
             questions.append({
                 "id": i + 1,
-                "text": f"What is the main point of this excerpt: '{chunk[:50]}...'?",
+                "text": f"What is the main point of this excerpt: '{shard.chunks[chunk_id][:50]}...'?",
                 "category": category,
+                "document_id": shard.document_id,
+                "chunk_id": chunk_id,
                 "dialogue" : []
             })
+            continue
+        
+        question_text = reply
+        
+        if not question_text.endswith("?"):
+            question_text += "?"
+        
+        questions.append({
+            "id": i + 1,
+            "text": question_text,
+            "category": category,
+            "document_id": shard.document_id,
+            "chunk_id": chunk_id,
+            "dialogue" : messages + [{"role": "assistant", "content": reply}]
+        })
     
     if len(questions) < count:
+        record_fallback("question_generation", "shortfall", f"{count - len(questions)} placeholder questions")
         dummy_questions = generate_dummy_questions(count - len(questions))
         for i, q in enumerate(dummy_questions):
             q["id"] = len(questions) + i + 1
@@ -334,76 +292,87 @@ def regenerate_tailored_questions(count: int, weaknesses: List[str]):
         
     return questions
 
-def evaluate_answers(answers):
-    global document_vectorstore, evaluation_model, evaluation_tokenizer, questions
+def start_quiz(quiz):
+    global questions
+    
+    for i, q in enumerate(quiz):
+        q["id"] = i + 1
+    questions = quiz
+    return questions
+
+def evaluate_answers(answers, session_id=None):
+    global llm, questions
     
-    if not document_vectorstore:
-        return _generate_random_evaluation(answers)
+    if not library.documents:
+        return ungraded_evaluation(answers, "no_document")
     
     try:
-        eval_pipe = pipeline(
-            "text-generation",
-            model=question_gen_model, 
-            tokenizer=question_gen_tokenizer,
-            model_kwargs={"torch_dtype": torch.bfloat16},
-            device_map="auto",
-        )
-        terminators = [
-            eval_pipe.tokenizer.eos_token_id,
-            eval_pipe.tokenizer.convert_tokens_to_ids("<|eot_id|>")
-        ]
-        retriever = document_vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 3}
-        )
-        
         scores = []
         answer_analysis = {}
+        # answers the model could not grade; reported instead of given a made-up score
+        ungraded = []
         topics = []
         
+        score_requests = []
+        cache_keys = []
+        # grades known without the score call: cached or pre-scored as trivial
+        known_grades = []
+        trivial_answers = []
         for i, answer_obj in enumerate(answers):
             answer_id = i + 1
             answer_text = answer_obj.text
             question_i = [q for q in questions if q["id"] == answer_id][0]
-            question_text = question_i["text"]
-            category = question_i["category"]
-            dialogue = question_i["dialogue"]
+            dialogue = question_i.get("dialogue", [])
+            
+            cache_key = grading_cache.key(question_i.get("document_id"), question_i["text"], answer_text)
+            cache_keys.append(cache_key)
+            known_grades.append(grading_cache.get(cache_key))
+            trivial_answers.append(False)
+            if known_grades[-1] is None:
+                shard = library.documents.get(question_i.get("document_id"))
+                contexts = [shard.chunks[question_i["chunk_id"]]] if shard is not None and "chunk_id" in question_i else []
+                trivial_answers[-1], skip_llm = prescorer.decide(question_i["text"], answer_text, contexts)
+                if skip_llm:
+                    # no topic call was made; the question category is not a field of study,
+                    # so like ungraded answers it is left out of the topic analysis
+                    known_grades[-1] = {"score": 0.0, "topic": None}
+            if known_grades[-1] is not None:
+                score_requests.append(None)
+                continue
+            
+            # contexts = library.search(question_i["text"], library.select([question_i["document_id"]]), k=3)
+            # context_text = " ".join([doc.page_content for _, doc, _ in contexts])
+            
+            score_requests.append(dialogue + [{
+                "role":"user",
+                "content":score_prompt(answer_text)
+            }])
+        
+        # scoring calls are independent; topic calls below depend on the topics found so far
+        pending = [messages for messages in score_requests if messages is not None]
+        replies = iter(llm.chat_batch(
+            pending,
+            "score",
+            **generation_settings("score"),
+        ) if pending else [])
+        score_replies = [None if messages is None else next(replies) for messages in score_requests]
+        
+        for i, (messages, eval_result) in enumerate(zip(score_requests, score_replies)):
+            answer_id = i + 1
             
             try:
-                # contexts = retriever.get_relevant_documents(question_text)
-                # context_text = " ".join([doc.page_content for doc in contexts])
-                
-                eval_prompt = f"""
-                This is my answer:
-                {answer_text}
+                known = known_grades[i]
+                if known is not None:
+                    score, category = known["score"], known["topic"]
+                    if category is not None:
+                        answer_analysis.setdefault(category, {"scores": [], "total": 0})
+                        answer_analysis[category]["scores"].append(score)
+                        answer_analysis[category]["total"] += score
+                    scores.append({"id": answer_id, "score": score, "topic": category})
+                    continue
                 
-                Evaluate the answer on a scale from 0 to 5, where:
-                0: Completely incorrect or irrelevant
-                1: Mostly incorrect with minor relevant elements
-                2: Partially correct but missing key information
-                3: Mostly correct with minor errors or omissions
-                4: Correct but could be more comprehensive
-                5: Completely correct and comprehensive
-                
-                Return only the numeric score.
-                """
-                
-                messages = dialogue + [{
-                    "role":"user",
-                    "content":eval_prompt
-                }]
-                
-                outputs = eval_pipe(
-                    messages,
-                    max_new_tokens=64,
-                    eos_token_id=terminators,
-                    pad_token_id = eval_pipe.tokenizer.eos_token_id,
-                    do_sample=True,
-                    temperature=0.6,
-                    top_p=0.9,
-                )[0]["generated_text"]
-                
-                eval_result:str = outputs[-1]['content']
+                if isinstance(eval_result, Exception):
+                    raise eval_result
                 
                 score_text = eval_result.strip()
                 if score_text.replace('.', '', 1).isdigit():
@@ -413,37 +382,28 @@ def evaluate_answers(answers):
                     score = float(digits) if digits else 3.0
                 
                 score = max(0, min(5, score))
+                # the topic is one more model call; without it the answer is reported ungraded
+                deadlines.check()
                 
                 # get study topics
-                topic_prompt = \
-                """
-                What specific field of study would you say this topic is in? {existing}Just print the field of study and nothing else.
-                """
-                existing = '' if len(answer_analysis) == 0 else \
-                    "This is a list of idenitified topics:\n{categories}\nIf the field of study matches one of these, print the element exactly. Otherwise, list its field of study. "
-                cat_list = '- ' + '\n- '.join(c for c in answer_analysis.keys())
-                existing = existing.format(categories=cat_list)
-                topic_prompt = topic_prompt.format(existing=existing)
+                topic_request = topic_prompt(answer_analysis.keys())
                     
-                messages = outputs
-                messages.append(
+                messages = messages + [
+                    {"role": "assistant", "content": eval_result},
                     {
                         "role": "user", 
-                        "content": topic_prompt
+                        "content": topic_request
                     },
-                    )
+                ]
                 
-                outputs = eval_pipe(
+                category = llm.chat(
                     messages,
-                    max_new_tokens=64,
-                    eos_token_id=terminators,
-                    pad_token_id = eval_pipe.tokenizer.eos_token_id,
-                    do_sample=True,
-                    temperature=0.6,
-                    top_p=0.9,
-                )[0]["generated_text"]
+                    "topic",
+                    **generation_settings("topic"),
+                )
+                prescorer.record(trivial_answers[i], score)
+                grading_cache.put(cache_keys[i], {"score": score, "topic": category})
                 
-                category = outputs[-1]['content']
                 if category not in answer_analysis:
                     answer_analysis[category] = {"scores": [], "total": 0}
                 
@@ -451,11 +411,14 @@ def evaluate_answers(answers):
                 answer_analysis[category]["total"] += score
                 
             except Exception as e:
-                print(f"Error evaluating answer {answer_id}:")
-                print(traceback.format_exc())
-                score = 3.0  
+                if not isinstance(e, deadlines.DeadlineExceeded):
+                    print(traceback.format_exc())
+                record_fallback("grading", fallback_reason(e), f"answer {answer_id}: {str(e)}")
+                ungraded.append(answer_id)
+                score = 0.0
             
-            scores.append({"id": answer_id, "score": score})
+            # the topic is kept for the store; the response model drops it
+            scores.append({"id": answer_id, "score": score, "topic": None if answer_id in ungraded else category})
         
         for category in answer_analysis:
             if answer_analysis[category]["scores"]:
@@ -480,25 +443,21 @@ def evaluate_answers(answers):
         return {
             "strengths": strengths,
             "weaknesses": weaknesses,
-            "scores": scores
+            "scores": scores,
+            "ungraded": ungraded
         }
         
     except Exception as e:
-        print(f"Error in evaluation process: {str(e)}")
-        return _generate_random_evaluation(answers)
+        print(traceback.format_exc())
+        return ungraded_evaluation(answers, "error")
 
-def _generate_random_evaluation(answers):
-    import random
-    
-    scores = [random.randint(0, 5) for _ in answers]
+def ungraded_evaluation(answers, reason):
+    record_fallback("grading", reason)
     ids = [i + 1 for i in range(len(answers))]
-    score_list = [{"id": i, "score": float(s)} for i, s in zip(ids, scores)]
-    
-    strengths = ["Biology", "Computer Science"]
-    weaknesses = ["Mathematics"]
     
     return {
-        "strengths": strengths,
-        "weaknesses": weaknesses,
-        "scores": score_list
-    }
\ No newline at end of file
+        "strengths": ["None identified"],
+        "weaknesses": ["None identified"],
+        "scores": [{"id": i, "score": 0.0} for i in ids],
+        "ungraded": ids
+    }
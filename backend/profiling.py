@@ -0,0 +1,181 @@
+# profiling.py
+import contextvars, cProfile, glob, io, json, os, pstats, re, threading, time, uuid
+import config
+
+MODES = ("cprofile", "torch")
+# never use up armed profiles: metric scrapes and the profiling endpoints themselves
+UNARMED_PATHS = ("/metrics", "/admin/")
+
+# the profile of the request being handled; starlette copies it into threadpool calls
+_active = contextvars.ContextVar("request_profile", default=None)
+
+
+class RequestProfile:
+    """Profile of one request's model and ingest work, merged over its threadpool calls.
+
+    cProfile mode keeps one pstats file for the request; torch mode writes a
+    Chrome trace (chrome://tracing, Perfetto) per call. Metadata and the top
+    functions go to <id>.meta.json.
+    """
+
+    def __init__(self, mode, method, endpoint, session_id):
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", endpoint).strip("_") or "root"
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{uuid.uuid4().hex[:6]}"
+        self.mode = mode
+        self.method = method
+        self.endpoint = endpoint
+        self.session_id = session_id
+        self.started = time.time()
+        self.calls = []
+        self.traces = []
+        self._stats = None
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            if self.mode == "torch":
+                return self._run_torch(fn, args)
+            return self._run_cprofile(fn, args)
+        finally:
+            with self._lock:
+                self.calls.append({"function": getattr(fn, "__name__", repr(fn)), "seconds": time.perf_counter() - start})
+
+    def _run_cprofile(self, fn, args):
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(fn, *args)
+        finally:
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profiler)
+                else:
+                    self._stats.add(profiler)
+
+    def _run_torch(self, fn, args):
+        import torch
+        from torch.profiler import ProfilerActivity, profile
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        with profile(activities=activities, record_shapes=True, profile_memory=True) as prof:
+            result = fn(*args)
+        with self._lock:
+            name = f"{self.id}-{len(self.traces)}.trace.json"
+            self.traces.append(name)
+        os.makedirs(config.PROFILING_DIR, exist_ok=True)
+        prof.export_chrome_trace(os.path.join(config.PROFILING_DIR, name))
+        return result
+
+    def save(self, status, seconds):
+        os.makedirs(config.PROFILING_DIR, exist_ok=True)
+        meta = {
+            "id": self.id,
+            "mode": self.mode,
+            "method": self.method,
+            "endpoint": self.endpoint,
+            "sessionId": self.session_id,
+            "status": status,
+            "startedAt": self.started,
+            "seconds": seconds,
+            "calls": self.calls,
+            "files": list(self.traces),
+        }
+        if self._stats is not None:
+            self._stats.dump_stats(os.path.join(config.PROFILING_DIR, f"{self.id}.prof"))
+            meta["files"].append(f"{self.id}.prof")
+            text = io.StringIO()
+            self._stats.stream = text
+            self._stats.sort_stats("cumulative").print_stats(config.PROFILING_TOP_FUNCTIONS)
+            meta["top"] = text.getvalue()
+        with open(os.path.join(config.PROFILING_DIR, f"{self.id}.meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        prune(config.PROFILING_MAX_TRACES)
+        return meta
+
+
+def profiled(fn, *args):
+    """Runs fn(*args), under the current request's profile if it has one."""
+    profile = _active.get()
+    if profile is None:
+        return fn(*args)
+    return profile.run(fn, *args)
+
+
+class Profiler:
+    """Decides which requests to profile: an X-Profile header naming the mode,
+    or the next `count` requests (optionally to one endpoint; /metrics and
+    /admin/* only when named) armed through the admin endpoint. Both need PROFILING_ENABLED and, when set, PROFILING_TOKEN
+    in X-Profile-Token."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.armed = None
+
+    def authorized(self, headers) -> bool:
+        return config.PROFILING_ENABLED and (not config.PROFILING_TOKEN or headers.get("X-Profile-Token") == config.PROFILING_TOKEN)
+
+    def arm(self, mode, count, endpoint=None):
+        with self._lock:
+            self.armed = {"mode": mode, "remaining": count, "endpoint": endpoint}
+        return dict(self.armed)
+
+    def disarm(self):
+        with self._lock:
+            self.armed = None
+
+    def select(self, endpoint, headers):
+        """Profiling mode for the request, or None."""
+        if not config.PROFILING_ENABLED:
+            return None
+        mode = headers.get("X-Profile")
+        if mode in MODES and self.authorized(headers):
+            return mode
+        if self.armed is None:
+            return None
+        with self._lock:
+            armed = self.armed
+            if armed is None or (armed["endpoint"] is not None and armed["endpoint"] != endpoint):
+                return None
+            if armed["endpoint"] is None and endpoint.startswith(UNARMED_PATHS):
+                return None
+            armed["remaining"] -= 1
+            if armed["remaining"] <= 0:
+                self.armed = None
+            return armed["mode"]
+
+    def start(self, mode, method, endpoint, session_id):
+        profile = RequestProfile(mode, method, endpoint, session_id)
+        return profile, _active.set(profile)
+
+    def stop(self, token):
+        # in the context start() was called in; the profile is saved afterwards
+        _active.reset(token)
+
+
+def list_profiles():
+    profiles = []
+    for path in sorted(glob.glob(os.path.join(config.PROFILING_DIR, "*.meta.json")), reverse=True):
+        with open(path) as f:
+            meta = json.load(f)
+        meta.pop("top", None)
+        profiles.append(meta)
+    return profiles
+
+
+def profile_file(name):
+    """Path of a file in the profile directory, or None for other names."""
+    path = os.path.join(config.PROFILING_DIR, os.path.basename(name))
+    return path if os.path.isfile(path) else None
+
+
+def prune(keep):
+    # ids start with the timestamp, so name order is age order
+    metas = sorted(glob.glob(os.path.join(config.PROFILING_DIR, "*.meta.json")))
+    for meta in metas[:max(0, len(metas) - keep)]:
+        profile_id = os.path.basename(meta)[:-len(".meta.json")]
+        for path in glob.glob(os.path.join(config.PROFILING_DIR, glob.escape(profile_id) + "*")):
+            os.remove(path)
+
+
+profiler = Profiler()
@@ -0,0 +1,75 @@
+# prompt_builder.py
+import numpy as np
+from prometheus_client import Counter, Histogram
+
+PROMPT_TOKENS = Histogram(
+    "quizmaker_prompt_tokens",
+    "Prompt tokens after packing context to the model budget",
+    ["task"],
+    buckets=(32, 64, 128, 256, 384, 512, 768, 1024, 2048, 4096, 8192),
+)
+CHUNKS_TRUNCATED = Counter(
+    "quizmaker_prompt_chunks_truncated_total",
+    "Context chunks cut to fit the prompt token budget",
+    ["task"],
+)
+
+
+class PromptBuilder:
+    """Fills prompt templates with chunk text packed to the model's token budget.
+
+    Chunks are tokenized once at ingest (tokenize_chunks) so building a prompt
+    only counts the fixed template text.
+    """
+
+    def __init__(self, tokenizer, context_tokens: int, seq2seq: bool):
+        self.tokenizer = tokenizer
+        self.context_tokens = context_tokens
+        # encoder-decoder models do not spend input context on the output
+        self.seq2seq = seq2seq
+
+    def tokenize(self, text):
+        return np.asarray(self.tokenizer(text, add_special_tokens=False).input_ids, dtype=np.int32)
+
+    def tokenize_chunks(self, chunks):
+        if not chunks:
+            return []
+        ids = self.tokenizer(list(chunks), add_special_tokens=False).input_ids
+        return [np.asarray(chunk_ids, dtype=np.int32) for chunk_ids in ids]
+
+    def count(self, text) -> int:
+        return len(self.tokenizer(text).input_ids)
+
+    def fixed_tokens(self, template, **fields) -> int:
+        return self.count(template.format(**fields))
+
+    def pack(self, chunks, chunk_tokens, budget, task, separator=" "):
+        """Joins whole chunks while they fit; the first one that does not fit is cut
+        to the remaining budget. Returns the text and the tokens it uses."""
+        sep_tokens = len(self.tokenize(separator)) if separator.strip() else 1
+        parts = []
+        remaining = budget
+        for chunk, tokens in zip(chunks, chunk_tokens):
+            if parts:
+                remaining -= sep_tokens
+            if remaining <= 0:
+                break
+            if len(tokens) <= remaining:
+                parts.append(chunk)
+                remaining -= len(tokens)
+            else:
+                CHUNKS_TRUNCATED.labels(task).inc()
+                parts.append(self.tokenizer.decode(tokens[:remaining].tolist(), skip_special_tokens=True))
+                remaining = 0
+        return separator.join(parts), budget - max(0, remaining)
+
+    def fill(self, template, slot, chunks, chunk_tokens, task, max_new_tokens=0, reserve=0, separator=" ", **fields):
+        """Formats template with the packed chunks in {slot}.
+
+        reserve covers tokens outside the template, e.g. a system message and chat markup.
+        """
+        fixed = self.fixed_tokens(template, **{slot: ""}, **fields)
+        budget = self.context_tokens - fixed - reserve - (0 if self.seq2seq else max_new_tokens)
+        text, used = self.pack(chunks, chunk_tokens, max(0, budget), task, separator)
+        PROMPT_TOKENS.labels(task).observe(fixed + used)
+        return template.format(**{slot: text}, **fields)
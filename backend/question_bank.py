@@ -0,0 +1,106 @@
+# question_bank.py
+import asyncio, threading
+from collections import OrderedDict, deque
+from prometheus_client import Counter, Gauge
+
+BANK_SIZE = Gauge("quizmaker_question_bank_size", "Pre-generated questions waiting in the bank")
+BANK_SERVED = Counter("quizmaker_question_bank_served_total", "Questions served from the bank or generated on demand", ["source"])
+
+
+class QuestionBank:
+    """Pre-generated questions, one bank per document.
+
+    Each entry is a question dict as returned by the processor's
+    generate_questions (text, category, document_id, chunk_id, ...).
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._banks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _update_size(self):
+        BANK_SIZE.set(sum(len(items) for items in self._banks.values()))
+
+    def document_changed(self, document_id, force=False):
+        # force drops the bank even if the new upload has the same content
+        with self._lock:
+            if force or document_id not in self._banks:
+                self._banks[document_id] = deque()
+            self._banks.move_to_end(document_id)
+            self._update_size()
+
+    def remove(self, document_id):
+        with self._lock:
+            self._banks.pop(document_id, None)
+            self._update_size()
+
+    def next_refill(self):
+        """(document_id, missing) for the most recently uploaded document that is not full, else None."""
+        with self._lock:
+            for document_id in reversed(self._banks):
+                missing = self.size - len(self._banks[document_id])
+                if missing > 0:
+                    return document_id, missing
+        return None
+
+    def add(self, document_id, questions):
+        with self._lock:
+            # results for a document that was removed or replaced while generating are stale
+            items = self._banks.get(document_id)
+            if items is None:
+                return
+            items.extend(q for q in questions[:max(0, self.size - len(items))] if q.get("document_id") == document_id)
+            self._update_size()
+
+    def take(self, count: int, document_ids):
+        """Round-robin over the selected documents, preferring questions from different chunks."""
+        with self._lock:
+            banks = [self._banks[d] for d in document_ids if d in self._banks]
+            taken, seen_chunks, skipped = [], set(), []
+            while len(taken) < count and any(banks):
+                for items in banks:
+                    if not items or len(taken) >= count:
+                        continue
+                    q = items.popleft()
+                    key = (q.get("document_id"), q.get("chunk_id"))
+                    if key in seen_chunks:
+                        skipped.append((items, q))
+                        continue
+                    seen_chunks.add(key)
+                    taken.append(q)
+            for items, q in reversed(skipped):
+                if len(taken) < count:
+                    taken.append(q)
+                else:
+                    items.appendleft(q)
+            self._update_size()
+        BANK_SERVED.labels("bank").inc(len(taken))
+        return taken
+
+
+async def run_refill_worker(bank: QuestionBank, refill_event: asyncio.Event, generate,
+                            run_model, is_idle, batch_size: int, priority: str, idle_poll_seconds: float):
+    """Keeps the banks full in the background.
+
+    generate(count, document_id) -> list of questions, run_model(fn, *args)
+    runs it on the shared model. With priority "idle" a batch only starts when
+    no request is waiting for the model; "normal" queues behind requests like
+    any caller.
+    """
+    while True:
+        await refill_event.wait()
+        refill_event.clear()
+        while (target := bank.next_refill()) is not None:
+            if priority == "idle" and not is_idle():
+                await asyncio.sleep(idle_poll_seconds)
+                continue
+            document_id, missing = target
+            try:
+                questions = await run_model(generate, min(batch_size, missing), document_id)
+            except Exception as e:
+                print(f"Error refilling question bank: {str(e)}")
+                break
+            if not questions:
+                break
+            bank.add(document_id, questions)
@@ -1,12 +1,18 @@
-from pydantic import BaseModel
-from typing import List, Optional, Union
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Union
+import config
 
 class GenerateQuestionsRequest(BaseModel):
-    questionCount: int
+    questionCount: int = Field(ge=1, le=config.MAX_QUESTION_COUNT)
+    documentIds: Optional[List[str]] = None
+    collection: Optional[str] = None
 
 class RegenerateTailoredQuestionsRequest(BaseModel):
-    questionCount: int
-    weaknesses: List[str]
+    questionCount: int = Field(ge=1, le=config.MAX_QUESTION_COUNT)
+    # read from the user's stored topic statistics when left out
+    weaknesses: Optional[List[str]] = None
+    documentIds: Optional[List[str]] = None
+    collection: Optional[str] = None
 
 class Question(BaseModel):
     id: int
@@ -14,10 +20,11 @@ class Question(BaseModel):
     category: str
 
 class ExtendedQuestion(Question):
-    dialogue: List[str]
+    dialogue: List[Dict[str, str]]
 
 class GenerateQuestionsResponse(BaseModel):
     questions: List[Union[Question, ExtendedQuestion]]
+    quizId: Optional[int] = None
 
 class AnswerSubmission(BaseModel):
     id: Optional[int] = None
@@ -36,9 +43,17 @@ class SubmitAnswersResponse(BaseModel):
     strengths: List[str]
     weaknesses: List[str]
     scores: List[ScoreItem]
+    # ids of answers the model could not grade (their score is 0)
+    ungraded: List[int] = []
 
 class GenerateAnswerRequest(BaseModel):
     question: str
 
 class GenerateAnswerResponse(BaseModel):
-    answer: str
\ No newline at end of file
+    answer: str
+
+class ProfileRequest(BaseModel):
+    mode: str = "cprofile"
+    count: int = 1
+    # only requests to this path, e.g. "/submitAnswers"
+    endpoint: Optional[str] = None
@@ -0,0 +1,30 @@
+# sqlite_engine.py
+import os
+from sqlalchemy import create_engine, event
+import config
+
+
+def create_sqlite_engine(path, pool_size=None):
+    """SQLAlchemy engine for a SQLite file shared by threadpool threads, with the pragmas below."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    pool = {"pool_size": pool_size, "max_overflow": pool_size} if pool_size else {}
+    engine = create_engine(
+        f"sqlite:///{path}",
+        # connections are handed between threadpool threads
+        connect_args={"check_same_thread": False},
+        **pool,
+    )
+    event.listen(engine, "connect", _sqlite_pragmas)
+    return engine
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # readers do not block the writer; foreign keys are off by default in SQLite
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute(f"PRAGMA busy_timeout={int(config.STORE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
@@ -0,0 +1,225 @@
+# store.py
+import json, time
+from sqlalchemy import (
+    Boolean, Column, Float, ForeignKey, Integer, MetaData, String, Table, Text,
+    select, update,
+)
+from sqlalchemy.dialects.sqlite import insert
+import config
+from metrics import track_stage
+from sqlite_engine import create_sqlite_engine
+
+metadata = MetaData()
+
+documents = Table(
+    "documents", metadata,
+    Column("id", String, primary_key=True),
+    Column("filename", String),
+    Column("collection", String),
+    Column("chunks", Integer),
+    Column("created_at", Float),
+)
+quizzes = Table(
+    "quizzes", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", String, index=True, nullable=False),
+    Column("created_at", Float, nullable=False),
+    Column("submitted_at", Float),
+)
+questions = Table(
+    "questions", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("quiz_id", Integer, ForeignKey("quizzes.id", ondelete="CASCADE"), index=True, nullable=False),
+    # the question id the client sees (1-based position in the quiz)
+    Column("position", Integer, nullable=False),
+    Column("text", Text, nullable=False),
+    Column("category", String),
+    # no foreign key: quizzes outlive the documents they were generated from
+    Column("document_id", String),
+    Column("chunk_id", Integer),
+    # the llama processor grades in the dialogue that produced the question
+    Column("dialogue", Text),
+)
+answers = Table(
+    "answers", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("question_id", Integer, ForeignKey("questions.id", ondelete="CASCADE"), index=True, nullable=False),
+    Column("text", Text, nullable=False),
+    Column("score", Float, nullable=False),
+    Column("topic", String),
+    Column("graded", Boolean, nullable=False),
+    Column("created_at", Float, nullable=False),
+)
+topic_stats = Table(
+    "topic_stats", metadata,
+    Column("user_id", String, primary_key=True),
+    Column("topic", String, primary_key=True),
+    Column("answers", Integer, nullable=False),
+    Column("total_score", Float, nullable=False),
+    Column("last_score", Float),
+    Column("updated_at", Float),
+)
+
+# same split as the per-quiz strengths and weaknesses of evaluate_answers
+STRONG_SCORE = 3.0
+MAX_STRENGTHS = 2
+
+
+class QuizStore:
+    """Documents, quizzes, questions and graded answers in SQLite.
+
+    Each graded answer also updates its user's running per-topic totals in
+    topic_stats in the same transaction, so statistics and weaknesses are read
+    from one row per topic instead of being recomputed from the answers.
+    """
+
+    def __init__(self, path: str, pool_size: int = 5):
+        self.engine = create_sqlite_engine(path, pool_size)
+        metadata.create_all(self.engine)
+
+    def save_document(self, document_id, filename, collection, chunks):
+        row = {"id": document_id, "filename": filename, "collection": collection, "chunks": chunks, "created_at": time.time()}
+        statement = insert(documents).values(row)
+        statement = statement.on_conflict_do_update(
+            index_elements=[documents.c.id],
+            set_={"filename": row["filename"], "collection": row["collection"], "chunks": row["chunks"]},
+        )
+        with self.engine.begin() as conn:
+            conn.execute(statement)
+
+    def create_quiz(self, user_id, quiz) -> int:
+        with track_stage("store_write"), self.engine.begin() as conn:
+            quiz_id = conn.execute(quizzes.insert().values(user_id=user_id, created_at=time.time())).inserted_primary_key[0]
+            if quiz:
+                conn.execute(questions.insert(), [{
+                    "quiz_id": quiz_id,
+                    "position": q["id"],
+                    "text": q["text"],
+                    "category": q.get("category"),
+                    "document_id": q.get("document_id"),
+                    "chunk_id": q.get("chunk_id"),
+                    "dialogue": json.dumps(q["dialogue"]) if q.get("dialogue") else None,
+                } for q in quiz])
+        return quiz_id
+
+    def latest_quiz(self, user_id):
+        """(quiz id, question dicts as the processors keep them) of the user's newest quiz, or None."""
+        with self.engine.connect() as conn:
+            quiz_id = conn.execute(
+                select(quizzes.c.id).where(quizzes.c.user_id == user_id).order_by(quizzes.c.id.desc()).limit(1)
+            ).scalar()
+            if quiz_id is None:
+                return None
+            rows = conn.execute(select(questions).where(questions.c.quiz_id == quiz_id).order_by(questions.c.position)).mappings()
+            quiz = []
+            for row in rows:
+                q = {"id": row["position"], "text": row["text"], "category": row["category"]}
+                if row["document_id"] is not None:
+                    q["document_id"] = row["document_id"]
+                if row["chunk_id"] is not None:
+                    q["chunk_id"] = row["chunk_id"]
+                if row["dialogue"]:
+                    q["dialogue"] = json.loads(row["dialogue"])
+                quiz.append(q)
+        return quiz_id, quiz
+
+    def record_results(self, quiz_id, user_id, answer_texts, results):
+        """Stores the answers and scores of evaluate_answers and adds the graded ones to topic_stats."""
+        now = time.time()
+        ungraded = set(results.get("ungraded", []))
+        with track_stage("store_write"), self.engine.begin() as conn:
+            question_ids = dict(conn.execute(
+                select(questions.c.position, questions.c.id).where(questions.c.quiz_id == quiz_id)
+            ).all())
+            rows = []
+            for item in results["scores"]:
+                question_id = question_ids.get(item["id"])
+                if question_id is None or item["id"] > len(answer_texts):
+                    continue
+                graded = item["id"] not in ungraded
+                rows.append({
+                    "question_id": question_id,
+                    "text": answer_texts[item["id"] - 1],
+                    "score": item["score"],
+                    "topic": item.get("topic"),
+                    "graded": graded,
+                    "created_at": now,
+                })
+                if graded and item.get("topic"):
+                    statement = insert(topic_stats).values(
+                        user_id=user_id, topic=item["topic"], answers=1,
+                        total_score=item["score"], last_score=item["score"], updated_at=now,
+                    )
+                    conn.execute(statement.on_conflict_do_update(
+                        index_elements=[topic_stats.c.user_id, topic_stats.c.topic],
+                        set_={
+                            "answers": topic_stats.c.answers + 1,
+                            "total_score": topic_stats.c.total_score + statement.excluded.total_score,
+                            "last_score": statement.excluded.last_score,
+                            "updated_at": now,
+                        },
+                    ))
+            if rows:
+                conn.execute(answers.insert(), rows)
+            conn.execute(update(quizzes).where(quizzes.c.id == quiz_id).values(submitted_at=now))
+
+    def topic_statistics(self, user_id):
+        """Per-topic answer count, average and last score, best average first."""
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(topic_stats).where(topic_stats.c.user_id == user_id)).mappings().all()
+        stats = [{
+            "topic": row["topic"],
+            "answers": row["answers"],
+            "average": row["total_score"] / row["answers"],
+            "lastScore": row["last_score"],
+        } for row in rows]
+        return sorted(stats, key=lambda s: s["average"], reverse=True)
+
+    def summary(self, user_id):
+        stats = self.topic_statistics(user_id)
+        return {
+            "strengths": [s["topic"] for s in stats if s["average"] >= STRONG_SCORE][:MAX_STRENGTHS],
+            # weakest first
+            "weaknesses": [s["topic"] for s in reversed(stats) if s["average"] < STRONG_SCORE],
+            "topics": stats,
+        }
+
+    def quiz_results(self, quiz_id, user_id):
+        """Questions of one of the user's quizzes with their latest answer and score, or None."""
+        with self.engine.connect() as conn:
+            quiz = conn.execute(
+                select(quizzes).where(quizzes.c.id == quiz_id, quizzes.c.user_id == user_id)
+            ).mappings().first()
+            if quiz is None:
+                return None
+            rows = conn.execute(
+                select(questions.c.id, questions.c.position, questions.c.text, questions.c.category,
+                       answers.c.text.label("answer"), answers.c.score, answers.c.topic, answers.c.graded)
+                .select_from(questions.outerjoin(answers, answers.c.question_id == questions.c.id))
+                .where(questions.c.quiz_id == quiz_id)
+                .order_by(questions.c.position, answers.c.id)
+            ).mappings().all()
+        results = {}
+        for row in rows:
+            # later answers to the same question replace earlier ones
+            results[row["position"]] = {
+                "id": row["position"],
+                "text": row["text"],
+                "category": row["category"],
+                "answer": row["answer"],
+                "score": row["score"],
+                "topic": row["topic"],
+                "graded": row["graded"],
+            }
+        return {
+            "quizId": quiz["id"],
+            "createdAt": quiz["created_at"],
+            "submittedAt": quiz["submitted_at"],
+            "questions": list(results.values()),
+        }
+
+    def close(self):
+        self.engine.dispose()
+
+
+store = QuizStore(config.STORE_PATH, config.STORE_POOL_SIZE) if config.STORE_ENABLED else None
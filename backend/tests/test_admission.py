@@ -0,0 +1,41 @@
+# test_admission.py
+import asyncio
+from admission import FairScheduler
+
+
+def test_calls_up_to_the_slots_run_at_once():
+    async def run():
+        scheduler = FairScheduler(slots=2)
+        await scheduler.acquire("a", 1)
+        await scheduler.acquire("b", 1)
+        third = asyncio.ensure_future(scheduler.acquire("c", 1))
+        await asyncio.sleep(0)
+        assert not third.done()
+        scheduler.release()
+        await asyncio.sleep(0)
+        assert third.done()
+        scheduler.release()
+        scheduler.release()
+        assert scheduler.idle()
+    asyncio.run(run())
+
+
+def test_waiting_calls_go_in_weighted_fair_order():
+    async def run():
+        scheduler = FairScheduler(slots=1)
+        await scheduler.acquire("busy", 1)
+        order = []
+
+        async def call(client, cost):
+            await scheduler.acquire(client, cost)
+            order.append(client)
+
+        # the heavy client queued first, but its large slice finishes later
+        waiting = [asyncio.ensure_future(call("heavy", 10)), asyncio.ensure_future(call("light", 1))]
+        await asyncio.sleep(0)
+        for _ in range(3):
+            scheduler.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*waiting)
+        assert order == ["light", "heavy"]
+    asyncio.run(run())
@@ -0,0 +1,24 @@
+# test_deadlines.py
+import pytest
+import config
+from deadlines import Deadline, seconds_for
+
+
+@pytest.fixture(autouse=True)
+def limit(monkeypatch):
+    monkeypatch.setattr(config, "REQUEST_DEADLINE_SECONDS", 120)
+
+
+def test_client_can_ask_for_less():
+    assert seconds_for({"X-Deadline-Ms": "5000"}) == 5
+
+
+def test_client_cannot_ask_for_more():
+    assert seconds_for({"X-Deadline-Ms": "600000"}) == 120
+
+
+@pytest.mark.parametrize("value", ["0", "-5", "nan", "inf", "-inf", "soon", ""])
+def test_invalid_header_keeps_the_server_limit(value):
+    seconds = seconds_for({"X-Deadline-Ms": value})
+    assert seconds == 120
+    assert Deadline(seconds).expires is not None
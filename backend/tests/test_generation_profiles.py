@@ -0,0 +1,48 @@
+# test_generation_profiles.py
+import pytest
+from generation_profiles import NumberStop, QuestionStop
+
+stop = QuestionStop()
+
+
+def test_question_ends_at_first_question_mark():
+    text = "What does chlorophyll absorb? It absorbs"
+    assert stop.end(text) == len("What does chlorophyll absorb?")
+    assert stop.trim(text) == "What does chlorophyll absorb?"
+
+
+def test_preamble_line_is_skipped():
+    text = "Here is a question:\nWhat does chlorophyll absorb?\n"
+    assert stop.end("Here is a question:\n") is None
+    assert stop.trim(text) == "What does chlorophyll absorb?"
+
+
+def test_unfinished_question_keeps_the_question_line():
+    assert stop.trim("Here is a question:\nWhat does chlorophyll absorb") == "What does chlorophyll absorb"
+    assert stop.trim("  What does chlorophyll absorb\nExplain why") == "What does chlorophyll absorb"
+
+
+score = NumberStop()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("4", "4"),
+    ("3.5 because", "3.5"),
+    ("Score: 2.", "2"),
+    ("0-5: 4 ", "4"),
+    ("**3**", "3"),
+    ("4/5", "4"),
+    ("10 is too generous, 4", "4"),
+    ("no score", "no score"),
+])
+def test_score_is_the_first_standalone_number(text, expected):
+    assert score.trim(text) == expected
+
+
+def test_score_generation_waits_for_a_complete_score():
+    assert score.end("0") is None
+    assert score.end("0-") is None
+    assert score.end("0-5: 4") is None
+    assert score.end("0-5: 4 ") == len("0-5: 4")
+    assert score.end("**3*") == len("**3")
+    assert score.end("3.") is None
@@ -0,0 +1,46 @@
+# test_library.py
+import pytest
+
+for module in ("PyPDF2", "langchain", "sentence_transformers", "transformers"):
+    pytest.importorskip(module)
+
+import config
+from library import Library, DocumentShard
+
+
+def shard(document_id):
+    return DocumentShard(document_id, f"{document_id}.pdf", None, [], None, None)
+
+
+@pytest.fixture
+def library():
+    library = Library()
+    library.add(shard("mine"))
+    library.add_to_session("session", library.documents["mine"])
+    # uploaded later by another client, so it is the latest document
+    library.add(shard("theirs"))
+    return library
+
+
+def test_session_selects_its_documents(library):
+    assert [s.document_id for s in library.select(session_id="session")] == ["mine"]
+    assert [s.document_id for s in library.select(session_id="unknown")] == ["theirs"]
+
+
+def test_emptied_session_selects_nothing(library):
+    assert library.remove_from_session("session", "mine")
+    assert library.select(session_id="session") == []
+
+
+def test_generating_after_removing_the_last_document_uses_placeholders(library, monkeypatch):
+    monkeypatch.setattr(config, "LLM_BACKEND", "stub")
+    import processor_flan
+    monkeypatch.setattr(processor_flan, "library", library)
+    fallbacks = []
+    monkeypatch.setattr(processor_flan, "record_fallback", lambda stage, reason, *args: fallbacks.append(reason))
+    library.remove_from_session("session", "mine")
+    document_ids = [s.document_id for s in library.select(session_id="session")]
+    questions = processor_flan.generate_questions(3, document_ids)
+    assert fallbacks == ["no_document"]
+    assert len(questions) == 3
+    assert all("document_id" not in q for q in questions)
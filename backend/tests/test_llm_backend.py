@@ -0,0 +1,37 @@
+# test_llm_backend.py
+import pytest
+from llm_backend import LocalPipelineBackend, StubBackend, StubTokenizer
+
+# the shape of processor_llama's question prompts, PROMPT_HEAD included
+PROMPT = (
+    "Consider the following excerpt, which is surrounded by lines of \"###\":\n###\n"
+    "{text}\n###\nGenerate a definition question. Do not print anything else."
+)
+
+
+def test_stub_questions_follow_the_excerpt():
+    backend = StubBackend(0, 0, seed=0)
+    photosynthesis = backend.complete(PROMPT.format(text="Chlorophyll absorbs sunlight inside chloroplasts."), task="question")
+    revolution = backend.complete(PROMPT.format(text="Parliament abolished feudalism during the revolution."), task="question")
+    assert photosynthesis != revolution
+    assert "concept" not in photosynthesis and "concept" not in revolution
+
+
+def pipeline_backend(nested):
+    # a LocalPipelineBackend around a fake pipeline, without loading transformers
+    def pipe(prompts, **generation):
+        outputs = [{"generated_text": f"reply to {prompt}"} for prompt in prompts]
+        return [[output] for output in outputs] if nested else outputs
+    backend = LocalPipelineBackend.__new__(LocalPipelineBackend)
+    backend.pipe = pipe
+    backend.tokenizer = StubTokenizer()
+    backend.prefix_cache = None
+    backend.assistant_model = None
+    backend.seq2seq = True
+    return backend
+
+
+@pytest.mark.parametrize("nested", [True, False], ids=["text-generation", "text2text-generation"])
+def test_batched_pipeline_output_shapes(nested):
+    replies = pipeline_backend(nested)._generate(["a", "b"], "question", {}, chat=False)
+    assert replies == ["reply to a", "reply to b"]
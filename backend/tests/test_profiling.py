@@ -0,0 +1,24 @@
+# test_profiling.py
+import pytest
+import config
+from profiling import Profiler
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    monkeypatch.setattr(config, "PROFILING_ENABLED", True)
+    profiler = Profiler()
+    profiler.arm("cprofile", 1)
+    return profiler
+
+
+def test_scrapes_and_admin_calls_do_not_use_up_armed_profiles(profiler):
+    assert profiler.select("/metrics", {}) is None
+    assert profiler.select("/admin/profile", {}) is None
+    assert profiler.select("/generateQuestions", {}) == "cprofile"
+    assert profiler.select("/generateQuestions", {}) is None
+
+
+def test_excluded_endpoint_can_still_be_armed_by_name(profiler):
+    profiler.arm("cprofile", 1, "/metrics")
+    assert profiler.select("/metrics", {}) == "cprofile"
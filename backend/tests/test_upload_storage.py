@@ -0,0 +1,43 @@
+# test_upload_storage.py
+import threading
+import pytest
+
+pytest.importorskip("zstandard")
+
+from upload_storage import StorageFull, UploadStorage
+
+
+def test_stored_document_is_not_charged_again(tmp_path):
+    storage = UploadStorage(str(tmp_path), quota_bytes=100)
+    assert storage.reserve("doc", "a.pdf", 80)
+    assert not storage.reserve("doc", "a.pdf", 80)
+    assert storage.used_bytes() == 80
+
+
+def test_reservation_that_does_not_fit_is_refused(tmp_path):
+    storage = UploadStorage(str(tmp_path), quota_bytes=100)
+    storage.reserve("first", "a.pdf", 80)
+    with pytest.raises(StorageFull):
+        storage.reserve("second", "b.pdf", 30)
+    storage.release("first")
+    assert storage.reserve("second", "b.pdf", 30)
+
+
+def test_concurrent_reservations_stay_within_the_quota(tmp_path):
+    # two instances on one index, as with several server processes
+    storages = [UploadStorage(str(tmp_path), quota_bytes=100) for _ in range(2)]
+    refused = []
+
+    def upload(i):
+        try:
+            storages[i % 2].reserve(f"doc{i}", f"{i}.pdf", 30)
+        except StorageFull:
+            refused.append(i)
+
+    threads = [threading.Thread(target=upload, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(refused) == 5
+    assert storages[0].used_bytes() == 90
@@ -0,0 +1,19 @@
+# test_vector_index.py
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("langchain_community")
+
+from vector_index import build_index, vector_nbytes
+
+
+@pytest.mark.parametrize("index_type, storage, bytes_per_vector", [
+    ("flat", "float32", 4 * 32),
+    ("flat", "fp16", 2 * 32),
+    ("hnsw", "sq8", 32),
+])
+def test_vector_bytes_follow_the_storage(index_type, storage, bytes_per_vector):
+    vectors = np.random.default_rng(0).standard_normal((300, 32)).astype(np.float32)
+    index, _, _ = build_index(vectors, index_type=index_type, storage=storage)
+    assert vector_nbytes(index) == 300 * bytes_per_vector
@@ -0,0 +1,75 @@
+# text_cleaning.py
+import re
+from collections import Counter as Tally
+import numpy as np
+from prometheus_client import Counter
+import config
+
+LINES_REMOVED = Counter("quizmaker_cleaning_lines_removed_total", "PDF text lines removed before chunking", ["reason"])
+CHUNKS_REMOVED = Counter("quizmaker_cleaning_chunks_removed_total", "Chunks dropped as low-information before embedding")
+
+PAGE_NUMBER = re.compile(r"^(page\s*)?(\d{1,4}|[ivx]{1,5})(\s*(of|/)\s*\d+)?$", re.IGNORECASE)
+# "Chapter 2 ........ 14"
+TOC_ENTRY = re.compile(r"(\.\s*){4,}\d+$")
+CITATION = re.compile(r"\b(19|20)\d{2}[a-z]?\b|et al\.|doi|https?://|\bpp\.|\bvol\.", re.IGNORECASE)
+
+
+def _line_key(line):
+    # page numbers inside running headers ("Chapter 2 - 14") differ from page to page
+    return re.sub(r"\d+", "#", line.strip().lower())
+
+
+def clean_pages(pages):
+    """Joins page texts after removing running headers/footers, page numbers and
+    table-of-contents lines. Returns (text, removed line counts by reason)."""
+    removed = Tally()
+    page_lines = [page.splitlines() for page in pages]
+    # a line is boilerplate when it shows up on many pages
+    seen = Tally()
+    for lines in page_lines:
+        seen.update({_line_key(line) for line in lines if line.strip()})
+    min_pages = max(config.CLEANING_MIN_REPEAT_PAGES, int(config.CLEANING_REPEAT_FRACTION * len(pages)))
+    repeated = {key for key, count in seen.items() if count >= min_pages} if len(pages) >= config.CLEANING_MIN_REPEAT_PAGES else set()
+
+    kept_pages = []
+    for lines in page_lines:
+        kept = []
+        for line in lines:
+            stripped = line.strip()
+            if not stripped:
+                kept.append(line)
+            elif _line_key(line) in repeated:
+                removed["repeated"] += 1
+            elif PAGE_NUMBER.match(stripped):
+                removed["page_number"] += 1
+            elif TOC_ENTRY.search(stripped):
+                removed["toc"] += 1
+            else:
+                kept.append(line)
+        kept_pages.append("\n".join(kept).strip())
+    for reason, count in removed.items():
+        LINES_REMOVED.labels(reason).inc(count)
+    # pages used to be joined with no separator, gluing the last and first words together
+    return "\n\n".join(page for page in kept_pages if page), dict(removed)
+
+
+def information_score(text) -> float:
+    """0..1: share of letters, vocabulary variety and prose-like words, lowered for
+    citation-heavy text such as reference lists."""
+    words = re.findall(r"[A-Za-z]{2,}", text)
+    if len(words) < config.CLEANING_MIN_CHUNK_WORDS:
+        return 0.0
+    letters = sum(c.isalpha() for c in text) / max(1, sum(not c.isspace() for c in text))
+    variety = len({w.lower() for w in words}) / len(words)
+    # tables and indexes are mostly short tokens and numbers
+    prose = sum(len(w) > 3 for w in words) / len(words)
+    citations = len(CITATION.findall(text)) / len(words)
+    return float(letters * min(1.0, variety * 2) * min(1.0, prose * 1.5) * max(0.0, 1 - 5 * citations))
+
+
+def score_chunks(chunks):
+    """Keep mask and sampling weights for the chunks."""
+    scores = np.array([information_score(chunk) for chunk in chunks], dtype=np.float32)
+    keep = scores >= config.CLEANING_MIN_CHUNK_SCORE
+    CHUNKS_REMOVED.inc(int((~keep).sum()))
+    return keep, scores
@@ -0,0 +1,308 @@
+# upload_storage.py
+import asyncio, io, json, os, shutil, threading, time, uuid
+import numpy as np
+import zstandard
+from starlette.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, select, delete, func
+from sqlalchemy.dialects.sqlite import insert
+import config
+from sqlite_engine import create_sqlite_engine
+
+STORAGE_BYTES = Gauge("quizmaker_storage_bytes", "Bytes of stored uploads on disk", ["kind"])
+STORAGE_DOCUMENTS = Gauge("quizmaker_storage_documents", "Uploads in the storage index")
+STORAGE_COMPRESSION = Gauge("quizmaker_storage_compression_ratio", "Uncompressed / compressed bytes of stored artifacts")
+STORAGE_REMOVED = Counter("quizmaker_storage_removed_total", "Stored uploads deleted", ["reason"])
+ARTIFACT_REUSE = Counter("quizmaker_storage_artifact_reuse_total", "Uploads ingested from stored artifacts instead of re-embedding")
+
+KINDS = ("pdf", "text", "chunks")
+ARRAYS = ("starts", "ends", "token_values", "token_offsets", "vectors", "weights")
+# temporary files of uploads that never finished ingesting
+TEMP_MAX_AGE_SECONDS = 3600
+
+metadata = MetaData()
+
+uploads = Table(
+    "uploads", metadata,
+    Column("document_id", String, primary_key=True),
+    Column("filename", String),
+    Column("pdf_bytes", Integer, nullable=False),
+    Column("text_bytes", Integer, nullable=False),
+    Column("chunks_bytes", Integer, nullable=False),
+    # artifact bytes before compression
+    Column("raw_bytes", Integer, nullable=False),
+    # what the chunk artifacts were made with; reused only when both still match
+    Column("tokenizer", String),
+    Column("embedding_model", String),
+    Column("cleaning", Text),
+    Column("created_at", Float, nullable=False),
+    Column("last_access", Float, nullable=False, index=True),
+)
+
+
+class StorageFull(Exception):
+    pass
+
+
+class UploadStorage:
+    """Uploaded PDFs and their ingest artifacts under root/<id[:2]>/<document id>/, indexed in SQLite.
+
+    The extracted text and the chunk arrays (spans, prompt token ids,
+    half-precision vectors, weights) are zstd-compressed, so a document
+    uploaded again is loaded instead of re-embedded. Uploads not accessed for
+    ttl_seconds, then the least recently accessed beyond quota_bytes, are
+    deleted by collect(); 0 turns either limit off.
+    """
+
+    def __init__(self, root, quota_bytes=0, ttl_seconds=0, level=9, keep_pdf=True):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.ttl_seconds = ttl_seconds
+        self.keep_pdf = keep_pdf
+        self.level = level
+        self.temp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.temp_dir, exist_ok=True)
+        self.engine = create_sqlite_engine(os.path.join(root, "index.db"))
+        metadata.create_all(self.engine)
+        # uploads and collection both change files and totals
+        self._lock = threading.Lock()
+        self._update_metrics()
+
+    def _directory(self, document_id):
+        return os.path.join(self.root, document_id[:2], document_id)
+
+    def temp_path(self, extension=""):
+        return os.path.join(self.temp_dir, f"{uuid.uuid4()}{extension}")
+
+    def used_bytes(self):
+        with self.engine.connect() as conn:
+            return _used_bytes(conn)
+
+    def reserve(self, document_id, filename, nbytes):
+        """Charges an upload of nbytes to the quota before it is ingested, evicting old
+        uploads to make room; StorageFull if it cannot fit. A document that is
+        already stored is not charged again.
+
+        The reservation is a row without a tokenizer, written and checked against
+        the quota in one transaction: its insert takes SQLite's write lock, so
+        concurrent uploads (in any process) are checked one after another.
+        save() replaces it, release() drops it when ingest fails.
+        """
+        for attempt in range(2):
+            try:
+                with self._lock, self.engine.begin() as conn:
+                    if conn.execute(select(uploads.c.document_id).where(uploads.c.document_id == document_id)).first():
+                        return False
+                    now = time.time()
+                    conn.execute(insert(uploads).values(
+                        document_id=document_id, filename=filename, pdf_bytes=nbytes, text_bytes=0, chunks_bytes=0,
+                        raw_bytes=0, created_at=now, last_access=now,
+                    ))
+                    if self.quota_bytes and _used_bytes(conn) > self.quota_bytes:
+                        raise StorageFull(f"Upload storage quota of {self.quota_bytes} bytes is exhausted")
+                return True
+            except StorageFull:
+                # rolled back; evict outside the transaction, then try once more
+                if attempt:
+                    raise
+                self.collect(incoming=nbytes)
+
+    def release(self, document_id):
+        with self._lock, self.engine.begin() as conn:
+            conn.execute(delete(uploads).where(uploads.c.document_id == document_id, uploads.c.tokenizer.is_(None)))
+
+    def save(self, document_id, filename, upload_path, text, arrays, tokenizer, embedding_model, cleaning):
+        """Moves the uploaded file in and writes the compressed artifacts; returns the stored PDF path (or None)."""
+        directory = self._directory(document_id)
+        os.makedirs(directory, exist_ok=True)
+        compressor = zstandard.ZstdCompressor(level=self.level)
+        raw_text = text.encode("utf-8")
+        buffer = io.BytesIO()
+        np.savez(buffer, **{name: arrays[name] for name in ARRAYS})
+        raw_chunks = buffer.getvalue()
+        sizes = {
+            "text": _write(os.path.join(directory, "text.zst"), compressor.compress(raw_text)),
+            "chunks": _write(os.path.join(directory, "chunks.zst"), compressor.compress(raw_chunks)),
+            "pdf": 0,
+        }
+        pdf_path = None
+        if self.keep_pdf:
+            pdf_path = os.path.join(directory, "source.pdf")
+            os.replace(upload_path, pdf_path)
+            sizes["pdf"] = os.path.getsize(pdf_path)
+        elif os.path.exists(upload_path):
+            os.remove(upload_path)
+        now = time.time()
+        row = {
+            "document_id": document_id,
+            "filename": filename,
+            "pdf_bytes": sizes["pdf"],
+            "text_bytes": sizes["text"],
+            "chunks_bytes": sizes["chunks"],
+            "raw_bytes": len(raw_text) + len(raw_chunks),
+            "tokenizer": tokenizer,
+            "embedding_model": embedding_model,
+            "cleaning": json.dumps(cleaning),
+            "created_at": now,
+            "last_access": now,
+        }
+        statement = insert(uploads).values(row)
+        statement = statement.on_conflict_do_update(
+            index_elements=[uploads.c.document_id],
+            set_={key: value for key, value in row.items() if key not in ("document_id", "created_at")},
+        )
+        with self._lock, self.engine.begin() as conn:
+            conn.execute(statement)
+        self._update_metrics()
+        return pdf_path
+
+    def load(self, document_id, tokenizer, embedding_model):
+        """(text, arrays, cleaning, pdf path) of a stored upload made with the same models, or None."""
+        with self.engine.connect() as conn:
+            row = conn.execute(select(uploads).where(uploads.c.document_id == document_id)).mappings().first()
+        if row is None or row["tokenizer"] != tokenizer or row["embedding_model"] != embedding_model:
+            return None
+        directory = self._directory(document_id)
+        decompressor = zstandard.ZstdDecompressor()
+        try:
+            with open(os.path.join(directory, "text.zst"), "rb") as f:
+                text = decompressor.decompress(f.read()).decode("utf-8")
+            with open(os.path.join(directory, "chunks.zst"), "rb") as f:
+                with np.load(io.BytesIO(decompressor.decompress(f.read()))) as npz:
+                    arrays = {name: npz[name] for name in ARRAYS}
+        except (OSError, ValueError, zstandard.ZstdError) as e:
+            print(f"Stored artifacts of {document_id} are unreadable, ingesting again: {e}")
+            return None
+        self.touch(document_id)
+        pdf_path = os.path.join(directory, "source.pdf")
+        return text, arrays, json.loads(row["cleaning"] or "{}"), (pdf_path if os.path.exists(pdf_path) else None)
+
+    def touch(self, document_id):
+        with self.engine.begin() as conn:
+            conn.execute(uploads.update().where(uploads.c.document_id == document_id).values(last_access=time.time()))
+
+    def delete(self, document_id, reason="deleted"):
+        with self._lock:
+            with self.engine.begin() as conn:
+                removed = conn.execute(delete(uploads).where(uploads.c.document_id == document_id)).rowcount
+            directory = self._directory(document_id)
+            shutil.rmtree(directory, ignore_errors=True)
+            try:
+                os.rmdir(os.path.dirname(directory))
+            except OSError:
+                pass  # other documents share the prefix directory
+        if removed:
+            STORAGE_REMOVED.labels(reason).inc()
+            self._update_metrics()
+        return bool(removed)
+
+    def collect(self, incoming=0):
+        """Deletes expired uploads, then the least recently accessed until incoming more bytes fit the quota."""
+        removed = {"ttl": 0, "quota": 0, "temp": 0}
+        now = time.time()
+        if self.ttl_seconds:
+            with self.engine.connect() as conn:
+                expired = conn.execute(
+                    select(uploads.c.document_id).where(uploads.c.last_access < now - self.ttl_seconds)
+                ).scalars().all()
+            for document_id in expired:
+                removed["ttl"] += self.delete(document_id, "ttl")
+        if self.quota_bytes:
+            size = uploads.c.pdf_bytes + uploads.c.text_bytes + uploads.c.chunks_bytes
+            excess = self.used_bytes() + incoming - self.quota_bytes
+            if excess > 0:
+                with self.engine.connect() as conn:
+                    # reservations of uploads still ingesting are not evicted
+                    oldest = conn.execute(
+                        select(uploads.c.document_id, size).where(uploads.c.tokenizer.is_not(None)).order_by(uploads.c.last_access)
+                    ).all()
+                for document_id, nbytes in oldest:
+                    if excess <= 0:
+                        break
+                    if self.delete(document_id, "quota"):
+                        removed["quota"] += 1
+                        excess -= nbytes
+        removed["temp"] = self._sweep(now)
+        if any(removed.values()):
+            print(f"Upload storage collection removed {removed}")
+        return removed
+
+    def _sweep(self, now):
+        # abandoned temporary files, and files left in the root by versions without an index
+        count = 0
+        stale = [(path, TEMP_MAX_AGE_SECONDS) for path in _files(self.temp_dir)]
+        if self.ttl_seconds:
+            stale += [(path, self.ttl_seconds) for path in _files(self.root) if not path.endswith(("index.db", "-wal", "-shm"))]
+        for path, max_age in stale:
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.remove(path)
+                    count += 1
+            except OSError:
+                pass
+        return count
+
+    def report(self):
+        with self.engine.connect() as conn:
+            totals = conn.execute(select(
+                func.count(), func.coalesce(func.sum(uploads.c.pdf_bytes), 0), func.coalesce(func.sum(uploads.c.text_bytes), 0),
+                func.coalesce(func.sum(uploads.c.chunks_bytes), 0), func.coalesce(func.sum(uploads.c.raw_bytes), 0),
+            )).one()
+        documents, pdf, text, chunks, raw = totals
+        return {
+            "documents": documents,
+            "bytes": {"pdf": pdf, "text": text, "chunks": chunks, "total": pdf + text + chunks},
+            "compressionRatio": raw / (text + chunks) if text + chunks else None,
+            "quotaBytes": self.quota_bytes or None,
+            "ttlSeconds": self.ttl_seconds or None,
+        }
+
+    def _update_metrics(self):
+        report = self.report()
+        STORAGE_DOCUMENTS.set(report["documents"])
+        for kind in KINDS:
+            STORAGE_BYTES.labels(kind).set(report["bytes"][kind])
+        if report["compressionRatio"] is not None:
+            STORAGE_COMPRESSION.set(report["compressionRatio"])
+
+    def close(self):
+        self.engine.dispose()
+
+
+async def run_collector(storage, interval_seconds):
+    while True:
+        try:
+            await run_in_threadpool(storage.collect)
+        except Exception as e:
+            print(f"Upload storage collection failed: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+def _write(path, data):
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, path)
+    return len(data)
+
+
+def _files(directory):
+    try:
+        return [entry.path for entry in os.scandir(directory) if entry.is_file()]
+    except FileNotFoundError:
+        return []
+
+
+
+def _used_bytes(conn):
+    return conn.execute(select(func.coalesce(
+        func.sum(uploads.c.pdf_bytes + uploads.c.text_bytes + uploads.c.chunks_bytes), 0
+    ))).scalar()
+
+storage = UploadStorage(
+    config.UPLOAD_DIR,
+    quota_bytes=config.UPLOAD_QUOTA_MB * 1024 * 1024,
+    ttl_seconds=config.UPLOAD_TTL_DAYS * 86400,
+    level=config.UPLOAD_ZSTD_LEVEL,
+    keep_pdf=config.UPLOAD_KEEP_PDF,
+)
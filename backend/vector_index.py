@@ -0,0 +1,171 @@
+# vector_index.py
+import math
+import numpy as np
+import faiss
+from langchain_community.vectorstores import FAISS
+from prometheus_client import Gauge
+from chunk_store import ChunkDocstore
+import config
+
+INDEX_RECALL = Gauge("quizmaker_vector_index_recall", "Recall@k measured against exact search when the index was built", ["type"])
+INDEX_VECTORS = Gauge("quizmaker_vector_index_vectors", "Vectors in the last built index", ["type"])
+
+HNSW_EF_SEARCH = (16, 32, 64, 128, 256, 512)
+IVF_NPROBE = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+REFINE_K_FACTOR = (8, 16, 32, 64)
+
+# VECTOR_STORAGE -> faiss scalar quantizer for stored vectors (None keeps float32)
+SCALAR_QUANTIZERS = {
+    "float32": None,
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+def choose_index_type(n_vectors: int) -> str:
+    if config.VECTOR_INDEX_TYPE != "auto":
+        return config.VECTOR_INDEX_TYPE
+    if n_vectors <= config.VECTOR_INDEX_FLAT_MAX:
+        return "flat"
+    if n_vectors <= config.VECTOR_INDEX_HNSW_MAX:
+        return "hnsw"
+    return "ivfpq"
+
+
+def _recall(index, queries, truth, k):
+    _, found = index.search(queries, k)
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def _tune_queries(vectors, k):
+    # midpoints of random pairs of document vectors stand in for queries (a vector
+    # itself would trivially find its own entry); exact search gives the ground truth
+    rng = np.random.default_rng(0)
+    count = min(config.VECTOR_INDEX_TUNE_QUERIES, len(vectors))
+    queries = (vectors[rng.integers(0, len(vectors), count)] + vectors[rng.integers(0, len(vectors), count)]) / 2
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+    return queries, truth
+
+
+def _tune(index, vectors, k, recall_target, set_param, values):
+    queries, truth = _tune_queries(vectors, k)
+    recall = 0.0
+    for value in values:
+        set_param(value)
+        recall = _recall(index, queries, truth, k)
+        if recall >= recall_target:
+            break
+    return value, recall
+
+
+def build_index(vectors, index_type=None, recall_target=None, storage=None):
+    """Builds a faiss index for the vectors and tunes its search parameters to the recall target.
+
+    storage is "float32", "fp16" or "sq8" (8-bit scalar quantization) for the
+    vectors kept in the index. Returns (index, index_type, recall) where recall
+    is measured at build time against exact float32 search.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    index_type = index_type or choose_index_type(n)
+    recall_target = recall_target or config.VECTOR_INDEX_RECALL_TARGET
+    qtype = SCALAR_QUANTIZERS[storage or config.VECTOR_STORAGE]
+    k = min(config.VECTOR_INDEX_RECALL_K, n)
+
+    if index_type == "flat":
+        if qtype is None:
+            index = faiss.IndexFlatL2(dim)
+            index.add(vectors)
+            return index, index_type, 1.0
+        index = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_L2)
+        index.train(vectors)
+        index.add(vectors)
+        queries, truth = _tune_queries(vectors, k)
+        return index, index_type, _recall(index, queries, truth, k)
+
+    if index_type == "hnsw":
+        if qtype is None:
+            index = faiss.IndexHNSWFlat(dim, config.VECTOR_INDEX_HNSW_M)
+        else:
+            index = faiss.IndexHNSWSQ(dim, qtype, config.VECTOR_INDEX_HNSW_M)
+            index.train(vectors)
+        index.hnsw.efConstruction = config.VECTOR_INDEX_HNSW_EF_CONSTRUCTION
+        index.add(vectors)
+        def set_ef(value):
+            index.hnsw.efSearch = max(value, k)
+        _, recall = _tune(index, vectors, k, recall_target, set_ef, HNSW_EF_SEARCH)
+        return index, index_type, recall
+
+    if index_type == "ivfpq":
+        nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+        # sub-quantizers must divide the dimension; 8-bit codes need ~10k training points
+        m = next(m for m in range(min(config.VECTOR_INDEX_PQ_M, dim), 0, -1) if dim % m == 0)
+        nbits = 8 if n >= 256 * 39 else 4
+        quantizer = faiss.IndexFlatL2(dim)
+        ivf = faiss.IndexIVFPQ(quantizer, dim, nlist, m, nbits)
+        ivf.train(vectors)
+        index = ivf
+        if config.VECTOR_INDEX_PQ_REFINE:
+            # PQ distances alone cap recall; re-rank k_factor * k candidates with stored vectors
+            if qtype is None:
+                index = faiss.IndexRefineFlat(ivf)
+            else:
+                refine = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_L2)
+                refine.train(vectors)
+                index = faiss.IndexRefine(ivf, refine)
+            index.k_factor = config.VECTOR_INDEX_PQ_REFINE_K_FACTOR
+        index.add(vectors)
+        nprobes = [p for p in IVF_NPROBE if p < nlist] + [nlist]
+        settings = [(p, config.VECTOR_INDEX_PQ_REFINE_K_FACTOR) for p in nprobes]
+        if config.VECTOR_INDEX_PQ_REFINE:
+            # once every list is probed only a larger re-ranking pool can raise recall
+            settings += [(nprobes[-1], f) for f in REFINE_K_FACTOR if f > config.VECTOR_INDEX_PQ_REFINE_K_FACTOR]
+        def set_search(value):
+            ivf.nprobe, k_factor = value
+            if config.VECTOR_INDEX_PQ_REFINE:
+                index.k_factor = k_factor
+        _, recall = _tune(index, vectors, k, recall_target, set_search, settings)
+        return index, index_type, recall
+
+    raise ValueError(f"Unknown vector index type: {index_type}")
+
+
+def build_vectorstore(texts, vectors, embeddings, metadatas=None, ids=None):
+    """Same result as FAISS.from_embeddings, but on the index type picked for the document size.
+
+    The docstore refers to texts (e.g. a ChunkText) by each metadata's chunk_id
+    instead of copying the strings.
+    """
+    index, index_type, recall = build_index(vectors)
+    INDEX_RECALL.labels(index_type).set(recall)
+    INDEX_VECTORS.labels(index_type).set(len(texts))
+    metadatas = metadatas or [{"chunk_id": i} for i in range(len(texts))]
+    ids = ids or [str(i) for i in range(len(texts))]
+    docstore = ChunkDocstore()
+    docstore.add_chunks(ids, texts, metadatas)
+    print(f"Built {index_type} vector index over {len(texts)} chunks ({config.VECTOR_STORAGE}, recall@{config.VECTOR_INDEX_RECALL_K} {recall:.3f})")
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
+
+
+def index_nbytes(index) -> int:
+    return faiss.serialize_index(index).nbytes
+
+
+def vector_nbytes(index) -> int:
+    """Bytes of the vector codes an index stores: ntotal times the bytes per vector."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexRefine):
+        return vector_nbytes(index.base_index) + vector_nbytes(index.refine_index)
+    if isinstance(index, faiss.IndexHNSW):
+        return vector_nbytes(index.storage)
+    if isinstance(index, faiss.IndexIVF):
+        return index.ntotal * index.code_size
+    return index.ntotal * index.sa_code_size()
@@ -1,7 +1,11 @@
 import axios, { AxiosInstance } from "axios";
 
+const sessionId: string = sessionStorage.getItem("sessionId") ?? crypto.randomUUID();
+sessionStorage.setItem("sessionId", sessionId);
+
 const api: AxiosInstance = axios.create({
-    baseURL: "http://localhost:8000"
+    baseURL: "http://localhost:8000",
+    headers: { "X-Session-Id": sessionId }
 });
 
 export default api;
\ No newline at end of file